@@ -1,38 +1,132 @@
-from flask import Flask, request, jsonify
-from google import genai
+from flask import Flask, Blueprint, current_app, request, jsonify, g, stream_with_context
 import os
 import json
 import logging
 import time
-from decimal import Decimal, ROUND_HALF_UP, getcontext
+import asyncio
+import random
+import concurrent.futures
+import argparse
+import contextlib
+import csv
+import io
+import mmap
+import multiprocessing
+import shutil
+import math
+import hashlib
+import threading
+import bisect
+import hmac
+import re
+import sys
+import uuid
+import sqlite3
+from collections import Counter, OrderedDict, deque
+from dataclasses import dataclass, field, fields
+from decimal import Context, Decimal, localcontext
+from typing import Optional
 
-getcontext().prec = 28
+try:
+    import fcntl
+except ImportError:  # sem flock (Windows): a trava entre processos dos jobs fica desligada
+    fcntl = None
 
-API_KEY = os.environ.get("CHAVE_API_GEMINI") or os.environ.get("chaveApiGemini")
-DEFAULT_CBS_RATE = Decimal(os.environ.get("DEFAULT_CBS_RATE", "0.12"))  # 12%
-DEFAULT_IBS_RATE = Decimal(os.environ.get("DEFAULT_IBS_RATE", "0.14"))  # 14%
-DEFAULT_CPP_RATE = Decimal(os.environ.get("DEFAULT_CPP_RATE", "0.20"))  # 20% sobre folha (exemplo)
-SIMPLIFIED_SIMPLES_SHARE = Decimal(os.environ.get("SIMPLIFIED_SIMPLES_SHARE", "0.70"))  # % de CBS/IBS considerado "dentro do DAS"
+try:
+    import numpy as np
+except ImportError:  # motor vetorial (/chat/batch?engine=vetorial) é opcional
+    np = None
+
+try:
+    import orjson
+except ImportError:  # parse e serialização JSON mais rápidos são opcionais; sem orjson, o módulo json
+    orjson = None
+
+@dataclass(frozen=True)
+class Config:
+    # Configuração lida do ambiente uma única vez (Config.do_ambiente) e imutável depois disso.
+    api_key: Optional[str] = field(default=None, repr=False)
+    default_cbs_rate: Decimal = Decimal("0.12")  # 12%
+    default_ibs_rate: Decimal = Decimal("0.14")  # 14%
+    default_cpp_rate: Decimal = Decimal("0.20")  # 20% sobre folha (exemplo)
+    simplified_simples_share: Decimal = Decimal("0.70")  # % de CBS/IBS considerado "dentro do DAS"
+    batch_max_itens: int = 50000  # limite de empresas por chamada em /chat/batch
+    sweep_max_pontos: int = 1000000  # limite de pontos da grade em /chat/sweep
+    sweep_stream_pontos: int = 50000  # acima disso a grade é devolvida em NDJSON
+    horizonte_max_anos: int = 30  # anos por chamada em /chat/horizon
+    cache_max_entries: int = 4096  # respostas do /chat mantidas em memória (0 desliga)
+    cache_ttl_seconds: float = 900
+    forecast_min_meses: int = 3  # histórico mínimo para ajustar o crescimento
+    forecast_min_sazonal: int = 24  # histórico mínimo para estimar sazonalidade
+    forecast_max_crescimento: float = 0.05  # teto do crescimento mensal ajustado (5%)
+    forecast_amortecimento: float = 0.9  # fator por mês da tendência depois do último mês do histórico (1 = sem amortecer)
+    forecast_cache_max_entries: int = 65536
+    gemini_model: str = "gemini-2.5-flash"
+    gemini_base_url: Optional[str] = None  # ex.: stub local (tools/gemini_stub.py)
+    ai_max_concorrencia: int = 8  # chamadas simultâneas ao modelo por processo
+    ai_timeout_seconds: float = 20  # por chamada
+    ai_tentativas: int = 3
+    ai_backoff_seconds: float = 0.5
+    ai_prazo_seconds: float = 30  # espera total antes de cair no cálculo do backend
+    ai_cache_max_entries: int = 1024
+    ai_cache_ttl_seconds: float = 3600
+    ai_prompt_cache_ttl_seconds: float = 3600
+    profile_token: Optional[str] = field(default=None, repr=False)  # habilita o profiler por requisição (header X-Profile)
+    profile_intervalo_ms: float = 5  # intervalo entre amostras da pilha
+    profile_max_guardados: int = 32  # perfis mantidos para consulta
+    historico_db: str = "historico.sqlite3"  # SQLite do histórico por empresa ("" desliga)
+    historico_max_meses: int = 100000  # meses por chamada em /historico
+    max_corpo_bytes: int = 1048576  # corpo de /chat, /chat/sweep, /chat/horizon e cada linha de NDJSON (acima disso, 413)
+    max_corpo_lote_bytes: int = 67108864  # corpo de /chat/batch e /historico
+    max_meses_entrada: int = 1200  # meses por lista (targetYearMonthly, historicalMonthly) de uma empresa
+    jobs_dir: str = "jobs"  # entradas, resultados e progresso dos jobs (/jobs)
+    jobs_processos: int = 0  # processos do pool (0 = núcleos da máquina)
+    jobs_bloco_empresas: int = 500  # empresas por bloco de trabalho
+    jobs_em_voo: int = 0  # blocos enviados ao pool ao mesmo tempo (0 = 2 x processos)
+    jobs_tentativas: int = 3  # tentativas por bloco
+    jobs_max_ativos: int = 8  # jobs não concluídos aceitos ao mesmo tempo (acima disso, 429)
+    log_level: str = "INFO"
+
+    @classmethod
+    def do_ambiente(cls, env=None):
+        # cada campo lê a variável de mesmo nome em maiúsculas; ausente, vale o padrão acima
+        env = os.environ if env is None else env
+        valores = {"api_key": env.get("CHAVE_API_GEMINI") or env.get("chaveApiGemini")}
+        for campo in fields(cls):
+            bruto = env.get(campo.name.upper())
+            if campo.name == "api_key" or bruto is None:
+                continue
+            tipo = campo.type if campo.type in (Decimal, int, float) else str
+            valores[campo.name] = tipo(bruto)
+        return cls(**valores)
+
+CONFIG = Config.do_ambiente()
+METODO = "ia:v6:simulacao_reforma"  # versão do cálculo; entra na chave do cache/ETag (mude a cada alteração no resultado)
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
+# Cliente do Gemini: o SDK só é importado no primeiro uso do modo IA (o caminho determinístico não depende dele)
+_cliente_genai = None
+_cliente_genai_lock = threading.Lock()
 
-if not API_KEY:
-    logger.error("Variável de ambiente CHAVE_API_GEMINI / chaveApiGemini não definida. endpoint responderá 503.")
-    client = None
-else:
-    try:
-        client = genai.Client(api_key=API_KEY)
-        logger.info("Cliente Gemini inicializado.")
-    except Exception as e:
-        logger.exception("Falha ao inicializar cliente Gemini.")
-        client = None
+def _obter_cliente_genai():
+    global _cliente_genai
+    with _cliente_genai_lock:
+        if _cliente_genai is None:
+            if not CONFIG.api_key:
+                raise RuntimeError("Cliente de IA não configurado (defina CHAVE_API_GEMINI / chaveApiGemini).")
+            from google import genai
+            from google.genai import types
+            _cliente_genai = genai.Client(
+                api_key=CONFIG.api_key,
+                http_options=types.HttpOptions(base_url=CONFIG.gemini_base_url) if CONFIG.gemini_base_url else None
+            )
+            logger.info("Cliente Gemini inicializado.")
+        return _cliente_genai
 
 # Prompt para o Gemini: regras da Nova Reforma (apenas pós-reforma)
 PROMPT_REFORMA = """
-Você é um motor de simulação tributária (versão: reforma_v1) que calcula, de forma didática e determinística,
+Você é um motor de simulação tributária (versão: reforma_v2) que calcula, de forma didática e determinística,
 a carga tributária pós-Reforma Tributária (CBS + IBS) para empresas de SERVIÇOS no Brasil.
 
 REQUISITOS GERAIS
@@ -107,7 +201,7 @@ REGIMES A CALCULAR (RETORNE OS 3 REGIMES A SEGUIR, TODOS PÓS-REFORMA)
 
 DISTRIBUIÇÃO MENSAL
 - "impostoTotalMensal": distribua proporcionalmente ao faturamento de cada mês.
-- Ao final ajuste o último mês para garantir soma(impostoTotalMensal) == impostoTotalAnual (evitar diferenças por arredondamento).
+- Arredonde pelo maior resto: cada mês recebe o valor truncado no centavo e os centavos que faltam vão, um a um, aos meses com maior fração descartada (empate: mês mais cedo), garantindo soma(impostoTotalMensal) == impostoTotalAnual.
 
 FORMATO OBRIGATÓRIO DE SAÍDA (EXATAMENTE ESTE JSON)
 - Retorne um JSON com chaves:
@@ -125,20 +219,122 @@ REGRAS FINAIS
 - Use as alíquotas DEFAULT_CBS_RATE e DEFAULT_IBS_RATE passadas pelo cliente se fornecidas; caso contrário usar 0.12 e 0.14.
 """
 
-def _decimal_from_str_or_num(x):
-    if x is None:
-        return Decimal("0.00")
-    if isinstance(x, Decimal):
+# Núcleo numérico em centavos inteiros.
+# Dinheiro circula como int (centavos) e alíquotas como pares (numerador, denominador) inteiros;
+# a conversão para string só acontece na montagem da resposta. Os arredondamentos reproduzem
+# exatamente o caminho Decimal original (contexto de 28 dígitos HALF_EVEN + quantize HALF_UP).
+_PREC = 28
+_LIMITE_PREC = 10 ** _PREC
+_CONTEXTO_DECIMAL = Context(prec=_PREC)  # aritmética Decimal restante, independente do contexto da thread
+
+def _racional(x):
+    # valor exato de Decimal(str(x)) como (n, k) = n * 10^-k; None se não for número.
+    # Os meses validados por _validar_entrada já guardam o par (n, k), devolvido como está.
+    if type(x) is tuple:
         return x
+    if type(x) is int:
+        return x, 0
+    s = x if type(x) is str else str(x)
+    # caminho rápido para "123", "-123.45" etc.; o resto cai no parser do Decimal
+    inteiro, ponto, frac = s.partition(".")
+    if not ponto or (frac.isdigit() and frac.isascii()):
+        try:
+            return int(inteiro + frac), len(frac)
+        except ValueError:
+            pass
     try:
-        return Decimal(str(x))
+        d = Decimal(s)
     except Exception:
-        return Decimal("0.00")
+        return None
+    if not d.is_finite():
+        raise ValueError(f"Valor numérico inválido: {s!r}")
+    sinal, digitos, exp = d.as_tuple()
+    n = int("".join(map(str, digitos)))
+    if exp > 0:
+        n, exp = n * 10 ** exp, 0
+    return (-n if sinal else n), -exp
+
+def _div_half_up(n, d):
+    # n/d arredondado HALF_UP (empate se afasta do zero); d > 0
+    q, r = divmod(abs(n), d)
+    if 2 * r >= d:
+        q += 1
+    return q if n >= 0 else -q
 
-def _fmt_money(d: Decimal) -> str:
-    # two decimals, HALF_UP
-    q = d.quantize(Decimal(".01"), rounding=ROUND_HALF_UP)
-    return f"{q:.2f}"
+def _round_sig(n):
+    # arredonda o inteiro n para _PREC dígitos significativos (HALF_EVEN), como o contexto Decimal
+    a = abs(n)
+    if a < _LIMITE_PREC:
+        return n
+    escala = 10 ** (len(str(a)) - _PREC)
+    q, r = divmod(a, escala)
+    if 2 * r > escala or (2 * r == escala and q & 1):
+        q += 1
+    q *= escala
+    return q if n >= 0 else -q
+
+def _div_sig(n, d):
+    # n/d com _PREC dígitos significativos (HALF_EVEN), como a divisão Decimal; retorna (c, e) = c * 10^e
+    if d < 0:
+        n, d = -n, -d
+    if n == 0:
+        return 0, 0
+    a = abs(n)
+    # escala que deixa o quociente com _PREC ou _PREC + 1 dígitos
+    s = _PREC + len(str(d)) - len(str(a))
+    if s >= 0:
+        q, r = divmod(a * 10 ** s, d)
+    else:
+        d *= 10 ** -s
+        q, r = divmod(a, d)
+    if q >= _LIMITE_PREC:
+        q, ultimo = divmod(q, 10)
+        r += ultimo * d
+        d *= 10
+        s -= 1
+    if 2 * r > d or (2 * r == d and q & 1):
+        q += 1
+    return (q if n > 0 else -q), -s
+
+def _centavos_de(c, e):
+    # c * 10^e (em reais) -> centavos, HALF_UP
+    e += 2
+    return c * 10 ** e if e >= 0 else _div_half_up(c, 10 ** -e)
+
+def _centavos(x):
+    # valor monetário em centavos (HALF_UP); None vira 0. Texto não numérico é recusado em
+    # _validar_entrada, então aqui ele é erro, não zero.
+    if x is None:
+        return 0
+    r = _racional(x)
+    if r is None:
+        raise ValueError(f"Valor monetário inválido: {x!r}")
+    return _centavos_de(r[0], -r[1])
+
+def _taxa(x):
+    # alíquota como (numerador, denominador) inteiros; None vira 0, não numérico é erro
+    if x is None:
+        return (0, 1)
+    r = _racional(x)
+    if r is None:
+        raise ValueError(f"Alíquota inválida: {x!r}")
+    return (r[0], 10 ** r[1])
+
+def _mul_taxa(centavos, taxa):
+    # (valor * taxa) em centavos, HALF_UP
+    return _div_half_up(_round_sig(centavos * taxa[0]), taxa[1])
+
+def _fmt_centavos(c):
+    # two decimals
+    if c < 0:
+        return "-%d.%02d" % divmod(-c, 100)
+    return "%d.%02d" % divmod(c, 100)
+
+_TAXA_070 = _taxa("0.70")
+_TAXA_010 = _taxa("0.10")
+_TAXA_032 = _taxa("0.32")
+_TAXA_015 = _taxa("0.15")
+_TAXA_009 = _taxa("0.09")
 
 def _extract_text_from_response(resp):
     try:
@@ -155,257 +351,2494 @@ def _extract_text_from_response(resp):
         logger.exception("Erro extraindo texto da resposta do modelo.")
         return None
 
-def _validate_input_schema(data):
-    if not isinstance(data, dict):
-        return False, "JSON de entrada deve ser um objeto."
-    if "companyId" not in data or "year" not in data:
-        return False, "Campos obrigatórios ausentes: 'companyId' e 'year'."
-    return True, ""
+def _media_centavos(lst, key):
+    # média simples (em centavos) dos valores brutos de 'key'; entradas não numéricas são ignoradas.
+    # Retorna (centavos, media_nao_nula).
+    soma, escala, n = 0, 0, 0
+    for it in lst:
+        try:
+            r = _racional(it.get(key, "0") or "0")
+        except AttributeError:
+            continue
+        if r is None:
+            continue
+        v, k = r
+        if k > escala:
+            soma *= 10 ** (k - escala)
+            escala = k
+        else:
+            v *= 10 ** (escala - k)
+        soma += v
+        n += 1
+        if abs(soma) >= _LIMITE_PREC:
+            # soma além da precisão do contexto: delega ao Decimal para manter o mesmo arredondamento
+            return _media_centavos_decimal(lst, key)
+    if n == 0:
+        return 0, False
+    return _centavos_de(*_div_sig(soma, n * 10 ** escala)), soma != 0
+
+def _media_centavos_decimal(lst, key):
+    vals = []
+    for it in lst:
+        try:
+            r = _racional(it.get(key, "0") or "0")
+        except AttributeError:
+            continue
+        if r is not None:
+            vals.append(Decimal(f"{r[0]}E{-r[1]}"))
+    with localcontext(_CONTEXTO_DECIMAL):
+        media = (sum(vals) / len(vals)) if vals else Decimal("0.00")
+    if not media.is_finite():
+        raise ValueError(f"Valor numérico inválido em '{key}'.")
+    sinal, digitos, exp = media.as_tuple()
+    c = int("".join(map(str, digitos)))
+    return _centavos_de(-c if sinal else c, exp), media != 0
+
+def _mes_centavos(entry, ano, mes):
+    lucro = entry.get("lucroLiquidoContabil")
+    return {
+        "ano": ano,
+        "mes": mes,
+        "receitaBruta": _centavos(entry.get("receitaBruta")),
+        "folhaSalarios": _centavos(entry.get("folhaSalarios")),
+        "insumos": _centavos(entry.get("insumos")),
+        "lucroLiquidoContabil": _centavos(lucro) if lucro is not None else None
+    }
+
+# Previsão local (useAiForecast): crescimento mensal + sazonalidade opcional ajustados no histórico.
+# Séries só com valores positivos usam modelo multiplicativo (log-linear, taxa de crescimento
+# composta); as demais (ex.: lucro com prejuízos) usam tendência linear. Depois do último mês do
+# histórico a tendência é amortecida (FORECAST_AMORTECIMENTO por mês), então a projeção se estabiliza
+# em vez de extrapolar o crescimento indefinidamente. Sem numpy ou sem histórico suficiente, a série
+# volta à média simples.
+FORECAST_SERIES = ("receitaBruta", "folhaSalarios", "insumos", "lucroLiquidoContabil")
+
+def _ajustar_previsao(historical):
+    # Ajusta, para as quatro séries, y = a + b*t + sazonal[mes] por mínimos quadrados. Mesmo caminho do
+    # histórico armazenado: as somas exatas dos meses (_agregados_de_meses) e o ajuste de _previsao_dos_agregados,
+    # então mandar o histórico no corpo ou usar o armazenado dá exatamente a mesma projeção.
+    return _previsao_dos_agregados(_agregados_de_meses(historical))
+
+def _parametros_previsao(historical, company_id):
+    # memoizado por empresa + hash do histórico: lotes e reaberturas não reajustam o modelo
+    chave = (company_id, hashlib.blake2b(_json_bytes(historical), digest_size=16).hexdigest())
+    params = _cache_previsao.get(chave)
+    if params is None:
+        params = _ajustar_previsao(historical)
+        _cache_previsao.put(chave, params)
+    return params
+
+def _passos_amortecidos(ts):
+    # meses de tendência aplicados a t meses do último mês do histórico: t dentro do histórico,
+    # phi + phi^2 + ... + phi^t depois dele (no máximo phi / (1 - phi) meses, ex.: 9 com phi = 0.9)
+    phi = CONFIG.forecast_amortecimento
+    ts = np.asarray(ts, dtype=float)
+    if phi >= 1:
+        return ts
+    return np.where(ts > 0, phi * (1 - phi ** np.maximum(ts, 0)) / (1 - phi), ts)
+
+def _projetar_meses(params, ano, meses):
+    # centavos projetados (4 x len(meses)); linhas de séries sem ajuste válido ficam como None
+    ts = np.array([ano * 12 + m - 1 for m in meses], dtype=float) - params["t_final"]
+    idx = np.array([m - 1 for m in meses])
+    pred = params["a"][:, None] + params["b"][:, None] * _passos_amortecidos(ts) + params["sazonal"][:, idx]
+    multiplicativo = params["multiplicativo"]
+    with np.errstate(over="ignore"):
+        pred[multiplicativo] = np.exp(pred[multiplicativo])
+    centavos = np.floor(pred + 0.5)
+    return [
+        [int(v) for v in linha] if valido and np.all(np.isfinite(linha)) else None
+        for linha, valido in zip(centavos, params["valido"])
+    ]
+
+# Entrada: JSON (orjson quando instalado) e validação num único passo.
+# Os validadores de cada campo são montados uma vez, na importação. Cada mês sai como registro tipado
+# (ano e mes int, séries como o par (n, k) de _racional ou None), então o cálculo não volta a
+# interpretar strings. Cada problema vira um erro com o caminho do campo
+# (ex.: "targetYearMonthly[3].mes"), e a entrada é recusada antes de qualquer conta.
+_MAX_ERROS_VALIDACAO = 20  # erros devolvidos por resposta
+_VALOR_MAX_ORDEM = 100  # |expoente| aceito num valor (ex.: "1e999999" é recusado antes de virar inteiro)
+_VALOR_RAPIDO_MAX_CHARS = 40  # strings curtas sem expoente ficam dentro da faixa sem conferir
+_LIMITE_VALOR_INT = 10 ** _VALOR_MAX_ORDEM
+_TAXAS_ENTRADA = ("cbsRate", "ibsRate", "cppRate", "simplesShare")
+_LISTAS_MESES = ("targetYearMonthly", "historicalMonthly")
+# o orjson não limita o aninhamento e derruba o processo com milhares de níveis; com no máximo este
+# número de '[' e '{' no corpo a profundidade é segura, acima disso o json (RecursionError) decide
+_ORJSON_MAX_ABERTURAS = 4096
 
-def _complete_12_months(target, historical, use_ai):
+def _json_loads(corpo):
+    # o que o orjson recusa e o json aceita (inteiros além de 64 bits, NaN) cai no json: mesma entrada aceita
+    if orjson is not None:
+        bruto = corpo.encode("utf-8") if type(corpo) is str else corpo
+        if bruto.count(b"[") + bruto.count(b"{") <= _ORJSON_MAX_ABERTURAS:
+            try:
+                return orjson.loads(bruto)
+            except orjson.JSONDecodeError:
+                pass
+    return json.loads(corpo)
+
+def _json_bytes(obj):
+    # JSON compacto, chaves ordenadas, UTF-8; os mesmos bytes com ou sem orjson
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=str, option=orjson.OPT_SORT_KEYS)
+        except TypeError:  # ex.: inteiro além de 64 bits
+            pass
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+
+def _erro_campo(campo, mensagem):
+    return {"campo": campo, "error": f"{campo} {mensagem}."}
+
+def _inteiro(minimo, maximo):
+    # conversor de inteiro na faixa: int JSON, float inteiro (3.0) ou string ("3", "-3"); a string só com
+    # dígitos ASCII, como no caminho rápido de _valor_numerico (int() aceitaria "1_2", " 12 " e "+12")
+    def converter(valor):
+        if type(valor) is float and valor.is_integer():
+            valor = int(valor)
+        elif type(valor) is str:
+            digitos = valor[1:] if valor[:1] == "-" else valor
+            try:
+                if not (digitos.isdigit() and digitos.isascii()):
+                    raise ValueError
+                valor = int(valor)
+            except ValueError:
+                raise ValueError("deve ser um inteiro")
+        elif type(valor) is not int:
+            raise ValueError("deve ser um inteiro")
+        if not minimo <= valor <= maximo:
+            raise ValueError(f"deve estar entre {minimo} e {maximo}")
+        return valor
+    return converter
+
+def _valor_numerico(valor):
+    # número JSON ou string numérica -> (n, k) de _racional; ValueError com a mensagem do campo
+    if type(valor) is str and len(valor) <= _VALOR_RAPIDO_MAX_CHARS:
+        # caminho rápido para "123", "-123.45": dígitos ASCII, no máximo um ponto, sem expoente
+        negativo = valor[:1] == "-"
+        inteiro, ponto, frac = (valor[1:] if negativo else valor).partition(".")
+        if inteiro.isdigit() and inteiro.isascii() and (not ponto or (frac.isdigit() and frac.isascii())):
+            n = int(inteiro + frac)
+            return (-n if negativo else n), len(frac)
+    elif type(valor) is int and -_LIMITE_VALOR_INT < valor < _LIMITE_VALOR_INT:
+        return valor, 0
+    if type(valor) is bool or not isinstance(valor, (int, float, str)):
+        raise ValueError("deve ser um número ou uma string numérica")
+    if type(valor) is str and ("e" in valor or "E" in valor):
+        # notação científica: confere a ordem de grandeza antes de expandir para inteiro
+        try:
+            d = Decimal(valor)
+        except Exception:
+            raise ValueError("deve ser um número ou uma string numérica")
+        if d.is_finite() and not (d.as_tuple().exponent >= -_VALOR_MAX_ORDEM and d.adjusted() <= _VALOR_MAX_ORDEM):
+            raise ValueError("está fora da faixa aceita")
+    try:
+        r = _racional(valor)
+    except ValueError:
+        r = None
+    if r is None:
+        raise ValueError("deve ser um número ou uma string numérica")
+    n, k = r
+    if k > _VALOR_MAX_ORDEM or abs(n) >= 10 ** (k + _VALOR_MAX_ORDEM):
+        raise ValueError("está fora da faixa aceita")
+    return r
+
+def _compilar_validador_mes():
+    # validar(mes, lista, i, erros) -> registro {ano, mes, séries} ou None; acrescenta em 'erros' os
+    # problemas do mês lista[i] (o caminho do campo só é montado quando há erro)
+    obrigatorios = (("ano", _inteiro(1, 9999)), ("mes", _inteiro(1, 12)))
+    series = FORECAST_SERIES
+    valor_numerico = _valor_numerico
+    max_rapido = _VALOR_RAPIDO_MAX_CHARS
+
+    def validar(mes, lista, i, erros):
+        if type(mes) is not dict:
+            erros.append(_erro_campo(f"{lista}[{i}]", "deve ser um objeto"))
+            return None
+        ano, m = mes.get("ano"), mes.get("mes")
+        if type(ano) is int and type(m) is int and 1 <= ano <= 9999 and 1 <= m <= 12:
+            registro = {"ano": ano, "mes": m}  # caso comum: os dois já são inteiros na faixa
+        else:
+            registro = converter_obrigatorios(mes, f"{lista}[{i}]", erros)
+        for serie in series:
+            bruto = mes.get(serie)
+            if bruto is None:
+                registro[serie] = None
+                continue
+            if type(bruto) is str and len(bruto) <= max_rapido:
+                # mesmo caminho rápido de _valor_numerico, sem a chamada (a maioria dos valores)
+                inteiro, ponto, frac = bruto.partition(".")
+                if inteiro.isdigit() and inteiro.isascii() and (not ponto or (frac.isdigit() and frac.isascii())):
+                    registro[serie] = (int(inteiro + frac), len(frac))
+                    continue
+            try:
+                registro[serie] = valor_numerico(bruto)
+            except ValueError as e:
+                erros.append(_erro_campo(f"{lista}[{i}].{serie}", e))
+        return registro
+
+    def converter_obrigatorios(mes, caminho, erros):
+        registro = {}
+        for campo, converter in obrigatorios:
+            bruto = mes.get(campo)
+            if bruto is None:
+                erros.append(_erro_campo(f"{caminho}.{campo}", "é obrigatório"))
+                continue
+            try:
+                registro[campo] = converter(bruto)
+            except ValueError as e:
+                erros.append(_erro_campo(f"{caminho}.{campo}", e))
+        return registro
+
+    return validar
+
+_validar_mes = _compilar_validador_mes()
+_validar_year = _inteiro(1, 9999)
+
+def _validar_entrada(dados):
+    # (entrada, None), com os meses normalizados e os demais campos como vieram, ou (None, (status, erros))
+    if not isinstance(dados, dict):
+        return None, (400, [{"campo": "", "error": "JSON de entrada deve ser um objeto."}])
+    # limites primeiro: uma entrada grande demais é recusada sem olhar os meses
+    for lista in _LISTAS_MESES:
+        meses = dados.get(lista)
+        if isinstance(meses, list) and len(meses) > CONFIG.max_meses_entrada:
+            return None, (413, [_erro_campo(lista, f"excede o limite de {CONFIG.max_meses_entrada} meses")])
+
+    erros = []
+    company_id = dados.get("companyId")
+    if company_id is None:
+        erros.append(_erro_campo("companyId", "é obrigatório"))
+    elif type(company_id) not in (str, int):
+        erros.append(_erro_campo("companyId", "deve ser texto ou inteiro"))
+    if dados.get("year") is None:
+        erros.append(_erro_campo("year", "é obrigatório"))
+    else:
+        try:
+            _validar_year(dados["year"])
+        except ValueError as e:
+            erros.append(_erro_campo("year", e))
+    if dados.get("useAiForecast") is not None and type(dados["useAiForecast"]) is not bool:
+        erros.append(_erro_campo("useAiForecast", "deve ser true ou false"))
+    for taxa in _TAXAS_ENTRADA:
+        if dados.get(taxa) is not None:
+            try:
+                _valor_numerico(dados[taxa])
+            except ValueError as e:
+                erros.append(_erro_campo(taxa, e))
+
+    entrada = dict(dados)
+    for lista in _LISTAS_MESES:
+        if lista not in dados:
+            continue
+        meses = dados[lista]
+        if meses is None:
+            entrada[lista] = []
+            continue
+        if type(meses) is not list:
+            erros.append(_erro_campo(lista, "deve ser uma lista de meses"))
+            continue
+        registros = []
+        for i, mes in enumerate(meses):
+            if len(erros) >= _MAX_ERROS_VALIDACAO:
+                break
+            registros.append(_validar_mes(mes, lista, i, erros))
+        entrada[lista] = registros
+    if erros:
+        return None, (400, erros[:_MAX_ERROS_VALIDACAO])
+    return entrada, None
+
+def _texto_mes(mes):
+    # registro tipado -> mês com valores em string e sem as séries vazias (ex.: entrada do modelo);
+    # meses em texto passam direto
+    return {k: (str(Decimal(f"{v[0]}E{-v[1]}")) if type(v) is tuple else v) for k, v in mes.items() if v is not None}
+
+def _complete_12_months(target, historical, use_ai, ano_alvo=None, company_id=None, resumo=None, ano_base=None):
     # target: list of dicts (may be less than 12); historical: list of dicts
     # We'll produce 12 months for the given year in target (assume months 1..12)
-    # Simple approach: if use_ai and historical present -> compute monthly growth rate avg and project
-    # For simplicity here: if data for month exists, use it; else fill with average of provided target months.
+    # If use_ai and historical present -> project missing months with growth/seasonality fitted on historical
+    # Otherwise: if data for month exists, use it; else fill with average of provided target months.
     # This helper returns a list of 12 dicts with keys: ano, mes, receitaBruta, folhaSalarios, insumos, lucroLiquidoContabil (optional)
-    year = target[0]["ano"] if target else (historical[0]["ano"] if historical else None)
+    # Valores monetários em centavos (int); use _base_mensal_json para a resposta.
+    # resumo: agregados do histórico armazenado (_historico.resumo), usado no lugar de 'historical'.
+    # ano_base: ano dos meses preenchidos (padrão: do primeiro mês do target ou, sem target, do histórico).
+    if resumo is not None:
+        ano_historico = resumo["ano_inicial"]
+    else:
+        ano_historico = historical[0]["ano"] if historical else None
+    if ano_base is not None:
+        year = ano_base
+    else:
+        year = target[0]["ano"] if target else ano_historico
     # prepare dict by month
     by_month = {}
     for m in (target or []):
         by_month[int(m["mes"])] = m
-    # if not target months, try to derive from historical mapping on same months
-    months_data = []
-    # compute averages from target if any
-    def avg_from_list(lst, key):
-        vals = []
-        for it in lst:
-            try:
-                vals.append(Decimal(str(it.get(key, "0") or "0")))
-            except Exception:
-                pass
-        return (sum(vals) / len(vals)) if vals else Decimal("0.00")
     if len(by_month) == 12:
         # already complete
-        for m in range(1,13):
-            entry = by_month[m]
-            months_data.append({
-                "ano": entry.get("ano", year),
-                "mes": m,
-                "receitaBruta": _fmt_money( _decimal_from_str_or_num(entry.get("receitaBruta")) ),
-                "folhaSalarios": _fmt_money( _decimal_from_str_or_num(entry.get("folhaSalarios")) ),
-                "insumos": _fmt_money( _decimal_from_str_or_num(entry.get("insumos")) ),
-                "lucroLiquidoContabil": _fmt_money( _decimal_from_str_or_num(entry.get("lucroLiquidoContabil")) ) if entry.get("lucroLiquidoContabil") is not None else None
-            })
-        return months_data
+        return [_mes_centavos(by_month[m], by_month[m].get("ano", year), m) for m in range(1, 13)]
     # compute averages from target if exist, else from historical
-    source_for_avg = target if target and len(target) > 0 else historical
-    avg_receita = avg_from_list(source_for_avg, "receitaBruta")
-    avg_folha = avg_from_list(source_for_avg, "folhaSalarios")
-    avg_insumos = avg_from_list(source_for_avg, "insumos")
-    avg_lucro = avg_from_list(source_for_avg, "lucroLiquidoContabil")
-    for m in range(1,13):
+    if resumo is not None and not target:
+        medias = resumo["medias"]
+    else:
+        source_for_avg = target if target and len(target) > 0 else historical
+        medias = [_media_centavos(source_for_avg, k) for k in FORECAST_SERIES]
+    (avg_receita, _), (avg_folha, _), (avg_insumos, _), (avg_lucro, tem_lucro) = medias
+    faltantes = [m for m in range(1, 13) if m not in by_month]
+    preenchimento = {m: (year, avg_receita, avg_folha, avg_insumos, avg_lucro if tem_lucro else None) for m in faltantes}
+    if use_ai and (historical or resumo is not None):
+        if np is None:
+            logger.warning("useAiForecast sem numpy instalado; meses faltantes preenchidos pela média.")
+        else:
+            try:
+                ano_proj = int(ano_alvo if ano_alvo is not None else year)
+            except (TypeError, ValueError):
+                ano_proj = None
+            if ano_proj is not None:
+                params = resumo["previsao"] if resumo is not None else _parametros_previsao(historical, company_id)
+                projecao = _projetar_meses(params, ano_proj, faltantes)
+                for j, m in enumerate(faltantes):
+                    media = preenchimento[m]
+                    preenchimento[m] = (ano_proj,) + tuple(
+                        serie[j] if serie is not None else media[i + 1] for i, serie in enumerate(projecao)
+                    )
+    months_data = []
+    for m in range(1, 13):
         if m in by_month:
             e = by_month[m]
-            months_data.append({
-                "ano": e.get("ano", year),
-                "mes": m,
-                "receitaBruta": _fmt_money(_decimal_from_str_or_num(e.get("receitaBruta"))),
-                "folhaSalarios": _fmt_money(_decimal_from_str_or_num(e.get("folhaSalarios"))),
-                "insumos": _fmt_money(_decimal_from_str_or_num(e.get("insumos"))),
-                "lucroLiquidoContabil": _fmt_money(_decimal_from_str_or_num(e.get("lucroLiquidoContabil"))) if e.get("lucroLiquidoContabil") is not None else None
-            })
+            months_data.append(_mes_centavos(e, e.get("ano", year), m))
         else:
+            ano, receita, folha, insumos, lucro = preenchimento[m]
             months_data.append({
-                "ano": year,
+                "ano": ano,
                 "mes": m,
-                "receitaBruta": _fmt_money(avg_receita),
-                "folhaSalarios": _fmt_money(avg_folha),
-                "insumos": _fmt_money(avg_insumos),
-                "lucroLiquidoContabil": _fmt_money(avg_lucro) if avg_lucro != Decimal("0.00") else None
+                "receitaBruta": receita,
+                "folhaSalarios": folha,
+                "insumos": insumos,
+                "lucroLiquidoContabil": lucro
             })
     return months_data
 
-def _distribute_monthly(imposto_total, faturamentos):
-    # imposto_total: Decimal, faturamentos: list of Decimal for 12 months
-    total_fat = sum(faturamentos) if faturamentos else Decimal("0.00")
-    monthly = []
-    accumulated = Decimal("0.00")
-    for i, f in enumerate(faturamentos, start=1):
-        if total_fat == 0:
-            val = (imposto_total / Decimal(len(faturamentos))).quantize(Decimal(".01"), rounding=ROUND_HALF_UP)
+def _base_mensal_json(base_mensal):
+    return [
+        {
+            "ano": b["ano"],
+            "mes": b["mes"],
+            "receitaBruta": _fmt_centavos(b["receitaBruta"]),
+            "folhaSalarios": _fmt_centavos(b["folhaSalarios"]),
+            "insumos": _fmt_centavos(b["insumos"]),
+            "lucroLiquidoContabil": _fmt_centavos(b["lucroLiquidoContabil"]) if b["lucroLiquidoContabil"] is not None else None
+        }
+        for b in base_mensal
+    ]
+
+def _cotas_mensais(faturamentos):
+    # pesos do rateio, calculados uma vez por empresa: (pesos, soma) com soma > 0.
+    # Faturamento somando zero divide em partes iguais; soma negativa inverte o sinal dos pesos.
+    soma = sum(faturamentos)
+    if soma == 0:
+        return [1] * len(faturamentos), len(faturamentos)
+    if soma < 0:
+        return [-f for f in faturamentos], -soma
+    return list(faturamentos), soma
+
+def _ratear(totais, cotas):
+    # Rateia cada total (centavos) proporcionalmente às cotas pelo método do maior resto:
+    # cada mês recebe o piso da sua parte e os centavos que sobram vão para os meses com os
+    # maiores restos (empate: mês mais cedo). A soma mensal fecha exatamente com o total.
+    # Total negativo: rateia o valor absoluto e troca o sinal, então -x sai como o espelho de x.
+    pesos, soma = cotas
+    resultado = []
+    for total in totais:
+        magnitude = abs(total)
+        partes = []
+        restos = []
+        for i, w in enumerate(pesos):
+            q, r = divmod(magnitude * w, soma)
+            partes.append(q)
+            restos.append((-r, i))
+        sobra = magnitude - sum(partes)
+        if sobra:
+            for _, i in sorted(restos)[:sobra]:
+                partes[i] += 1
+        resultado.append([-p for p in partes] if total < 0 else partes)
+    return resultado
+
+def _distribute_monthly(imposto_total, faturamentos, cotas=None):
+    # imposto_total: centavos, faturamentos: list of centavos for 12 months -> [(mes, centavos)]
+    # cotas: resultado de _cotas_mensais, para reaproveitar entre regimes da mesma empresa
+    if not faturamentos:
+        return []
+    if cotas is None:
+        cotas = _cotas_mensais(faturamentos)
+    return list(enumerate(_ratear([imposto_total], cotas)[0], start=1))
+
+def _parse_aliquotas(dados, cache=None):
+    # parametros configuráveis via entrada; 'cache' (dict) permite reaproveitar o parse entre itens de um lote
+    brutos = (
+        dados.get("cbsRate", CONFIG.default_cbs_rate),
+        dados.get("ibsRate", CONFIG.default_ibs_rate),
+        dados.get("cppRate", CONFIG.default_cpp_rate),
+        dados.get("simplesShare", CONFIG.simplified_simples_share),
+    )
+    if cache is None:
+        return tuple(_taxa(x) for x in brutos)
+    # _taxa converte via str(), então str() do valor bruto é uma chave fiel
+    chave = tuple(str(x) for x in brutos)
+    aliquotas = cache.get(chave)
+    if aliquotas is None:
+        aliquotas = tuple(_taxa(x) for x in brutos)
+        cache[chave] = aliquotas
+    return aliquotas
+
+def _agregados_anuais(base_mensal):
+    # variáveis anuais (centavos) a partir da base de 12 meses
+    faturamentoTotalAnual = 0
+    folhaTotalAnual = 0
+    totalInsumos = 0
+    soma_lucro_mensal = 0
+    lucro_flag = False
+    for b in base_mensal:
+        faturamentoTotalAnual += b["receitaBruta"]
+        folhaTotalAnual += b["folhaSalarios"]
+        totalInsumos += b["insumos"]
+        if b["lucroLiquidoContabil"] is not None:
+            lucro_flag = True
+            soma_lucro_mensal += b["lucroLiquidoContabil"]
+
+    if totalInsumos == 0:
+        valorAdicionado = _mul_taxa(faturamentoTotalAnual, _TAXA_070)
+    else:
+        valorAdicionado = faturamentoTotalAnual - totalInsumos
+
+    # lucroTributavel
+    if lucro_flag:
+        lucroTributavel = soma_lucro_mensal
+    else:
+        lucroTributavel = _mul_taxa(faturamentoTotalAnual, _TAXA_010)
+
+    return {
+        "faturamentoTotalAnual": faturamentoTotalAnual,
+        "folhaTotalAnual": folhaTotalAnual,
+        "valorAdicionado": valorAdicionado,
+        "lucroTributavel": lucroTributavel
+    }
+
+def _calcular_regimes(agregados, aliquotas):
+    # tributos por regime (centavos), na ordem Simples, Presumido, Real
+    cbs_rate, ibs_rate, cpp_rate, simples_share = aliquotas
+    faturamentoTotalAnual = agregados["faturamentoTotalAnual"]
+    valorAdicionado = agregados["valorAdicionado"]
+    lucroTributavel = agregados["lucroTributavel"]
+
+    # tributos gerais
+    CBS_total = _mul_taxa(valorAdicionado, cbs_rate)
+    IBS_total = _mul_taxa(valorAdicionado, ibs_rate)
+    CPP_total = _mul_taxa(agregados["folhaTotalAnual"], cpp_rate)
+
+    # IRPJ / CSLL - regras por regime definidas abaixo (Presumido usa base presumida)
+    # Simples e Real: IRPJ/CSLL sobre lucroTributavel (mesma regra)
+    IRPJ_real = _mul_taxa(lucroTributavel, _TAXA_015)
+    CSLL_real = _mul_taxa(lucroTributavel, _TAXA_009)
+
+    # Lucro Presumido
+    basePresumida = _mul_taxa(faturamentoTotalAnual, _TAXA_032)
+    IRPJ_presumido = _mul_taxa(basePresumida, _TAXA_015)
+    CSLL_presumido = _mul_taxa(basePresumida, _TAXA_009)
+
+    # Simples específico: aplicar share
+    CBS_simples = _mul_taxa(CBS_total, simples_share)
+    IBS_simples = _mul_taxa(IBS_total, simples_share)
+    CPP_simples = _mul_taxa(CPP_total, simples_share)
+
+    tributos = [
+        {"CBS": CBS_simples, "IBS": IBS_simples, "IRPJ": IRPJ_real, "CSLL": CSLL_real, "CPP": CPP_simples,
+         "total": CBS_simples + IBS_simples + IRPJ_real + CSLL_real + CPP_simples},
+        {"CBS": CBS_total, "IBS": IBS_total, "IRPJ": IRPJ_presumido, "CSLL": CSLL_presumido, "CPP": CPP_total,
+         "total": CBS_total + IBS_total + IRPJ_presumido + CSLL_presumido + CPP_total},
+        {"CBS": CBS_total, "IBS": IBS_total, "IRPJ": IRPJ_real, "CSLL": CSLL_real, "CPP": CPP_total,
+         "total": CBS_total + IBS_total + IRPJ_real + CSLL_real + CPP_total},
+    ]
+    for t in tributos:
+        t["aliquota"] = _aliquota_efetiva(t["total"], faturamentoTotalAnual)
+    return tributos
+
+REGIMES_NOMES = (
+    "Simples Nacional - Pós-Reforma",
+    "Lucro Presumido - Pós-Reforma",
+    "Lucro Real - Pós-Reforma",
+)
+
+def _aliquota_efetiva(total, faturamento):
+    # (total / faturamento) em centésimos, HALF_UP
+    if faturamento > 0:
+        return _centavos_de(*_div_sig(total, faturamento))
+    return 0
+
+def _percentual_share(simples_share):
+    # int(simples_share * 100): truncado em direção ao zero
+    n, d = simples_share
+    p = abs(n) * 100 // d
+    return -p if n < 0 else p
+
+# Motor vetorial (opcional, requer numpy): calcula os três regimes para N empresas de uma vez
+# a partir da matriz de agregados anuais em centavos (int64), com o mesmo HALF_UP do caminho escalar.
+AGREGADOS_COLUNAS = ("faturamentoTotalAnual", "folhaTotalAnual", "valorAdicionado", "lucroTributavel")
+_LIMITE_INT64 = 2 ** 62
+
+def _half_up_vetorial(p, den):
+    a = np.abs(p)
+    q = (2 * a + den) // (2 * den)
+    return np.where(p < 0, -q, q)
+
+def _mul_taxa_vetorial(centavos, taxa):
+    num, den = taxa
+    return _half_up_vetorial(centavos * num, den)
+
+def _colunas_taxas(aliquotas, n):
+    # aliquotas: uma tupla (cbs, ibs, cpp, share) para todas as empresas ou uma lista com uma tupla por empresa.
+    # Na tupla, numerador/denominador podem ser arrays (varredura de alíquotas sobre uma única empresa).
+    if isinstance(aliquotas, tuple):
+        return [(np.asarray(num), np.asarray(den)) for num, den in aliquotas]
+    if len(aliquotas) != n:
+        raise ValueError("Número de alíquotas diferente do número de empresas.")
+    colunas = []
+    for j in range(4):
+        nums = np.fromiter((a[j][0] for a in aliquotas), dtype=object, count=n)
+        dens = np.fromiter((a[j][1] for a in aliquotas), dtype=object, count=n)
+        colunas.append((nums, dens))
+    return colunas
+
+def _calcular_regimes_vetorial(matriz, aliquotas):
+    # matriz: N x 4 (colunas em AGREGADOS_COLUNAS), centavos; com uma linha só, ela é combinada com
+    # cada alíquota dos arrays em 'aliquotas' (broadcast).
+    # Retorna arrays N x 3 (Simples, Presumido, Real) para cada tributo, "total" e "aliquota" (centésimos),
+    # e "recomendado" (índice em REGIMES_NOMES). OverflowError se os valores não couberem em int64 com folga.
+    if np is None:
+        raise RuntimeError("Motor vetorial indisponível: numpy não instalado.")
+    matriz = np.asarray(matriz)
+    n = matriz.shape[0]
+    taxas = _colunas_taxas(aliquotas, n)
+    maior_valor = int(np.abs(matriz).max()) if n else 0
+    maior_num = max([100] + [int(abs(num).max()) for num, _ in taxas])
+    maior_den = max(int(den.max()) for _, den in taxas)
+    maior_taxa = max(int((-(-abs(num) // den)).max()) for num, den in taxas)  # teto de |taxa|
+    # limites dos produtos intermediários: valor * taxa, imposto * share e total * 100
+    produto = maior_valor * maior_num
+    imposto = maior_valor * max(maior_taxa, 1) + 1
+    if 2 * max(produto, imposto * maior_num, 500 * imposto) + maior_den >= _LIMITE_INT64:
+        raise OverflowError("Valores fora da faixa do motor vetorial.")
+    taxas = [(np.asarray(num, dtype=np.int64), np.asarray(den, dtype=np.int64)) for num, den in taxas]
+    cbs_rate, ibs_rate, cpp_rate, simples_share = taxas
+
+    matriz = matriz.astype(np.int64, copy=False)
+    faturamento, folha, valor_adicionado, lucro = (matriz[:, j] for j in range(4))
+
+    CBS_total = _mul_taxa_vetorial(valor_adicionado, cbs_rate)
+    IBS_total = _mul_taxa_vetorial(valor_adicionado, ibs_rate)
+    CPP_total = _mul_taxa_vetorial(folha, cpp_rate)
+    IRPJ_real = _mul_taxa_vetorial(lucro, _TAXA_015)
+    CSLL_real = _mul_taxa_vetorial(lucro, _TAXA_009)
+    basePresumida = _mul_taxa_vetorial(faturamento, _TAXA_032)
+    IRPJ_presumido = _mul_taxa_vetorial(basePresumida, _TAXA_015)
+    CSLL_presumido = _mul_taxa_vetorial(basePresumida, _TAXA_009)
+    CBS_simples = _mul_taxa_vetorial(CBS_total, simples_share)
+    IBS_simples = _mul_taxa_vetorial(IBS_total, simples_share)
+    CPP_simples = _mul_taxa_vetorial(CPP_total, simples_share)
+
+    resultado = {
+        "CBS": np.stack([CBS_simples, CBS_total, CBS_total], axis=1),
+        "IBS": np.stack([IBS_simples, IBS_total, IBS_total], axis=1),
+        "IRPJ": np.stack([IRPJ_real, IRPJ_presumido, IRPJ_real], axis=1),
+        "CSLL": np.stack([CSLL_real, CSLL_presumido, CSLL_real], axis=1),
+        "CPP": np.stack([CPP_simples, CPP_total, CPP_total], axis=1),
+    }
+    total = resultado["CBS"] + resultado["IBS"] + resultado["IRPJ"] + resultado["CSLL"] + resultado["CPP"]
+    resultado["total"] = total
+    # aliquota: divisão racional exata; para valores em int64 coincide com a divisão Decimal de 28 dígitos
+    positivo = faturamento > 0
+    divisor = np.where(positivo, faturamento, 1)[:, None]
+    resultado["aliquota"] = np.where(positivo[:, None], _half_up_vetorial(total * 100, divisor), 0)
+    resultado["recomendado"] = np.argmin(total, axis=1)
+    return resultado
+
+def _tributos_do_vetorial(resultado):
+    # converte o resultado de _calcular_regimes_vetorial na lista por empresa usada por _montar_resposta
+    chaves = ("CBS", "IBS", "IRPJ", "CSLL", "CPP", "total", "aliquota")
+    colunas = [resultado[k].tolist() for k in chaves]
+    return [
+        [dict(zip(chaves, (c[i][r] for c in colunas))) for r in range(3)]
+        for i in range(len(colunas[0]))
+    ]
+
+def _matriz_agregados(agregados_lista):
+    return np.array([[a[c] for c in AGREGADOS_COLUNAS] for a in agregados_lista], dtype=object).reshape(-1, 4)
+
+def _montar_resposta(dados, base_mensal, agregados, tributos, aliquotas):
+    # converte o resultado em centavos para o JSON de saída do /chat
+    faturamentoTotalAnual = agregados["faturamentoTotalAnual"]
+
+    # Distribuição mensal (proporcional ao faturamento)
+    faturamentos_mensais = [m["receitaBruta"] for m in base_mensal]
+    with _Etapa("rateio_mensal"):
+        mensais = _ratear([t["total"] for t in tributos], _cotas_mensais(faturamentos_mensais))
+
+    def monthly_to_list(monthly_tuples):
+        return [ {"mes": m, "valor": _fmt_centavos(v)} for (m,v) in monthly_tuples ]
+
+    observacoes = (
+        f"Simples simplificado: {_percentual_share(aliquotas[3])}% do CBS/IBS e CPP considerados dentro do DAS (hipótese didática).",
+        "Regime presumido com CBS/IBS integrais e base presumida de 32% para serviços.",
+        "Regime real com CBS/IBS integrais. Lucro tributável = soma dos lucros contábeis mensais ou 10% do faturamento se não informado.",
+    )
+    regimes = []
+    for nome, t, obs, mensal in zip(REGIMES_NOMES, tributos, observacoes, mensais):
+        regimes.append({
+            "nome": nome,
+            "impostoTotalAnual": _fmt_centavos(t["total"]),
+            "aliquotaEfetiva": _fmt_centavos(t["aliquota"]),
+            "detalhesTributos": {
+                "CBS": _fmt_centavos(t["CBS"]),
+                "IBS": _fmt_centavos(t["IBS"]),
+                "IRPJ": _fmt_centavos(t["IRPJ"]),
+                "CSLL": _fmt_centavos(t["CSLL"]),
+                "CPP": _fmt_centavos(t["CPP"]),
+                "IS": "0.00"
+            },
+            "impostoTotalMensal": monthly_to_list(enumerate(mensal, start=1)),
+            "observacoes": obs
+        })
+
+    # recomendado: menor impostoTotalAnual
+    recomendado = REGIMES_NOMES[min(range(len(tributos)), key=lambda i: tributos[i]["total"])]
+
+    # montar resposta
+    return {
+        "companyId": dados.get("companyId"),
+        "year": dados.get("year"),
+        "metodo": METODO,
+        "faturamentoTotalAnual": _fmt_centavos(faturamentoTotalAnual),
+        "folhaTotalAnual": _fmt_centavos(agregados["folhaTotalAnual"]),
+        "valorAdicionado": _fmt_centavos(agregados["valorAdicionado"]),
+        "baseMensal": _base_mensal_json(base_mensal),
+        "regimes": regimes,
+        "recomendado": recomendado
+    }
+
+def _preparar(dados):
+    # base de 12 meses e agregados anuais (centavos) de uma empresa
+    target = dados.get("targetYearMonthly", [])
+    historical = dados.get("historicalMonthly", [])
+    use_ai = bool(dados.get("useAiForecast", False))
+    resumo = None
+    if "historicalMonthly" not in dados:
+        # sem histórico no corpo: usa o armazenado via /historico, se houver
+        with _Etapa("historico"):
+            resumo = _historico.resumo(dados.get("companyId"))
+
+    # completar 12 meses
+    with _Etapa("completar_meses"):
+        base_mensal = _complete_12_months(target, historical, use_ai, dados.get("year"), dados.get("companyId"), resumo)
+    with _Etapa("agregados"):
+        agregados = _agregados_anuais(base_mensal)
+    return base_mensal, agregados
+
+def _simular(dados, aliquotas):
+    # dados já normalizados por _validar_entrada; retorna o dict de resposta do /chat
+    base_mensal, agregados = _preparar(dados)
+    with _Etapa("regimes"):
+        tributos = _calcular_regimes(agregados, aliquotas)
+    return _montar_resposta(dados, base_mensal, agregados, tributos, aliquotas)
+
+# Métricas (/metrics, formato texto do Prometheus)
+# Contadores e histogramas de buckets fixos em memória do processo. Cada observação custa um bisect
+# e duas somas sob um lock, o que permite deixar a instrumentação sempre ligada.
+_BUCKETS_SEGUNDOS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+_BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+def _rotulos_texto(rotulos):
+    if not rotulos:
+        return ""
+    pares = []
+    for k, v in rotulos:
+        v = str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        pares.append(f'{k}="{v}"')
+    return "{" + ",".join(pares) + "}"
+
+class _Metricas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tipos = {}         # nome -> (tipo, ajuda, buckets)
+        self._contadores = {}    # (nome, rotulos) -> valor
+        self._histogramas = {}   # (nome, rotulos) -> [contagem por bucket..., +Inf, soma]
+        self._coletores = []     # funções chamadas no scrape: [(nome, tipo, ajuda, [(rotulos, valor)])]
+
+    def registrar(self, nome, tipo, ajuda, buckets=None):
+        self._tipos[nome] = (tipo, ajuda, buckets)
+
+    def coletor(self, funcao):
+        self._coletores.append(funcao)
+        return funcao
+
+    def incrementar(self, nome, rotulos=(), valor=1):
+        chave = (nome, rotulos)
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+
+    def observar(self, nome, valor, rotulos=()):
+        buckets = self._tipos[nome][2]
+        i = bisect.bisect_left(buckets, valor)  # primeiro limite >= valor (le do Prometheus)
+        chave = (nome, rotulos)
+        with self._lock:
+            h = self._histogramas.get(chave)
+            if h is None:
+                h = self._histogramas[chave] = [0] * (len(buckets) + 1) + [0.0]
+            h[i] += 1
+            h[-1] += valor
+
+    def texto(self):
+        with self._lock:
+            contadores = sorted(self._contadores.items())
+            histogramas = sorted((k, list(v)) for k, v in self._histogramas.items())
+        series = {}
+        for (nome, rotulos), valor in contadores:
+            series.setdefault(nome, []).append(f"{nome}{_rotulos_texto(rotulos)} {valor}")
+        for (nome, rotulos), h in histogramas:
+            linhas = series.setdefault(nome, [])
+            acumulado = 0
+            for limite, n in zip(self._tipos[nome][2] + ("+Inf",), h):
+                acumulado += n
+                linhas.append(f"{nome}_bucket{_rotulos_texto(rotulos + (('le', limite),))} {acumulado}")
+            linhas.append(f"{nome}_sum{_rotulos_texto(rotulos)} {h[-1]}")
+            linhas.append(f"{nome}_count{_rotulos_texto(rotulos)} {acumulado}")
+        saida = []
+        for nome, (tipo, ajuda, _) in self._tipos.items():
+            if nome in series:
+                saida += [f"# HELP {nome} {ajuda}", f"# TYPE {nome} {tipo}"] + series[nome]
+        for coletor in self._coletores:
+            for nome, tipo, ajuda, amostras in coletor():
+                saida += [f"# HELP {nome} {ajuda}", f"# TYPE {nome} {tipo}"]
+                saida += [f"{nome}{_rotulos_texto(rotulos)} {valor}" for rotulos, valor in amostras]
+        return "\n".join(saida) + "\n"
+
+_metricas = _Metricas()
+_metricas.registrar("simulador_requisicoes_total", "counter", "Requisições atendidas por rota, método e status.")
+_metricas.registrar("simulador_requisicao_segundos", "histogram", "Duração das requisições por rota.", _BUCKETS_SEGUNDOS)
+_metricas.registrar("simulador_requisicao_bytes", "histogram", "Tamanho do corpo recebido por rota.", _BUCKETS_BYTES)
+_metricas.registrar("simulador_resposta_bytes", "histogram", "Tamanho do corpo devolvido por rota (exceto streaming).", _BUCKETS_BYTES)
+_metricas.registrar("simulador_etapa_segundos", "histogram", "Duração de cada etapa do cálculo.", _BUCKETS_SEGUNDOS)
+_metricas.registrar("simulador_erros_total", "counter", "Exceções tratadas por local.")
+_metricas.registrar("simulador_ia_chamadas_segundos", "histogram", "Latência de cada chamada ao Gemini por resultado.", _BUCKETS_SEGUNDOS)
+_metricas.registrar("simulador_ia_respostas_total", "counter", "Respostas do /chat?mode=ai por modo (ia ou fallback).")
+
+class _Etapa:
+    # with _Etapa("regimes"): ... -> observa simulador_etapa_segundos{etapa="regimes"}
+    __slots__ = ("rotulos", "inicio")
+
+    def __init__(self, nome):
+        self.rotulos = (("etapa", nome),)
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+
+    def __exit__(self, *exc):
+        _metricas.observar("simulador_etapa_segundos", time.perf_counter() - self.inicio, self.rotulos)
+
+def _registrar_erro(local):
+    _metricas.incrementar("simulador_erros_total", (("local", local),))
+
+class _Amostrador:
+    # Profiler por amostragem: uma thread lê a pilha da thread da requisição a cada intervalo e conta
+    # as pilhas no formato "folded" (uma linha "f1;f2;f3 N"), aceito por flamegraph.pl e speedscope.
+    def __init__(self, thread_id, intervalo):
+        self.thread_id = thread_id
+        self.intervalo = intervalo
+        self.pilhas = {}
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._rodar, name="profiler", daemon=True)
+
+    def iniciar(self):
+        self._thread.start()
+        return self
+
+    def _rodar(self):
+        while not self._parar.wait(self.intervalo):
+            frame = sys._current_frames().get(self.thread_id)
+            pilha = []
+            while frame is not None:
+                codigo = frame.f_code
+                pilha.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})")
+                frame = frame.f_back
+            if pilha:
+                chave = ";".join(reversed(pilha))
+                self.pilhas[chave] = self.pilhas.get(chave, 0) + 1
+
+    def parar(self):
+        self._parar.set()
+        self._thread.join()
+        return "".join(f"{p} {n}\n" for p, n in sorted(self.pilhas.items(), key=lambda item: -item[1]))
+
+def _profile_autorizado():
+    token = request.headers.get("X-Profile")
+    return bool(CONFIG.profile_token) and token is not None and hmac.compare_digest(token, CONFIG.profile_token)
+
+# Cache de resultados do /chat
+class _CacheResultados:
+    # LRU limitado com TTL e contadores de acerto (respostas do /chat, parâmetros da previsão)
+    def __init__(self, max_itens, ttl):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chave):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is not None and time.monotonic() - item[0] <= self.ttl:
+                self._itens.move_to_end(chave)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                del self._itens[chave]
+            self.misses += 1
+            return None
+
+    def put(self, chave, valor):
+        if self.max_itens <= 0:
+            return
+        with self._lock:
+            self._itens[chave] = (time.monotonic(), valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entradas": len(self._itens),
+                "maxEntradas": self.max_itens,
+                "ttlSegundos": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "taxaAcerto": (self.hits / total) if total else 0.0
+            }
+
+_cache_resultados = _CacheResultados(CONFIG.cache_max_entries, CONFIG.cache_ttl_seconds)
+# parâmetros ajustados da previsão local (sem TTL: dependem só do histórico)
+_cache_previsao = _CacheResultados(CONFIG.forecast_cache_max_entries, float("inf"))
+# perfis das requisições com X-Profile, consultados em /metrics/profile/<id>
+_perfis = _CacheResultados(CONFIG.profile_max_guardados, 3600)
+
+# Histórico persistente por empresa (/historico)
+# Os meses ficam em SQLite, um registro por (companyId, ano, mes), com o JSON do mês como recebido.
+# Junto, por empresa, ficam somas mantidas a cada upsert (entra o mês novo, sai a versão anterior):
+# - médias do preenchimento: soma exata dos valores brutos (inteiro + escala decimal) e contagem,
+#   com a mesma regra de _media_centavos;
+# - previsão: por série, somas em inteiros (centavos, t, t^2, t*y e os logs em _LOG_ESCALA), no total e
+#   por mês do calendário, suficientes para o ajuste de _previsao_dos_agregados sem reler os meses.
+# Todas as somas são exatas: não dependem da ordem dos meses, e retirar um mês desfaz a soma sem resíduo.
+# Assim um /chat com só companyId e year não carrega nem percorre o histórico.
+_HISTORICO_ORIGEM = 2000 * 12  # t = meses desde jan/2000 (múltiplo de 12: t % 12 é o mês do calendário)
+# log(centavos) é 0 ou >= log(2), e um float >= 0.5 vezes 2^53 é inteiro: o log entra nas somas sem arredondar
+_LOG_ESCALA = 1 << 53
+_AGREGADOS_FORMATO = 2  # agregados gravados em outro formato são refeitos a partir dos meses
+
+_HISTORICO_SCHEMA = """
+CREATE TABLE IF NOT EXISTS historico_mensal (
+    company_id TEXT NOT NULL,
+    ano INTEGER NOT NULL,
+    mes INTEGER NOT NULL,
+    bruto TEXT NOT NULL,
+    atualizado_em REAL NOT NULL,
+    PRIMARY KEY (company_id, ano, mes)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS historico_agregados (
+    company_id TEXT PRIMARY KEY,
+    versao INTEGER NOT NULL,
+    agregados TEXT NOT NULL
+);
+"""
+
+def _serie_historico_vazia():
+    # n: meses com valor; st/stt/sv/stv: somas de t, t^2, centavos e t*centavos; sl/stl: idem com log(centavos)
+    return {"n": 0, "nao_positivos": 0, "st": 0, "stt": 0, "sv": 0, "stv": 0, "sl": 0, "stl": 0,
+            "mes_n": [0] * 12, "mes_st": [0] * 12, "mes_sv": [0] * 12, "mes_sl": [0] * 12}
+
+def _agregados_historico_vazios():
+    return {
+        "formato": _AGREGADOS_FORMATO,
+        "meses": 0,
+        "t_min": None,
+        "t_max": None,
+        # por chave: [soma, escala, n, soma dos módulos] dos valores brutos (valor = soma * 10^-escala)
+        "medias": {k: [0, 0, 0, 0] for k in FORECAST_SERIES},
+        "series": {k: _serie_historico_vazia() for k in FORECAST_SERIES},
+    }
+
+def _somar_mes_historico(agregados, mes, sinal):
+    # aplica (sinal=1) ou retira (sinal=-1) a contribuição de um mês nas somas
+    t = mes["ano"] * 12 + mes["mes"] - 1 - _HISTORICO_ORIGEM
+    c = t % 12
+    for k in FORECAST_SERIES:
+        media = agregados["medias"][k]
+        r = _racional(mes.get(k, "0") or "0")
+        if r is not None:
+            v, escala = r
+            if escala > media[1]:
+                media[0] *= 10 ** (escala - media[1])
+                media[1] = escala
+            else:
+                v *= 10 ** (media[1] - escala)
+            media[0] += sinal * v
+            media[2] += sinal
+            media[3] += sinal * abs(v)
+        valor = mes.get(k)
+        r = _racional(valor) if valor is not None else None
+        if r is None:
+            continue
+        centavos = _centavos_de(r[0], -r[1])
+        serie = agregados["series"][k]
+        serie["n"] += sinal
+        serie["st"] += sinal * t
+        serie["stt"] += sinal * t * t
+        serie["sv"] += sinal * centavos
+        serie["stv"] += sinal * t * centavos
+        serie["mes_n"][c] += sinal
+        serie["mes_st"][c] += sinal * t
+        serie["mes_sv"][c] += sinal * centavos
+        if centavos > 0:
+            log = int(math.log(centavos) * _LOG_ESCALA)
+            serie["sl"] += sinal * log
+            serie["stl"] += sinal * t * log
+            serie["mes_sl"][c] += sinal * log
         else:
-            val = (imposto_total * (f / total_fat)).quantize(Decimal(".01"), rounding=ROUND_HALF_UP)
-        monthly.append((i, val))
-        accumulated += val
-    # adjust last month
-    diff = imposto_total - accumulated
-    if monthly:
-        last_index, last_val = monthly[-1]
-        monthly[-1] = (last_index, (last_val + diff).quantize(Decimal(".01"), rounding=ROUND_HALF_UP))
-    return monthly
+            serie["nao_positivos"] += sinal
+
+def _agregados_de_meses(meses):
+    # somas de uma lista de meses (ano/mes inteiros, valores brutos ou registros validados); repetições: vale o
+    # último registro do mês
+    por_mes = {(int(m["ano"]), int(m["mes"])): m for m in meses}
+    agregados = _agregados_historico_vazios()
+    for (ano, m), mes in sorted(por_mes.items()):
+        t = ano * 12 + m - 1 - _HISTORICO_ORIGEM
+        agregados["meses"] += 1
+        agregados["t_min"] = t if agregados["t_min"] is None else agregados["t_min"]
+        agregados["t_max"] = t
+        _somar_mes_historico(agregados, mes, 1)
+    return agregados
+
+def _previsao_dos_agregados(agregados):
+    # ajuste a partir das somas, com t relativo ao último mês; os termos centrados em t_max saem das
+    # somas inteiras sem arredondar, e cada divisão int/int é arredondada uma vez só
+    tf = agregados["t_max"] if agregados["t_max"] is not None else 0
+    a, b, sazonal, multiplicativo, n_series = [], [], [], [], []
+    for k in FORECAST_SERIES:
+        s = agregados["series"][k]
+        n = s["n"]
+        mult = s["nao_positivos"] == 0
+        sy, sty, mes_sy = (s["sl"], s["stl"], s["mes_sl"]) if mult else (s["sv"], s["stv"], s["mes_sv"])
+        escala = _LOG_ESCALA if mult else 1
+        st = s["st"] - n * tf
+        stt = s["stt"] - 2 * tf * s["st"] + n * tf * tf
+        sty = sty - tf * sy
+        det = n * stt - st * st
+        bi = (n * sty - st * sy) / (det * escala) if det > 0 else 0.0
+        limite = math.log1p(CONFIG.forecast_max_crescimento) if mult else math.inf
+        bi = min(max(bi, -limite), limite)
+        ai = (sy / escala - bi * st) / max(n, 1)
+        saz = [0.0] * 12
+        if n >= CONFIG.forecast_min_sazonal:
+            for c in range(12):
+                nc = s["mes_n"][c]
+                if nc:
+                    saz[c] = (mes_sy[c] / escala - ai * nc - bi * (s["mes_st"][c] - nc * tf)) / nc
+            media = sum(saz) / 12
+            saz = [v - media for v in saz]
+        a.append(ai)
+        b.append(bi)
+        sazonal.append(saz)
+        multiplicativo.append(mult)
+        n_series.append(n)
+    return {
+        "valido": np.array(n_series) >= CONFIG.forecast_min_meses,
+        "multiplicativo": np.array(multiplicativo),
+        "a": np.array(a),
+        "b": np.array(b),
+        "sazonal": np.array(sazonal),
+        "t_final": tf + _HISTORICO_ORIGEM
+    }
+
+def _validar_mes_historico(i, mes, erros):
+    # mesma validação dos meses do /chat (_validar_mes); o mês é guardado como veio, com ano/mes em int.
+    # Os problemas vão para 'erros'.
+    registro = _validar_mes(mes, "historicalMonthly", i, erros)
+    if registro is None or "ano" not in registro or "mes" not in registro:
+        return None
+    return dict(mes, ano=registro["ano"], mes=registro["mes"])
+
+_HISTORICO_ID_INTEIRO = re.compile(r"-?[0-9]+")
+
+def _chave_empresa(company_id):
+    # companyId no banco com o tipo do JSON: 123 -> '123', "123" -> '"123"'
+    return json.dumps(company_id, ensure_ascii=False)
+
+class _HistoricoEmpresas:
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._conexao = None
+        self._lock = threading.Lock()
+        # resumos prontos para o cálculo, por (empresa, versão): nova versão invalida sozinha
+        self._resumos = _CacheResultados(CONFIG.forecast_cache_max_entries, float("inf"))
+
+    def _conectar(self, criar):
+        # conexão aberta no primeiro uso (depois do fork dos workers); leitura não cria o arquivo
+        if self._conexao is None:
+            if not self.caminho:
+                return None
+            if not criar and self.caminho != ":memory:" and not os.path.exists(self.caminho):
+                return None
+            conexao = sqlite3.connect(self.caminho, check_same_thread=False, isolation_level=None)
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute("PRAGMA busy_timeout=5000")
+            conexao.executescript(_HISTORICO_SCHEMA)
+            self._migrar_chaves(conexao)
+            self._conexao = conexao
+        return self._conexao
+
+    @staticmethod
+    def _migrar_chaves(conexao):
+        # versão 0 gravava str(companyId), e 123 e "123" caíam na mesma empresa; a chave agora é o JSON do
+        # companyId. Chaves antigas que são um inteiro em JSON ficam como id inteiro, as demais viram texto.
+        conexao.execute("BEGIN IMMEDIATE")
+        try:
+            if conexao.execute("PRAGMA user_version").fetchone()[0] < 1:
+                for (antiga,) in conexao.execute("SELECT company_id FROM historico_agregados").fetchall():
+                    if _HISTORICO_ID_INTEIRO.fullmatch(antiga) is None or str(int(antiga)) != antiga:
+                        for tabela in ("historico_agregados", "historico_mensal"):
+                            conexao.execute(f"UPDATE {tabela} SET company_id = ? WHERE company_id = ?",
+                                            (_chave_empresa(antiga), antiga))
+                conexao.execute("PRAGMA user_version = 1")
+            conexao.execute("COMMIT")
+        except BaseException:
+            conexao.execute("ROLLBACK")
+            raise
+
+    def ingerir(self, company_id, meses):
+        # upsert dos meses (já validados); só meses novos ou alterados mexem nas somas
+        chave = _chave_empresa(company_id)
+        por_mes = {(m["ano"], m["mes"]): m for m in meses}  # repetições: vale a última
+        contagem = {"inseridos": 0, "atualizados": 0, "inalterados": 0}
+        with self._lock:
+            conexao = self._conectar(criar=True)
+            if conexao is None:
+                raise RuntimeError("Histórico desabilitado (HISTORICO_DB vazio).")
+            conexao.execute("BEGIN IMMEDIATE")
+            try:
+                linha = conexao.execute("SELECT versao, agregados FROM historico_agregados WHERE company_id = ?", (chave,)).fetchone()
+                versao, agregados = (linha[0], self._agregados(conexao, chave, linha[1])) if linha else (0, _agregados_historico_vazios())
+                existentes = {}
+                anos = sorted({ano for ano, _ in por_mes})
+                for inicio in range(0, len(anos), 500):
+                    lote = anos[inicio:inicio + 500]
+                    existentes.update(((a, m), b) for a, m, b in conexao.execute(
+                        f"SELECT ano, mes, bruto FROM historico_mensal WHERE company_id = ? AND ano IN ({','.join('?' * len(lote))})",
+                        (chave, *lote)))
+                agora = time.time()
+                gravar = []
+                for (ano, m), mes in sorted(por_mes.items()):
+                    bruto = json.dumps(mes, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+                    anterior = existentes.get((ano, m))
+                    if anterior == bruto:
+                        contagem["inalterados"] += 1
+                        continue
+                    if anterior is None:
+                        contagem["inseridos"] += 1
+                        agregados["meses"] += 1
+                        t = ano * 12 + m - 1 - _HISTORICO_ORIGEM
+                        agregados["t_min"] = t if agregados["t_min"] is None else min(agregados["t_min"], t)
+                        agregados["t_max"] = t if agregados["t_max"] is None else max(agregados["t_max"], t)
+                    else:
+                        contagem["atualizados"] += 1
+                        _somar_mes_historico(agregados, json.loads(anterior), -1)
+                    _somar_mes_historico(agregados, mes, 1)
+                    gravar.append((chave, ano, m, bruto, agora))
+                if gravar:
+                    versao += 1
+                    conexao.executemany("INSERT OR REPLACE INTO historico_mensal VALUES (?, ?, ?, ?, ?)", gravar)
+                    conexao.execute("INSERT OR REPLACE INTO historico_agregados VALUES (?, ?, ?)",
+                                    (chave, versao, json.dumps(agregados, separators=(",", ":"))))
+                conexao.execute("COMMIT")
+            except BaseException:
+                conexao.execute("ROLLBACK")
+                raise
+        contagem.update({"companyId": company_id, "versao": versao, "totalMeses": agregados["meses"]})
+        return contagem
+
+    @staticmethod
+    def _agregados(conexao, chave, texto):
+        # somas gravadas; em outro formato (ex.: logs em float, antes de _LOG_ESCALA) são refeitas a partir dos
+        # meses armazenados, e a próxima ingestão grava o formato atual
+        agregados = json.loads(texto)
+        if agregados.get("formato") != _AGREGADOS_FORMATO:
+            linhas = conexao.execute("SELECT bruto FROM historico_mensal WHERE company_id = ?", (chave,)).fetchall()
+            agregados = _agregados_de_meses([json.loads(b) for (b,) in linhas])
+        return agregados
+
+    def versao(self, company_id):
+        with self._lock:
+            conexao = self._conectar(criar=False)
+            if conexao is None:
+                return None
+            linha = conexao.execute("SELECT versao FROM historico_agregados WHERE company_id = ?", (_chave_empresa(company_id),)).fetchone()
+        return linha[0] if linha else None
+
+    def meses(self, company_id):
+        # meses armazenados, em ordem cronológica, como recebidos
+        with self._lock:
+            conexao = self._conectar(criar=False)
+            if conexao is None:
+                return []
+            linhas = conexao.execute("SELECT bruto FROM historico_mensal WHERE company_id = ? ORDER BY ano, mes",
+                                     (_chave_empresa(company_id),)).fetchall()
+        return [json.loads(b) for (b,) in linhas]
+
+    def resumo(self, company_id):
+        # {"versao", "ano_inicial", "medias": [(centavos, nao_nula) x 4], "previsao": params | None}; None sem histórico
+        versao = self.versao(company_id)
+        if versao is None:
+            return None
+        chave = (_chave_empresa(company_id), versao)
+        resumo = self._resumos.get(chave)
+        if resumo is not None:
+            return resumo
+        with self._lock:
+            linha = self._conexao.execute("SELECT versao, agregados FROM historico_agregados WHERE company_id = ?",
+                                          (_chave_empresa(company_id),)).fetchone()
+            versao, agregados = linha[0], self._agregados(self._conexao, _chave_empresa(company_id), linha[1])
+        medias = []
+        for k in FORECAST_SERIES:
+            soma, escala, n, soma_modulos = agregados["medias"][k]
+            if soma_modulos >= _LIMITE_PREC:
+                # somas parciais podem passar da precisão: refaz pela rotina original, na ordem dos meses
+                medias.append(_media_centavos(self.meses(company_id), k))
+            elif n == 0:
+                medias.append((0, False))
+            else:
+                medias.append((_centavos_de(*_div_sig(soma, n * 10 ** escala)), soma != 0))
+        resumo = {
+            "versao": versao,
+            "ano_inicial": (agregados["t_min"] + _HISTORICO_ORIGEM) // 12,
+            "medias": medias,
+            "previsao": _previsao_dos_agregados(agregados) if np is not None else None,
+        }
+        self._resumos.put(chave, resumo)
+        return resumo
+
+    def info(self, company_id):
+        with self._lock:
+            conexao = self._conectar(criar=False)
+            linha = conexao.execute("SELECT versao, agregados FROM historico_agregados WHERE company_id = ?",
+                                    (_chave_empresa(company_id),)).fetchone() if conexao is not None else None
+        if linha is None:
+            return None
+        agregados = json.loads(linha[1])
+        primeiro, ultimo = (agregados[k] + _HISTORICO_ORIGEM for k in ("t_min", "t_max"))
+        return {
+            "companyId": company_id,
+            "versao": linha[0],
+            "totalMeses": agregados["meses"],
+            "primeiroMes": {"ano": primeiro // 12, "mes": primeiro % 12 + 1},
+            "ultimoMes": {"ano": ultimo // 12, "mes": ultimo % 12 + 1},
+        }
+
+_historico = _HistoricoEmpresas(CONFIG.historico_db)
+
+def _ordenado(lista, chave):
+    # ordenação estável; entradas malformadas ficam na ordem original (o cálculo reporta o erro)
+    try:
+        return sorted(lista, key=chave)
+    except Exception:
+        return lista
+
+def _taxa_normalizada(taxa):
+    # "0.12" e "0.120" são a mesma alíquota
+    num, den = taxa
+    while den > 1 and num % 10 == 0:
+        num //= 10
+        den //= 10
+    return [num, den]
+
+_CONFIG_PREVISAO = ("forecast_min_meses", "forecast_min_sazonal", "forecast_max_crescimento", "forecast_amortecimento")
+
+def _chave_resultado(dados, aliquotas):
+    # Hash canônico da entrada normalizada: meses ordenados e alíquotas efetivas (já com os
+    # DEFAULT_* aplicados), de modo que mudar os padrões gera chaves novas.
+    target = dados.get("targetYearMonthly", []) or []
+    historical = dados.get("historicalMonthly", []) or []
+    # histórico armazenado: a versão muda a cada ingestão que altera algum mês
+    versao_historico = _historico.versao(dados.get("companyId")) if "historicalMonthly" not in dados else None
+    try:
+        # ano usado nos meses completados (depende do primeiro item, não da ordem dos demais)
+        ano_padrao = target[0]["ano"] if target else (historical[0]["ano"] if historical else None)
+    except Exception:
+        ano_padrao = None
+    normalizado = {
+        "metodo": METODO,
+        "companyId": dados.get("companyId"),
+        "year": dados.get("year"),
+        "useAiForecast": bool(dados.get("useAiForecast", False)),
+        "aliquotas": [_taxa_normalizada(t) for t in aliquotas],
+        "anoPadrao": ano_padrao,
+        "historicoVersao": versao_historico,
+        # target por mês (ordem estável preserva qual repetição vence); histórico por (ano, mês)
+        "targetYearMonthly": _ordenado(target, lambda m: int(m["mes"])),
+        "historicalMonthly": _ordenado(historical, lambda m: (int(m["ano"]), int(m["mes"]))),
+    }
+    if normalizado["useAiForecast"]:
+        # a projeção depende dos FORECAST_*: mudar um deles no deploy gera chaves (e ETags) novas
+        normalizado["previsao"] = [getattr(CONFIG, campo) for campo in _CONFIG_PREVISAO]
+    return hashlib.blake2b(_json_bytes(normalizado), digest_size=16).hexdigest()
+
+# Caminho opcional com o modelo (/chat?mode=ai)
+# As chamadas rodam num event loop próprio em thread de fundo, compartilhado por todos os workers
+# do processo: limite de concorrência, timeout por chamada, retry com backoff e, estourado o prazo
+# total, a resposta volta a ser o cálculo determinístico do backend. O PROMPT_REFORMA vai uma única
+# vez para o cache de contexto do Gemini e as chamadas só referenciam o cache.
+PROMPT_VERSAO = "reforma_v2"
+
+class _ClienteIAAssincrono:
+    def __init__(self, cliente, modelo, max_concorrencia, timeout, tentativas, backoff):
+        self.cliente = cliente
+        self.modelo = modelo
+        self.max_concorrencia = max_concorrencia
+        self.timeout = timeout
+        self.tentativas = max(1, tentativas)
+        self.backoff = backoff
+        self._loop = None
+        self._lock = threading.Lock()
+        self._cache_prompt = None  # (nome do cachedContent, expira_em)
+        self._cache_prompt_indisponivel_ate = 0.0
+        self._criacao_prompt = None  # criação do cachedContent em andamento, aguardada por todas as chamadas
+
+    def _garantir_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="cliente-ia", daemon=True).start()
+                self._semaforo = asyncio.Semaphore(self.max_concorrencia)
+                self._loop = loop
+            return self._loop
+
+    def gerar(self, entrada, prazo):
+        # bloqueia o worker por no máximo 'prazo' segundos; TimeoutError se estourar
+        futuro = asyncio.run_coroutine_threadsafe(self._gerar(entrada), self._garantir_loop())
+        try:
+            return futuro.result(timeout=prazo)
+        except concurrent.futures.TimeoutError:
+            futuro.cancel()
+            raise TimeoutError(f"Modelo não respondeu em {prazo}s.")
+
+    async def _config(self):
+        # roda no loop do cliente (uma thread só): o estado do cache do prompt não precisa de lock
+        from google.genai import types
+        agora = time.monotonic()
+        if self._cache_prompt is not None and self._cache_prompt[1] <= agora:
+            self._cache_prompt = None
+        if self._cache_prompt is None and agora >= self._cache_prompt_indisponivel_ate:
+            if self._criacao_prompt is None:
+                self._criacao_prompt = asyncio.ensure_future(self._criar_cache_prompt())
+            # shield: uma chamada cancelada (prazo estourado) não cancela a criação que as outras aguardam
+            await asyncio.shield(self._criacao_prompt)
+        if self._cache_prompt is not None:
+            return types.GenerateContentConfig(cached_content=self._cache_prompt[0], response_mime_type="application/json")
+        return types.GenerateContentConfig(system_instruction=PROMPT_REFORMA, response_mime_type="application/json")
+
+    async def _criar_cache_prompt(self):
+        # uma criação por vez, com o mesmo timeout das chamadas ao modelo
+        from google.genai import types
+        inicio = time.monotonic()
+        try:
+            cache = await asyncio.wait_for(self.cliente.aio.caches.create(
+                model=self.modelo,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=PROMPT_REFORMA,
+                    display_name=f"prompt-{PROMPT_VERSAO}",
+                    ttl=f"{int(CONFIG.ai_prompt_cache_ttl_seconds)}s"
+                )
+            ), self.timeout)
+            # renova um pouco antes de expirar no servidor
+            self._cache_prompt = (cache.name, inicio + CONFIG.ai_prompt_cache_ttl_seconds * 0.9)
+        except Exception:
+            # ex.: prompt abaixo do mínimo de tokens do cache de contexto para o modelo, ou timeout
+            logger.warning("Cache de contexto do prompt indisponível; enviando o prompt como system_instruction.", exc_info=True)
+            self._cache_prompt_indisponivel_ate = time.monotonic() + CONFIG.ai_prompt_cache_ttl_seconds
+        finally:
+            self._criacao_prompt = None
+
+    async def _gerar(self, entrada):
+        async with self._semaforo:
+            for tentativa in range(self.tentativas):
+                config = await self._config()
+                try:
+                    inicio = time.perf_counter()
+                    resp = await asyncio.wait_for(
+                        self.cliente.aio.models.generate_content(model=self.modelo, contents=entrada, config=config),
+                        self.timeout
+                    )
+                    _metricas.observar("simulador_ia_chamadas_segundos", time.perf_counter() - inicio, (("resultado", "ok"),))
+                    return _extract_text_from_response(resp)
+                except Exception as e:
+                    from google.genai import errors as genai_errors
+                    _metricas.observar("simulador_ia_chamadas_segundos", time.perf_counter() - inicio,
+                                       (("resultado", "timeout" if isinstance(e, asyncio.TimeoutError) else "erro"),))
+                    if config.cached_content and isinstance(e, genai_errors.ClientError):
+                        # o cache pode ter expirado/sido removido no servidor: recria na próxima tentativa
+                        self._cache_prompt = None
+                    if tentativa + 1 >= self.tentativas:
+                        raise
+                    espera = self.backoff * (2 ** tentativa) * (1 + random.random())
+                    logger.warning("Chamada ao modelo falhou (%s); nova tentativa em %.2fs.", e.__class__.__name__, espera)
+                    await asyncio.sleep(espera)
+
+_cliente_ia = None
+_cliente_ia_lock = threading.Lock()
+_cache_ia = _CacheResultados(CONFIG.ai_cache_max_entries, CONFIG.ai_cache_ttl_seconds)
+
+@_metricas.coletor
+def _metricas_caches():
+    caches = (("resultados", _cache_resultados), ("previsao", _cache_previsao), ("historico", _historico._resumos),
+              ("ia", _cache_ia))
+    stats = [((("cache", nome),), c.stats()) for nome, c in caches]
+    return [
+        ("simulador_cache_hits_total", "counter", "Acertos por cache.", [(r, st["hits"]) for r, st in stats]),
+        ("simulador_cache_misses_total", "counter", "Faltas por cache.", [(r, st["misses"]) for r, st in stats]),
+        ("simulador_cache_taxa_acerto", "gauge", "Acertos / consultas desde o início do processo.", [(r, st["taxaAcerto"]) for r, st in stats]),
+        ("simulador_cache_entradas", "gauge", "Entradas mantidas por cache.", [(r, st["entradas"]) for r, st in stats]),
+    ]
+
+def _obter_cliente_ia():
+    global _cliente_ia
+    with _cliente_ia_lock:
+        if _cliente_ia is None:
+            _cliente_ia = _ClienteIAAssincrono(_obter_cliente_genai(), CONFIG.gemini_model, CONFIG.ai_max_concorrencia, CONFIG.ai_timeout_seconds,
+                                               CONFIG.ai_tentativas, CONFIG.ai_backoff_seconds)
+        return _cliente_ia
+
+def _json_do_modelo(texto):
+    # o modelo às vezes devolve o JSON entre ```json ... ```
+    texto = (texto or "").strip()
+    if texto.startswith("```"):
+        texto = texto.split("\n", 1)[1] if "\n" in texto else ""
+        texto = texto.rsplit("```", 1)[0]
+    resultado = _json_loads(texto)
+    if not isinstance(resultado, dict):
+        raise ValueError("Resposta do modelo não é um objeto JSON.")
+    _conferir_resposta_modelo(resultado)
+    return resultado
+
+# formato exigido pelo PROMPT_REFORMA; uma resposta fora dele conta como falha do modelo (fallback, sem cache)
+_MODELO_CAMPOS = {"companyId": (str, int), "year": (int, str), "metodo": (str,), "faturamentoTotalAnual": (str,),
+                  "folhaTotalAnual": (str,), "valorAdicionado": (str,), "baseMensal": (list,), "regimes": (list,),
+                  "recomendado": (str,)}
+_MODELO_CAMPOS_REGIME = {"nome": (str,), "impostoTotalAnual": (str,), "aliquotaEfetiva": (str, int, float),
+                         "detalhesTributos": (dict,), "impostoTotalMensal": (list,), "observacoes": (str, list)}
+_MODELO_TRIBUTOS = ("CBS", "IBS", "IRPJ", "CSLL", "CPP", "IS")
+_MODELO_VALOR = re.compile(r"-?[0-9]+\.[0-9]{2}")
+
+def _conferir_campos(obj, campos, caminho):
+    if not isinstance(obj, dict):
+        raise ValueError(f"Resposta do modelo: {caminho or 'raiz'} não é um objeto.")
+    for nome, tipos in campos.items():
+        if type(obj.get(nome)) not in tipos:
+            raise ValueError(f"Resposta do modelo: {caminho}{nome} ausente ou com tipo inválido.")
+
+def _conferir_valor(valor, caminho):
+    if type(valor) is not str or not _MODELO_VALOR.fullmatch(valor):
+        raise ValueError(f"Resposta do modelo: {caminho} não é um valor com duas casas.")
+
+def _conferir_resposta_modelo(resultado):
+    _conferir_campos(resultado, _MODELO_CAMPOS, "")
+    for nome in ("faturamentoTotalAnual", "folhaTotalAnual", "valorAdicionado"):
+        _conferir_valor(resultado[nome], nome)
+    if len(resultado["baseMensal"]) != 12 or not all(isinstance(m, dict) for m in resultado["baseMensal"]):
+        raise ValueError("Resposta do modelo: baseMensal deve ter 12 meses.")
+    if [r.get("nome") if isinstance(r, dict) else None for r in resultado["regimes"]] != list(REGIMES_NOMES):
+        raise ValueError("Resposta do modelo: regimes devem ser os 3 do prompt, na ordem.")
+    for i, regime in enumerate(resultado["regimes"]):
+        caminho = f"regimes[{i}]."
+        _conferir_campos(regime, _MODELO_CAMPOS_REGIME, caminho)
+        _conferir_valor(regime["impostoTotalAnual"], caminho + "impostoTotalAnual")
+        for tributo in _MODELO_TRIBUTOS:
+            _conferir_valor(regime["detalhesTributos"].get(tributo), f"{caminho}detalhesTributos.{tributo}")
+        mensal = regime["impostoTotalMensal"]
+        if len(mensal) != 12:
+            raise ValueError(f"Resposta do modelo: {caminho}impostoTotalMensal deve ter 12 meses.")
+        for j, m in enumerate(mensal):
+            _conferir_campos(m, {"mes": (int, str)}, f"{caminho}impostoTotalMensal[{j}].")
+            _conferir_valor(m.get("valor"), f"{caminho}impostoTotalMensal[{j}].valor")
+    if resultado["recomendado"] not in REGIMES_NOMES:
+        raise ValueError("Resposta do modelo: recomendado não é um dos regimes.")
+
+def _entrada_modelo(dados, aliquotas):
+    # entrada canônica enviada após o prompt, com as alíquotas efetivas que o prompt espera
+    entrada = dict(dados)
+    entrada.pop("mode", None)
+    if "historicalMonthly" not in entrada:
+        entrada["historicalMonthly"] = _historico.meses(dados.get("companyId"))
+    for lista in _LISTAS_MESES:
+        if lista in entrada:
+            entrada[lista] = [_texto_mes(m) for m in entrada[lista]]
+    for nome, (num, den) in zip(("DEFAULT_CBS_RATE", "DEFAULT_IBS_RATE", "DEFAULT_CPP_RATE", "SIMPLIFIED_SIMPLES_SHARE"), aliquotas):
+        entrada[nome] = str(_CONTEXTO_DECIMAL.divide(Decimal(num), Decimal(den)))
+    return json.dumps(entrada, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+def _responder_ia(dados, aliquotas, chave):
+    chave_ia = f"{PROMPT_VERSAO}:{CONFIG.gemini_model}:{chave}"
+    resultado = _cache_ia.get(chave_ia)
+    status_cache = "HIT"
+    if resultado is None:
+        status_cache = "MISS"
+        try:
+            texto = _obter_cliente_ia().gerar(_entrada_modelo(dados, aliquotas), CONFIG.ai_prazo_seconds)
+            resultado = _json_do_modelo(texto)
+        except Exception as e:
+            logger.warning("Modelo indisponível para companyId=%s (%s); usando o cálculo do backend.", dados.get("companyId"), e)
+            _metricas.incrementar("simulador_ia_respostas_total", (("modo", "fallback"),))
+            resposta = _responder_deterministico(dados, aliquotas, chave)
+            resposta.headers["X-Modo"] = "fallback"
+            return resposta
+        _cache_ia.put(chave_ia, resultado)
+    _metricas.incrementar("simulador_ia_respostas_total", (("modo", "ia"),))
+    resposta = jsonify(resultado)
+    resposta.headers["X-Modo"] = "ia"
+    resposta.headers["X-Cache"] = status_cache
+    return resposta
+
+def _responder_deterministico(dados, aliquotas, chave):
+    etag = f'"{chave}"'
+    # a chave identifica a resposta: se o cliente já tem este ETag, nem é preciso calcular
+    if request.if_none_match.contains(chave):
+        return current_app.response_class(status=304, headers={"ETag": etag})
+
+    corpo = _cache_resultados.get(chave)
+    status_cache = "HIT"
+    if corpo is None:
+        status_cache = "MISS"
+        resposta = _simular(dados, aliquotas)
+        # retornar JSON já calculado pelo backend (não necessariamente chamar o modelo aqui)
+        with _Etapa("serializacao"):
+            corpo = _json_bytes(resposta)
+        _cache_resultados.put(chave, corpo)
+
+    return current_app.response_class(corpo, status=200, mimetype="application/json",
+                              headers={"ETag": etag, "X-Cache": status_cache})
+
+# Varredura de alíquotas (what-if): base de 12 meses e agregados calculados uma vez,
+# cada ponto da grade cbsRate x ibsRate x cppRate x simplesShare avaliado sobre eles.
+_SWEEP_DIMENSOES = ("cbsRate", "ibsRate", "cppRate", "simplesShare")
+_SWEEP_BLOCO = 65536  # pontos avaliados por vez (limita a memória no streaming)
+
+def _rotulo_taxa(taxa):
+    num, den = taxa
+    return str(Decimal(num).scaleb(-(len(str(den)) - 1)))
+
+def _valores_grade(nome, spec, padrao, erros):
+    # taxas de uma dimensão: lista explícita, {"inicio", "fim", "passo"} ou ausente (alíquota da própria empresa).
+    # Cada valor passa por _valor_numerico, como as alíquotas da entrada; os problemas vão para 'erros'
+    # e a dimensão volta None.
+    campo = f"grade.{nome}"
+    if spec is None:
+        return [padrao]
+    if isinstance(spec, list) and spec:
+        valores = []
+        for i, v in enumerate(spec):
+            try:
+                n, k = _valor_numerico(v)
+            except ValueError as e:
+                erros.append(_erro_campo(f"{campo}[{i}]", e))
+                continue
+            valores.append((n, 10 ** k))
+        return valores if len(valores) == len(spec) else None
+    if isinstance(spec, dict):
+        limites = []
+        for chave in ("inicio", "fim", "passo"):
+            if spec.get(chave) is None:
+                erros.append(_erro_campo(f"{campo}.{chave}", "é obrigatório"))
+                continue
+            try:
+                n, k = _valor_numerico(spec[chave])
+            except ValueError as e:
+                erros.append(_erro_campo(f"{campo}.{chave}", e))
+                continue
+            limites.append(Decimal(f"{n}E{-k}"))
+        if len(limites) < 3:
+            return None
+        inicio, fim, passo = limites
+        if passo <= 0 or fim < inicio:
+            erros.append(_erro_campo(campo, "precisa de passo > 0 e fim >= inicio"))
+            return None
+        with localcontext(_CONTEXTO_DECIMAL):
+            quantidade = int((fim - inicio) / passo) + 1
+            if quantidade > CONFIG.sweep_max_pontos:
+                erros.append(_erro_campo(campo, f"excede o limite de {CONFIG.sweep_max_pontos} pontos"))
+                return None
+            return [_taxa(inicio + k * passo) for k in range(quantidade)]
+    erros.append(_erro_campo(campo, "deve ser uma lista ou um objeto {inicio, fim, passo}"))
+    return None
+
+def _avaliar_grade(agregados, dimensoes, inicio, fim):
+    # pontos [inicio, fim) da grade (ordem lexicográfica das dimensões) -> (totais N x 3, recomendado N)
+    tamanhos = [len(d) for d in dimensoes]
+    if np is not None:
+        indices = np.unravel_index(np.arange(inicio, fim), tamanhos)
+        taxas = tuple(
+            (np.array([t[0] for t in d])[i], np.array([t[1] for t in d])[i])
+            for d, i in zip(dimensoes, indices)
+        )
+        try:
+            resultado = _calcular_regimes_vetorial(_matriz_agregados([agregados]), taxas)
+            return resultado["total"].tolist(), resultado["recomendado"].tolist(), indices
+        except OverflowError:
+            pass
+    totais, recomendados, indices = [], [], [[] for _ in dimensoes]
+    for ponto in range(inicio, fim):
+        resto, idx = ponto, []
+        for tamanho in reversed(tamanhos):
+            resto, i = divmod(resto, tamanho)
+            idx.append(i)
+        idx.reverse()
+        tributos = _calcular_regimes(agregados, tuple(d[i] for d, i in zip(dimensoes, idx)))
+        linha = [t["total"] for t in tributos]
+        totais.append(linha)
+        recomendados.append(min(range(3), key=linha.__getitem__))
+        for lista, i in zip(indices, idx):
+            lista.append(i)
+    return totais, recomendados, indices
+
+def _linhas_grade(agregados, dimensoes, rotulos, total_pontos):
+    for inicio in range(0, total_pontos, _SWEEP_BLOCO):
+        fim = min(inicio + _SWEEP_BLOCO, total_pontos)
+        totais, recomendados, indices = _avaliar_grade(agregados, dimensoes, inicio, fim)
+        colunas_idx = [list(i) for i in indices]
+        for k in range(fim - inicio):
+            yield [rotulos[j][colunas_idx[j][k]] for j in range(4)] + \
+                  [_fmt_centavos(v) for v in totais[k]] + [recomendados[k]]
+
+# Horizonte plurianual (transição 2026-2033): um resultado do /chat por ano, com a base de cada ano
+# derivada da anterior (crescimento ajustado na previsão local) em vez de recalculada do zero.
+def _base_ano_seguinte(base_mensal, ano, params):
+    # aplica a cada série a tendência de 12 meses (amortecida como em _projetar_meses) entre o mesmo mês
+    # do ano anterior e o de 'ano'; sem crescimento ajustado os valores são compartilhados.
+    # Retorna (nova_base, mudou).
+    series = []
+    if params is not None:
+        series = [i for i in range(len(FORECAST_SERIES)) if params["valido"][i] and params["b"][i] != 0]
+    if not series:
+        return [dict(b, ano=ano) for b in base_mensal], False
+    ts = np.array([(ano - 1) * 12 + b["mes"] - 1 for b in base_mensal], dtype=float) - params["t_final"]
+    passos = (_passos_amortecidos(ts + 12) - _passos_amortecidos(ts)).tolist()
+    nova = [dict(b, ano=ano) for b in base_mensal]
+    for i in series:
+        serie, b_i, multiplicativo = FORECAST_SERIES[i], float(params["b"][i]), params["multiplicativo"][i]
+        for mes, p in zip(nova, passos):
+            valor = mes[serie]
+            if valor is not None:
+                mes[serie] = int(math.floor((valor * math.exp(b_i * p) if multiplicativo else valor + b_i * p) + 0.5))
+    return nova, True
+
+def _simular_horizonte(dados, ano_inicio, ano_fim, cronograma):
+    target = dados.get("targetYearMonthly", []) or []
+    use_ai = bool(dados.get("useAiForecast", False))
+    company_id = dados.get("companyId")
+    if "historicalMonthly" in dados:
+        historical = dados.get("historicalMonthly", []) or []
+    else:
+        historical = _historico.meses(company_id)
+
+    # meses informados por ano; anos sem meses informados derivam do ano anterior
+    alvo_por_ano = {}
+    for m in target:
+        alvo_por_ano.setdefault(int(m["ano"]), []).append(m)
+
+    # alíquotas do cronograma valem a partir do ano indicado até a próxima alteração
+    taxas_brutas = {k: dados[k] for k in _SWEEP_DIMENSOES if k in dados}
+    cache_aliquotas = {}
+    params = None
+    base_mensal = agregados = None
+    anterior = None  # (agregados, aliquotas, tributos) do ano anterior
+    resultados = []
+    for ano in range(ano_inicio, ano_fim + 1):
+        taxas_brutas.update(cronograma.get(str(ano)) or {})
+        aliquotas = _parse_aliquotas(taxas_brutas, cache_aliquotas)
+
+        alvo = alvo_por_ano.get(ano)
+        if base_mensal is None or alvo:
+            base_mensal = _complete_12_months(alvo or [], historical, use_ai, ano, company_id, ano_base=ano)
+            agregados = _agregados_anuais(base_mensal)
+        else:
+            if params is None and use_ai and historical and np is not None:
+                params = _parametros_previsao(historical, company_id)
+            base_mensal, mudou = _base_ano_seguinte(base_mensal, ano, params)
+            if mudou:
+                agregados = _agregados_anuais(base_mensal)
+
+        if anterior is not None and anterior[0] is agregados and anterior[1] == aliquotas:
+            tributos = anterior[2]
+        else:
+            tributos = _calcular_regimes(agregados, aliquotas)
+        anterior = (agregados, aliquotas, tributos)
+        resultados.append(_montar_resposta({"companyId": company_id, "year": ano}, base_mensal, agregados, tributos, aliquotas))
+    return resultados
+
+# Simulação em streaming (NDJSON): uma empresa por linha, um resultado por linha assim que calculado.
+# Usada pelo /chat/stream, pelo "python app.py stream" e pelos blocos do /jobs; a memória não depende
+# do tamanho da entrada. Mesmo cálculo do /chat (modo determinístico), sem passar pelo cache de
+# resultados: cada empresa aparece uma vez e só expulsaria as entradas do tráfego interativo.
+_STREAM_CACHE_ALIQUOTAS = 1024  # combinações de alíquotas já convertidas, reaproveitadas entre linhas
+_STREAM_JANELA_MMAP = 16 << 20  # bytes lidos do arquivo mapeado entre liberações das páginas já lidas
+_STREAM_DESCARTE = 64 << 10  # bytes por leitura ao descartar o resto de uma linha acima do limite
+
+def _linhas_ndjson(stream, limite=None):
+    # linhas não vazias (bytes, sem quebra) de um arquivo binário, _LeitorMmap ou request.stream. Cada leitura
+    # para em limite + 1 bytes (padrão: MAX_CORPO_BYTES): de uma linha maior sai só esse começo, que
+    # _simular_linhas responde com 413, e o resto é descartado sem passar inteiro pela memória
+    limite = CONFIG.max_corpo_bytes if limite is None else limite
+    for linha in iter(lambda: stream.readline(limite + 1), b""):
+        if len(linha) > limite and not linha.endswith(b"\n"):
+            while (resto := stream.readline(_STREAM_DESCARTE)) and not resto.endswith(b"\n"):
+                pass
+            yield linha
+            continue
+        linha = linha.strip()
+        if linha:
+            yield linha
+
+class _LeitorMmap:
+    # readline(limite) sobre um arquivo mapeado (o mmap.readline não aceita limite); as páginas já lidas
+    # voltam para o kernel a cada _STREAM_JANELA_MMAP bytes, senão o RSS cresceria com o tamanho do arquivo
+    def __init__(self, mapa):
+        self.mapa = mapa
+        self.posicao = 0
+        self.liberado = 0
+        if hasattr(mapa, "madvise"):
+            mapa.madvise(mmap.MADV_SEQUENTIAL)
+
+    def readline(self, limite=-1):
+        teto = len(self.mapa) if limite < 0 else min(len(self.mapa), self.posicao + limite)
+        fim = self.mapa.find(b"\n", self.posicao, teto)
+        fim = teto if fim < 0 else fim + 1
+        linha = self.mapa[self.posicao:fim]
+        self.posicao = fim
+        if fim - self.liberado >= _STREAM_JANELA_MMAP and hasattr(mmap, "MADV_DONTNEED"):
+            pagina = fim - fim % mmap.PAGESIZE
+            self.mapa.madvise(mmap.MADV_DONTNEED, self.liberado, pagina - self.liberado)
+            self.liberado = pagina
+        return linha
+
+def _simular_linhas(linhas, inicio=0):
+    # {"index", "status", "resultado" | "error"} por linha, na ordem da entrada
+    cache_aliquotas = {}
+    for i, linha in enumerate(linhas, start=inicio):
+        if len(linha) > CONFIG.max_corpo_bytes:
+            yield {"index": i, "status": 413, "error": f"Linha excede o limite de {CONFIG.max_corpo_bytes} bytes."}
+            continue
+        try:
+            item = _json_loads(linha)
+        except (ValueError, RecursionError):
+            yield {"index": i, "status": 400, "error": "Linha não é um JSON válido."}
+            continue
+        entrada, invalido = _validar_entrada(item)
+        if invalido:
+            yield _erro_validacao_item(i, item, invalido)
+            continue
+        if len(cache_aliquotas) > _STREAM_CACHE_ALIQUOTAS:
+            cache_aliquotas.clear()
+        try:
+            yield {"index": i, "status": 200, "resultado": _simular(entrada, _parse_aliquotas(entrada, cache_aliquotas))}
+        except Exception as e:
+            yield _erro_item_lote(i, item, e)
+
+def _erro_validacao_item(i, item, invalido):
+    # linha de erro de um item de lote/stream recusado por _validar_entrada
+    status, erros = invalido
+    resultado = {"index": i, "status": status, "error": erros[0]["error"], "erros": erros}
+    if isinstance(item, dict) and type(item.get("companyId")) in (str, int):
+        resultado["companyId"] = item.get("companyId")
+    return resultado
+
+def _linha_resultado(resultado):
+    return _json_bytes(resultado) + b"\n"
+
+# Jobs em lote (/jobs)
+# A entrada (NDJSON ou CSV) vai direto para o disco enquanto é recebida, normalizada em NDJSON com
+# os limites de cada bloco de JOBS_BLOCO_EMPRESAS linhas. Uma thread por job manda os blocos para um
+# ProcessPoolExecutor (spawn, um processo por núcleo), com no máximo JOBS_EM_VOO blocos pendentes no
+# pool (os demais esperam) e nova tentativa para bloco que falhar. Cada bloco grava o próprio arquivo
+# de resultados de forma atômica (bloco-N.ndjson e, por último, bloco-N.ok); um job interrompido
+# retoma só os blocos sem .ok. O progresso fica em progresso.json, legível por qualquer worker.
+_JOBS_CSV_EMPRESA = ("useAiForecast", "cbsRate", "ibsRate", "cppRate", "simplesShare")
+
+def _gravar_json_atomico(caminho, dados):
+    tmp = caminho + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(dados, f, ensure_ascii=False)
+    os.replace(tmp, caminho)
+
+def _ler_json(caminho):
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _empresas_csv(texto):
+    # Uma linha por mês (ou só a empresa, com ano/mes vazios), agrupadas por companyId consecutivo.
+    # Colunas: companyId, year, tipo (alvo|historico; padrão: alvo se ano == year), ano, mes, as séries
+    # de FORECAST_SERIES e, por empresa, useAiForecast e as alíquotas.
+    atual = None
+    for numero, linha in enumerate(csv.DictReader(texto), start=2):
+        try:
+            if atual is None or linha.get("companyId") != atual["companyId"]:
+                if atual is not None:
+                    yield atual
+                year = (linha.get("year") or "").strip()
+                atual = {"companyId": linha.get("companyId"), "year": int(year) if year else None,
+                         "targetYearMonthly": [], "historicalMonthly": []}
+                for campo in _JOBS_CSV_EMPRESA:
+                    valor = (linha.get(campo) or "").strip()
+                    if valor:
+                        atual[campo] = valor.lower() in ("1", "true", "sim") if campo == "useAiForecast" else valor
+            if (linha.get("ano") or "").strip():
+                mes = {"ano": int(linha["ano"]), "mes": int(linha["mes"])}
+                for serie in FORECAST_SERIES:
+                    valor = (linha.get(serie) or "").strip()
+                    if valor:
+                        mes[serie] = valor
+                tipo = (linha.get("tipo") or "").strip() or ("alvo" if mes["ano"] == atual["year"] else "historico")
+                atual["targetYearMonthly" if tipo == "alvo" else "historicalMonthly"].append(mes)
+        except (TypeError, ValueError, KeyError):
+            raise ValueError(f"CSV linha {numero}: 'year', 'ano' e 'mes' devem ser inteiros.")
+    if atual is not None:
+        yield atual
+
+def _linhas_csv(texto, limite):
+    # linhas do CSV lidas com teto, como em _linhas_ndjson; uma linha maior que o limite recusa a entrada
+    for numero, linha in enumerate(iter(lambda: texto.readline(limite + 1), ""), start=1):
+        if len(linha) > limite and not linha.endswith("\n"):
+            raise ValueError(f"CSV linha {numero}: excede o limite de {limite} caracteres.")
+        yield linha
+
+def _linhas_job(stream, formato):
+    # linhas NDJSON (bytes, sem quebra) da entrada recebida; uma linha NDJSON acima de MAX_CORPO_BYTES
+    # é gravada só com o começo e vira 413 no bloco
+    if formato == "csv":
+        texto = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+        for empresa in _empresas_csv(_linhas_csv(texto, CONFIG.max_corpo_bytes)):
+            yield json.dumps(empresa, ensure_ascii=False).encode("utf-8")
+        return
+    yield from _linhas_ndjson(stream)
+
+def _spool_job(diretorio, stream, formato, por_bloco):
+    # grava entrada.ndjson e devolve os blocos [{inicio, fim, primeiro, linhas}] (offsets em bytes)
+    blocos = []
+    posicao, inicio, primeiro, total = 0, 0, 0, 0
+    with open(os.path.join(diretorio, "entrada.ndjson"), "wb") as f:
+        for linha in _linhas_job(stream, formato):
+            f.write(linha + b"\n")
+            posicao += len(linha) + 1
+            total += 1
+            if total - primeiro == por_bloco:
+                blocos.append({"inicio": inicio, "fim": posicao, "primeiro": primeiro, "linhas": total - primeiro})
+                inicio, primeiro = posicao, total
+    if total > primeiro:
+        blocos.append({"inicio": inicio, "fim": posicao, "primeiro": primeiro, "linhas": total - primeiro})
+    return blocos, total
+
+def _iniciar_processo_job(config):
+    # processo do pool: mesma configuração da app que criou o job, caches e conexões próprios
+    _configurar(config)
+
+def _processar_bloco_job(diretorio, k, bloco):
+    # roda no pool: simula as linhas do bloco e grava bloco-k.ndjson e bloco-k.ok
+    with open(os.path.join(diretorio, "entrada.ndjson"), "rb") as f:
+        f.seek(bloco["inicio"])
+        linhas = f.read(bloco["fim"] - bloco["inicio"]).splitlines()
+    sucesso = 0
+    saida = os.path.join(diretorio, f"bloco-{k:06d}.ndjson")
+    with open(saida + ".tmp", "wb") as f:
+        for resultado in _simular_linhas(linhas, bloco["primeiro"]):
+            sucesso += resultado["status"] == 200
+            f.write(_linha_resultado(resultado))
+    os.replace(saida + ".tmp", saida)
+    contagem = {"linhas": len(linhas), "sucesso": sucesso, "falhas": len(linhas) - sucesso}
+    _gravar_json_atomico(os.path.join(diretorio, f"bloco-{k:06d}.ok"), contagem)
+    return contagem
+
+class _GerenciadorJobs:
+    def __init__(self, config):
+        self.config = config
+        self.processos = config.jobs_processos or os.cpu_count() or 1
+        self._vagas = threading.BoundedSemaphore(config.jobs_em_voo or 2 * self.processos)
+        self._pool = None
+        self._lock = threading.Lock()
+        self._threads = {}
+
+    def diretorio(self, job_id):
+        return os.path.join(self.config.jobs_dir, job_id)
+
+    def _executor(self, quebrado=None):
+        with self._lock:
+            if self._pool is not None and self._pool is quebrado:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            if self._pool is None:
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.processos, mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_iniciar_processo_job, initargs=(self.config,))
+            return self._pool
+
+    def ativos(self):
+        with self._lock:
+            return sum(1 for t in self._threads.values() if t.is_alive())
+
+    def iniciar(self, job_id):
+        with self._lock:
+            thread = self._threads.get(job_id)
+            if thread is not None and thread.is_alive():
+                return
+            thread = threading.Thread(target=self._executar, args=(job_id,), name=f"job-{job_id[:8]}", daemon=True)
+            self._threads[job_id] = thread
+        thread.start()
+
+    def retomar_pendentes(self):
+        if not os.path.isdir(self.config.jobs_dir):
+            return
+        for job_id in os.listdir(self.config.jobs_dir):
+            progresso = _ler_json(os.path.join(self.diretorio(job_id), "progresso.json"))
+            if progresso is not None and progresso["status"] in ("pendente", "executando"):
+                self.iniciar(job_id)
+
+    def _executar(self, job_id):
+        diretorio = self.diretorio(job_id)
+        trava = open(os.path.join(diretorio, "trava"), "a")
+        try:
+            if fcntl is not None:
+                try:
+                    # outro processo (ex.: outro worker do gunicorn) já está executando este job
+                    fcntl.flock(trava, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return
+            self._executar_blocos(job_id, diretorio)
+        except Exception as e:
+            _registrar_erro("job")
+            logger.exception("Job %s interrompido.", job_id)
+            progresso = _ler_json(os.path.join(diretorio, "progresso.json")) or {}
+            progresso.update(status="falhou", erro=str(e), concluidoEm=time.time())
+            _gravar_json_atomico(os.path.join(diretorio, "progresso.json"), progresso)
+        finally:
+            trava.close()
+
+    def _executar_blocos(self, job_id, diretorio):
+        manifesto = _ler_json(os.path.join(diretorio, "job.json"))
+        blocos = manifesto["blocos"]
+        progresso = {"status": "executando", "total": manifesto["total"], "processados": 0, "sucesso": 0,
+                     "falhas": 0, "blocos": len(blocos), "blocosConcluidos": 0, "blocosFalhos": [],
+                     "concluidoEm": None}
+        pendentes = deque()
+        for k in range(len(blocos)):
+            contagem = _ler_json(os.path.join(diretorio, f"bloco-{k:06d}.ok"))
+            if contagem is None:
+                pendentes.append(k)
+            else:
+                self._somar(progresso, contagem)
+        _gravar_json_atomico(os.path.join(diretorio, "progresso.json"), progresso)
+
+        tentativas = Counter()
+        futuros = {}
+        while pendentes or futuros:
+            # back-pressure: só envia enquanto houver vaga no pool; sem nada pendente, espera uma vaga
+            while pendentes and self._vagas.acquire(blocking=not futuros):
+                k = pendentes.popleft()
+                executor = self._executor()
+                try:
+                    futuros[executor.submit(_processar_bloco_job, diretorio, k, blocos[k])] = (k, executor)
+                except Exception as e:
+                    # pool quebrado ou encerrado: sem futuro, ninguém devolveria a vaga; o próximo envio usa outro pool
+                    self._vagas.release()
+                    self._executor(quebrado=executor)
+                    self._falha_bloco(job_id, k, e, executor, tentativas, pendentes, progresso)
+                    _gravar_json_atomico(os.path.join(diretorio, "progresso.json"), progresso)
+            prontos, _ = concurrent.futures.wait(futuros, timeout=1.0, return_when=concurrent.futures.FIRST_COMPLETED)
+            for futuro in prontos:
+                k, executor = futuros.pop(futuro)
+                self._vagas.release()
+                try:
+                    self._somar(progresso, futuro.result())
+                except Exception as e:
+                    self._falha_bloco(job_id, k, e, executor, tentativas, pendentes, progresso)
+                _gravar_json_atomico(os.path.join(diretorio, "progresso.json"), progresso)
+        progresso["status"] = "falhou" if progresso["blocosFalhos"] else "concluido"
+        progresso["concluidoEm"] = time.time()
+        _gravar_json_atomico(os.path.join(diretorio, "progresso.json"), progresso)
+
+    def _falha_bloco(self, job_id, k, e, executor, tentativas, pendentes, progresso):
+        # bloco k falhou (no pool ou ao enviar): nova tentativa até jobs_tentativas, depois vai para blocosFalhos
+        tentativas[k] += 1
+        _registrar_erro("job_bloco")
+        if isinstance(e, concurrent.futures.BrokenExecutor):
+            self._executor(quebrado=executor)
+        if tentativas[k] < self.config.jobs_tentativas:
+            logger.warning("Job %s: bloco %s falhou (%s); nova tentativa.", job_id, k, e)
+            pendentes.append(k)
+        else:
+            logger.error("Job %s: bloco %s falhou %s vezes (%s).", job_id, k, tentativas[k], e)
+            progresso["blocosFalhos"].append(k)
+
+    @staticmethod
+    def _somar(progresso, contagem):
+        progresso["processados"] += contagem["linhas"]
+        progresso["sucesso"] += contagem["sucesso"]
+        progresso["falhas"] += contagem["falhas"]
+        progresso["blocosConcluidos"] += 1
+
+_jobs = None
+_jobs_lock = threading.Lock()
+
+def _obter_jobs():
+    # criado no primeiro uso de /jobs; retoma os jobs interrompidos deste diretório
+    global _jobs
+    with _jobs_lock:
+        if _jobs is None:
+            _jobs = _GerenciadorJobs(CONFIG)
+            _jobs.retomar_pendentes()
+        return _jobs
+
+bp = Blueprint("simulador", __name__)
+
+# Instrumentação de todas as rotas
+@bp.before_app_request
+def _inicio_requisicao():
+    g.inicio_requisicao = time.perf_counter()
+    if CONFIG.profile_token and request.endpoint != "simulador.metrics_profile" and _profile_autorizado():
+        g.amostrador = _Amostrador(threading.get_ident(), CONFIG.profile_intervalo_ms / 1000).iniciar()
+
+@bp.after_app_request
+def _fim_requisicao(resposta):
+    rota = request.url_rule.rule if request.url_rule is not None else "desconhecida"
+    amostrador = g.pop("amostrador", None)
+    if amostrador is not None:
+        # o perfil só fecha quando o servidor termina de enviar o corpo: em streaming (/chat/stream,
+        # /chat/sweep) o cálculo roda durante a iteração, depois deste hook
+        perfil_id = uuid.uuid4().hex
+        resposta.call_on_close(lambda: _perfis.put(perfil_id, amostrador.parar()))
+        resposta.headers["X-Profile-Id"] = perfil_id
+    _metricas.incrementar("simulador_requisicoes_total", (("rota", rota), ("metodo", request.method), ("status", resposta.status_code)))
+    _metricas.observar("simulador_requisicao_segundos", time.perf_counter() - g.inicio_requisicao, (("rota", rota),))
+    if request.content_length is not None:
+        _metricas.observar("simulador_requisicao_bytes", request.content_length, (("rota", rota),))
+    if not resposta.is_streamed and resposta.content_length is not None:
+        _metricas.observar("simulador_resposta_bytes", resposta.content_length, (("rota", rota),))
+    return resposta
+
+def _corpo_json(limite):
+    # corpo JSON da requisição com no máximo 'limite' bytes (também em chunked, sem Content-Length).
+    # Devolve (dados, None) ou (None, resposta de erro).
+    if request.content_length is not None and request.content_length > limite:
+        return None, (jsonify({"error": f"Corpo excede o limite de {limite} bytes."}), 413)
+    pedacos, lidos = [], 0
+    while lidos <= limite:
+        pedaco = request.stream.read(min(1 << 16, limite + 1 - lidos))
+        if not pedaco:
+            break
+        pedacos.append(pedaco)
+        lidos += len(pedaco)
+    if lidos > limite:
+        return None, (jsonify({"error": f"Corpo excede o limite de {limite} bytes."}), 413)
+    try:
+        return _json_loads(b"".join(pedacos)), None
+    except (ValueError, RecursionError):
+        return None, (jsonify({"error": "Envie um JSON válido no corpo da requisição."}), 400)
+
+def _resposta_invalida(invalido):
+    # erros de _validar_entrada: "error" traz o primeiro, "erros" todos os campos ({campo, error})
+    status, erros = invalido
+    return jsonify({"error": erros[0]["error"], "erros": erros}), status
+
+def _resposta_json(obj, status=200):
+    return current_app.response_class(_json_bytes(obj), status=status, mimetype="application/json")
 
 # Endpoint
-@app.route("/chat", methods=["POST"])
+@bp.route("/chat", methods=["POST"])
 def chat():
-    if client is None:
-        return jsonify({"error": "Serviço de IA indisponível: cliente não configurado (variável de ambiente faltando)."}), 503
     try:
-        dados = request.get_json(silent=True)
+        with _Etapa("json"):
+            dados, erro = _corpo_json(CONFIG.max_corpo_bytes)
+        if erro:
+            return erro
         if not dados:
             return jsonify({"error": "Envie um JSON válido no corpo da requisição."}), 400
 
-        ok, msg = _validate_input_schema(dados)
-        if not ok:
-            return jsonify({"error": msg}), 400
+        with _Etapa("validacao"):
+            entrada, invalido = _validar_entrada(dados)
+        if invalido:
+            return _resposta_invalida(invalido)
 
-        # parametros configuráveis via entrada
-        cbs_rate = _decimal_from_str_or_num(dados.get("cbsRate", DEFAULT_CBS_RATE))
-        ibs_rate = _decimal_from_str_or_num(dados.get("ibsRate", DEFAULT_IBS_RATE))
-        cpp_rate = _decimal_from_str_or_num(dados.get("cppRate", DEFAULT_CPP_RATE))
-        simples_share = _decimal_from_str_or_num(dados.get("simplesShare", SIMPLIFIED_SIMPLES_SHARE))
+        with _Etapa("chave_cache"):
+            aliquotas = _parse_aliquotas(entrada)
+            chave = _chave_resultado(entrada, aliquotas)
+        if request.args.get("mode") == "ai":
+            return _responder_ia(entrada, aliquotas, chave)
+        return _responder_deterministico(entrada, aliquotas, chave)
 
-        target = dados.get("targetYearMonthly", [])
-        historical = dados.get("historicalMonthly", [])
-        use_ai = bool(dados.get("useAiForecast", False))
+    except Exception as e:
+        _registrar_erro("chat")
+        logger.exception("Erro interno na função chat.")
+        return jsonify({"error": f"Erro interno do servidor: {str(e)}"}), 500
 
-        # completar 12 meses
-        base_mensal = _complete_12_months(target, historical, use_ai)
+@bp.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    # NDJSON (uma empresa por linha, formato do /chat; aceita Transfer-Encoding: chunked) -> NDJSON com
+    # um resultado por linha, enviado assim que calculado; nem a entrada nem a saída ficam inteiras na memória
+    entrada = request.stream
 
-        # calcular anuais
-        faturamentoTotalAnual = sum(Decimal(b["receitaBruta"]) for b in base_mensal)
-        folhaTotalAnual = sum(Decimal(b["folhaSalarios"]) for b in base_mensal)
-        totalInsumos = sum(Decimal(b.get("insumos") or "0.00") for b in base_mensal)
+    def gerar():
+        for resultado in _simular_linhas(_linhas_ndjson(entrada)):
+            yield _linha_resultado(resultado)
 
-        if totalInsumos == Decimal("0.00"):
-            valorAdicionado = (faturamentoTotalAnual * Decimal("0.70")).quantize(Decimal(".01"), rounding=ROUND_HALF_UP)
-        else:
-            valorAdicionado = (faturamentoTotalAnual - totalInsumos).quantize(Decimal(".01"), rounding=ROUND_HALF_UP)
-
-        # lucroTributavel
-        soma_lucro_mensal = Decimal("0.00")
-        lucro_flag = False
-        for b in base_mensal:
-            if b.get("lucroLiquidoContabil") is not None:
-                lucro_flag = True
-                soma_lucro_mensal += Decimal(b["lucroLiquidoContabil"])
-        if lucro_flag:
-            lucroTributavel = soma_lucro_mensal
-        else:
-            lucroTributavel = (faturamentoTotalAnual * Decimal("0.10")).quantize(Decimal(".01"), rounding=ROUND_HALF_UP)
-
-        # tributos gerais
-        CBS_total = (valorAdicionado * cbs_rate).quantize(Decimal(".01"), rounding=ROUND_HALF_UP)
-        IBS_total = (valorAdicionado * ibs_rate).quantize(Decimal(".01"), rounding=ROUND_HALF_UP)
-        CPP_total = (folhaTotalAnual * cpp_rate).quantize(Decimal(".01"), rounding=ROUND_HALF_UP)
-
-        # IRPJ / CSLL - regras por regime definidas abaixo (Presumido usa base presumida)
-        # Simples: We'll include IRPJ/CSLL computed on lucroTributavel (same rule)
-        IRPJ_base_simples = (lucroTributavel * Decimal("1.00")).quantize(Decimal(".01"), rounding=ROUND_HALF_UP)
-        IRPJ_simples = (IRPJ_base_simples * Decimal("0.15")).quantize(Decimal(".01"), rounding=ROUND_HALF_UP)
-        CSLL_simples = (IRPJ_base_simples * Decimal("0.09")).quantize(Decimal(".01"), rounding=ROUND_HALF_UP)
-
-        # Lucro Presumido
-        basePresumida = (faturamentoTotalAnual * Decimal("0.32")).quantize(Decimal(".01"), rounding=ROUND_HALF_UP)
-        IRPJ_presumido = (basePresumida * Decimal("0.15")).quantize(Decimal(".01"), rounding=ROUND_HALF_UP)
-        CSLL_presumido = (basePresumida * Decimal("0.09")).quantize(Decimal(".01"), rounding=ROUND_HALF_UP)
-
-        # Lucro Real
-        IRPJ_real = (lucroTributavel * Decimal("0.15")).quantize(Decimal(".01"), rounding=ROUND_HALF_UP)
-        CSLL_real = (lucroTributavel * Decimal("0.09")).quantize(Decimal(".01"), rounding=ROUND_HALF_UP)
-
-        # Simples específico: aplicar share
-        CBS_simples = (CBS_total * simples_share).quantize(Decimal(".01"), rounding=ROUND_HALF_UP)
-        IBS_simples = (IBS_total * simples_share).quantize(Decimal(".01"), rounding=ROUND_HALF_UP)
-        CPP_simples = (CPP_total * simples_share).quantize(Decimal(".01"), rounding=ROUND_HALF_UP)
-        imposto_simples_total = (CBS_simples + IBS_simples + IRPJ_simples + CSLL_simples + CPP_simples).quantize(Decimal(".01"), rounding=ROUND_HALF_UP)
-
-        # Presumido total
-        imposto_presumido_total = (CBS_total + IBS_total + IRPJ_presumido + CSLL_presumido + CPP_total).quantize(Decimal(".01"), rounding=ROUND_HALF_UP)
-
-        # Real total
-        imposto_real_total = (CBS_total + IBS_total + IRPJ_real + CSLL_real + CPP_total).quantize(Decimal(".01"), rounding=ROUND_HALF_UP)
-
-        # Distribuição mensal (proporcional ao faturamento)
-        faturamentos_mensais = [Decimal(m["receitaBruta"]) for m in base_mensal]
-        simples_monthly = _distribute_monthly(imposto_simples_total, faturamentos_mensais)
-        presumido_monthly = _distribute_monthly(imposto_presumido_total, faturamentos_mensais)
-        real_monthly = _distribute_monthly(imposto_real_total, faturamentos_mensais)
-
-        def monthly_to_list(monthly_tuples):
-            return [ {"mes": int(m), "valor": _fmt_money(v)} for (m,v) in monthly_tuples ]
-
-        regimes = [
-            {
-                "nome": "Simples Nacional - Pós-Reforma",
-                "impostoTotalAnual": _fmt_money(imposto_simples_total),
-                "aliquotaEfetiva": _fmt_money((imposto_simples_total / faturamentoTotalAnual) if faturamentoTotalAnual>0 else Decimal("0.00")),
-                "detalhesTributos": {
-                    "CBS": _fmt_money(CBS_simples),
-                    "IBS": _fmt_money(IBS_simples),
-                    "IRPJ": _fmt_money(IRPJ_simples),
-                    "CSLL": _fmt_money(CSLL_simples),
-                    "CPP": _fmt_money(CPP_simples),
-                    "IS": "0.00"
-                },
-                "impostoTotalMensal": monthly_to_list(simples_monthly),
-                "observacoes": f"Simples simplificado: {int((simples_share*100))}% do CBS/IBS e CPP considerados dentro do DAS (hipótese didática)."
-            },
-            {
-                "nome": "Lucro Presumido - Pós-Reforma",
-                "impostoTotalAnual": _fmt_money(imposto_presumido_total),
-                "aliquotaEfetiva": _fmt_money((imposto_presumido_total / faturamentoTotalAnual) if faturamentoTotalAnual>0 else Decimal("0.00")),
-                "detalhesTributos": {
-                    "CBS": _fmt_money(CBS_total),
-                    "IBS": _fmt_money(IBS_total),
-                    "IRPJ": _fmt_money(IRPJ_presumido),
-                    "CSLL": _fmt_money(CSLL_presumido),
-                    "CPP": _fmt_money(CPP_total),
-                    "IS": "0.00"
-                },
-                "impostoTotalMensal": monthly_to_list(presumido_monthly),
-                "observacoes": "Regime presumido com CBS/IBS integrais e base presumida de 32% para serviços."
-            },
-            {
-                "nome": "Lucro Real - Pós-Reforma",
-                "impostoTotalAnual": _fmt_money(imposto_real_total),
-                "aliquotaEfetiva": _fmt_money((imposto_real_total / faturamentoTotalAnual) if faturamentoTotalAnual>0 else Decimal("0.00")),
-                "detalhesTributos": {
-                    "CBS": _fmt_money(CBS_total),
-                    "IBS": _fmt_money(IBS_total),
-                    "IRPJ": _fmt_money(IRPJ_real),
-                    "CSLL": _fmt_money(CSLL_real),
-                    "CPP": _fmt_money(CPP_total),
-                    "IS": "0.00"
-                },
-                "impostoTotalMensal": monthly_to_list(real_monthly),
-                "observacoes": "Regime real com CBS/IBS integrais. Lucro tributável = soma dos lucros contábeis mensais ou 10% do faturamento se não informado."
-            }
-        ]
+    return current_app.response_class(stream_with_context(gerar()), mimetype="application/x-ndjson")
+
+@bp.route("/chat/cache", methods=["GET"])
+def chat_cache():
+    return jsonify(_cache_resultados.stats()), 200
+
+@bp.route("/metrics", methods=["GET"])
+def metrics():
+    return current_app.response_class(_metricas.texto(), status=200, content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@bp.route("/metrics/profile/<perfil_id>", methods=["GET"])
+def metrics_profile(perfil_id):
+    # mesmo token do header X-Profile; sem PROFILE_TOKEN o profiler fica desligado
+    if not _profile_autorizado():
+        return jsonify({"error": "Profiler desabilitado ou token X-Profile inválido."}), 403
+    perfil = _perfis.get(perfil_id)
+    if perfil is None:
+        return jsonify({"error": "Perfil não encontrado (expirado ou id inválido)."}), 404
+    return current_app.response_class(perfil, status=200, content_type="text/plain; charset=utf-8")
+
+@bp.route("/historico", methods=["POST"])
+def historico_ingerir():
+    # {"companyId": ..., "historicalMonthly": [...]}: grava só os meses novos ou alterados
+    try:
+        dados, erro = _corpo_json(CONFIG.max_corpo_lote_bytes)
+        if erro:
+            return erro
+        if not isinstance(dados, dict) or dados.get("companyId") is None:
+            return jsonify({"error": "Envie um JSON com 'companyId' e a lista 'historicalMonthly'."}), 400
+        if type(dados["companyId"]) not in (str, int):
+            return _resposta_invalida((400, [_erro_campo("companyId", "deve ser texto ou inteiro")]))
+        meses = dados.get("historicalMonthly")
+        if not isinstance(meses, list):
+            return jsonify({"error": "'historicalMonthly' deve ser uma lista de meses."}), 400
+        if len(meses) > CONFIG.historico_max_meses:
+            return jsonify({"error": f"Envio excede o limite de {CONFIG.historico_max_meses} meses."}), 413
+        validos, erros = [], []
+        for i, mes in enumerate(meses):
+            validos.append(_validar_mes_historico(i, mes, erros))
+            if len(erros) >= _MAX_ERROS_VALIDACAO:
+                break
+        if erros:
+            return _resposta_invalida((400, erros[:_MAX_ERROS_VALIDACAO]))
+        if not CONFIG.historico_db:
+            return jsonify({"error": "Histórico desabilitado (HISTORICO_DB vazio)."}), 503
+        return jsonify(_historico.ingerir(dados["companyId"], validos)), 200
+
+    except Exception as e:
+        _registrar_erro("historico_ingerir")
+        logger.exception("Erro interno na função historico_ingerir.")
+        return jsonify({"error": f"Erro interno do servidor: {str(e)}"}), 500
+
+@bp.route("/historico/<company_id>", methods=["GET"])
+def historico_consultar(company_id):
+    # /historico/123 consulta o companyId inteiro 123; ?tipo=texto consulta o texto "123"
+    if request.args.get("tipo") != "texto" and _HISTORICO_ID_INTEIRO.fullmatch(company_id):
+        company_id = int(company_id)
+    info = _historico.info(company_id)
+    if info is None:
+        return jsonify({"error": "Empresa sem histórico armazenado."}), 404
+    return jsonify(info), 200
+
+def _erro_item_lote(i, item, e):
+    _registrar_erro("chat_batch_item")
+    logger.exception("Erro simulando item %s do lote (companyId=%s).", i, item.get("companyId"))
+    return {"index": i, "companyId": item.get("companyId"), "status": 500, "error": f"Erro interno do servidor: {str(e)}"}
+
+@bp.route("/chat/batch", methods=["POST"])
+def chat_batch():
+    # Aceita {"companies": [...]} ou uma lista direta; cada item tem o mesmo formato do /chat.
+    try:
+        dados, erro = _corpo_json(CONFIG.max_corpo_lote_bytes)
+        if erro:
+            return erro
+        itens = dados.get("companies") if isinstance(dados, dict) else dados
+        if not isinstance(itens, list) or not itens:
+            return jsonify({"error": "Envie um JSON com a lista 'companies' (ou uma lista) de empresas."}), 400
+        if len(itens) > CONFIG.batch_max_itens:
+            return jsonify({"error": f"Lote excede o limite de {CONFIG.batch_max_itens} empresas."}), 413
+
+        # motor dos regimes: "escalar" (padrão) ou "vetorial" (numpy, para lotes grandes)
+        engine = request.args.get("engine") or (dados.get("engine") if isinstance(dados, dict) else None) or "escalar"
+        if engine not in ("escalar", "vetorial"):
+            return jsonify({"error": "Parâmetro 'engine' deve ser 'escalar' ou 'vetorial'."}), 400
+
+        # alíquotas costumam se repetir no lote: o parse é feito uma vez por combinação distinta
+        cache_aliquotas = {}
+        resultados = [None] * len(itens)
+        preparados = []  # (indice, item, aliquotas, base_mensal, agregados)
+        for i, item in enumerate(itens):
+            entrada, invalido = _validar_entrada(item)
+            if invalido:
+                resultados[i] = _erro_validacao_item(i, item, invalido)
+                continue
+            try:
+                aliquotas = _parse_aliquotas(entrada, cache_aliquotas)
+                base_mensal, agregados = _preparar(entrada)
+            except Exception as e:
+                resultados[i] = _erro_item_lote(i, item, e)
+                continue
+            preparados.append((i, entrada, aliquotas, base_mensal, agregados))
+
+        tributos_lista = None
+        if engine == "vetorial" and preparados:
+            try:
+                with _Etapa("regimes_vetorial"):
+                    resultado = _calcular_regimes_vetorial(
+                        _matriz_agregados([p[4] for p in preparados]),
+                        [p[2] for p in preparados]
+                    )
+                    tributos_lista = _tributos_do_vetorial(resultado)
+            except (RuntimeError, OverflowError) as e:
+                logger.warning("Motor vetorial indisponível para o lote (%s); usando o motor escalar.", e)
+
+        for k, (i, item, aliquotas, base_mensal, agregados) in enumerate(preparados):
+            try:
+                if tributos_lista is not None:
+                    tributos = tributos_lista[k]
+                else:
+                    with _Etapa("regimes"):
+                        tributos = _calcular_regimes(agregados, aliquotas)
+                resposta = _montar_resposta(item, base_mensal, agregados, tributos, aliquotas)
+            except Exception as e:
+                resultados[i] = _erro_item_lote(i, item, e)
+                continue
+            resultados[i] = {"index": i, "status": 200, "resultado": resposta}
+
+        falhas = sum(1 for r in resultados if r["status"] != 200)
+        return _resposta_json({
+            "total": len(itens),
+            "sucesso": len(itens) - falhas,
+            "falhas": falhas,
+            "resultados": resultados
+        })
+
+    except Exception as e:
+        _registrar_erro("chat_batch")
+        logger.exception("Erro interno na função chat_batch.")
+        return jsonify({"error": f"Erro interno do servidor: {str(e)}"}), 500
+
+@bp.route("/chat/sweep", methods=["POST"])
+def chat_sweep():
+    # Mesma entrada do /chat mais "grade": {"cbsRate": [...] | {"inicio", "fim", "passo"}, ...}.
+    # Resposta compacta: uma linha por ponto com as alíquotas, os totais anuais dos três regimes e o
+    # índice do regime recomendado. Grades grandes (ou ?stream=1) saem em NDJSON, linha a linha.
+    try:
+        dados, erro = _corpo_json(CONFIG.max_corpo_bytes)
+        if erro:
+            return erro
+        if not dados:
+            return jsonify({"error": "Envie um JSON válido no corpo da requisição."}), 400
 
-        # recomendado: menor impostoTotalAnual
-        menor = min(regimes, key=lambda r: Decimal(r["impostoTotalAnual"]))
-        recomendado = menor["nome"]
+        dados, invalido = _validar_entrada(dados)
+        if invalido:
+            return _resposta_invalida(invalido)
+        grade = dados.get("grade") or {}
+        if not isinstance(grade, dict):
+            return jsonify({"error": "'grade' deve ser um objeto."}), 400
 
-        # montar resposta
-        resposta = {
+        aliquotas = _parse_aliquotas(dados)
+        erros = []
+        dimensoes = [_valores_grade(nome, grade.get(nome), padrao, erros) for nome, padrao in zip(_SWEEP_DIMENSOES, aliquotas)]
+        if erros:
+            return _resposta_invalida((400, erros[:_MAX_ERROS_VALIDACAO]))
+        total_pontos = 1
+        for d in dimensoes:
+            total_pontos *= len(d)
+        if total_pontos > CONFIG.sweep_max_pontos:
+            return jsonify({"error": f"Grade com {total_pontos} pontos excede o limite de {CONFIG.sweep_max_pontos}."}), 413
+
+        # base e agregados uma única vez para toda a grade
+        _, agregados = _preparar(dados)
+        rotulos = [[_rotulo_taxa(t) for t in d] for d in dimensoes]
+        cabecalho = {
             "companyId": dados.get("companyId"),
             "year": dados.get("year"),
-            "metodo": "ia:v3:simulacao_reforma",
-            "faturamentoTotalAnual": _fmt_money(faturamentoTotalAnual),
-            "folhaTotalAnual": _fmt_money(folhaTotalAnual),
-            "valorAdicionado": _fmt_money(valorAdicionado),
-            "baseMensal": base_mensal,
-            "regimes": regimes,
-            "recomendado": recomendado
+            "faturamentoTotalAnual": _fmt_centavos(agregados["faturamentoTotalAnual"]),
+            "folhaTotalAnual": _fmt_centavos(agregados["folhaTotalAnual"]),
+            "valorAdicionado": _fmt_centavos(agregados["valorAdicionado"]),
+            "lucroTributavel": _fmt_centavos(agregados["lucroTributavel"]),
+            "regimes": list(REGIMES_NOMES),
+            "colunas": list(_SWEEP_DIMENSOES) + ["simples", "presumido", "real", "recomendado"],
+            "pontos": total_pontos
         }
+        linhas = _linhas_grade(agregados, dimensoes, rotulos, total_pontos)
 
-        # retornar JSON já calculado pelo backend (não necessariamente chamar o modelo aqui)
-        return jsonify(resposta), 200
+        if request.args.get("stream") == "1" or total_pontos > CONFIG.sweep_stream_pontos:
+            def gerar():
+                yield _json_bytes(cabecalho) + b"\n"
+                for linha in linhas:
+                    yield _json_bytes(linha) + b"\n"
+            return current_app.response_class(gerar(), mimetype="application/x-ndjson")
+
+        cabecalho["linhas"] = list(linhas)
+        return _resposta_json(cabecalho)
 
     except Exception as e:
-        logger.exception("Erro interno na função chat.")
+        _registrar_erro("chat_sweep")
+        logger.exception("Erro interno na função chat_sweep.")
+        return jsonify({"error": f"Erro interno do servidor: {str(e)}"}), 500
+
+@bp.route("/chat/horizon", methods=["POST"])
+def chat_horizon():
+    # Mesma entrada do /chat mais "anoInicio", "anoFim" e um "cronograma" opcional de alíquotas por ano:
+    # {"2027": {"cbsRate": "0.09"}, "2029": {"ibsRate": "0.05"}}. Retorna o resultado do /chat de cada ano.
+    try:
+        dados, erro = _corpo_json(CONFIG.max_corpo_bytes)
+        if erro:
+            return erro
+        if not dados:
+            return jsonify({"error": "Envie um JSON válido no corpo da requisição."}), 400
+
+        dados, invalido = _validar_entrada(dados)
+        if invalido:
+            return _resposta_invalida(invalido)
+        # anoInicio (padrão: year) e anoFim (padrão: anoInicio) com a mesma validação do year
+        erros = []
+        anos = {}
+        for campo, padrao in (("anoInicio", "year"), ("anoFim", "anoInicio")):
+            bruto = dados.get(campo)
+            try:
+                anos[campo] = _validar_year(bruto) if bruto is not None else anos.get(padrao, _validar_year(dados["year"]))
+            except ValueError as e:
+                erros.append(_erro_campo(campo, e))
+        if erros:
+            return _resposta_invalida((400, erros))
+        ano_inicio, ano_fim = anos["anoInicio"], anos["anoFim"]
+        if ano_fim < ano_inicio or ano_fim - ano_inicio + 1 > CONFIG.horizonte_max_anos:
+            return jsonify({"error": f"Horizonte deve ter de 1 a {CONFIG.horizonte_max_anos} anos (anoInicio <= anoFim)."}), 400
+        cronograma = dados.get("cronograma") or {}
+        if not isinstance(cronograma, dict) or not all(isinstance(v, dict) for v in cronograma.values()):
+            return jsonify({"error": "'cronograma' deve mapear ano -> objeto de alíquotas."}), 400
+        # chaves: anos do horizonte (como no year); guardadas na forma canônica usada por _simular_horizonte
+        normalizado = {}
+        for ano, taxas in cronograma.items():
+            try:
+                valor = _validar_year(ano)
+                if not ano_inicio <= valor <= ano_fim:
+                    raise ValueError(f"deve estar entre anoInicio ({ano_inicio}) e anoFim ({ano_fim})")
+                if str(valor) in normalizado:
+                    raise ValueError(f"repete o ano {valor}")
+                normalizado[str(valor)] = taxas
+            except ValueError as e:
+                erros.append(_erro_campo(f"cronograma.{ano}", e))
+            for taxa in _SWEEP_DIMENSOES:
+                if taxas.get(taxa) is not None:
+                    try:
+                        _valor_numerico(taxas[taxa])
+                    except ValueError as e:
+                        erros.append(_erro_campo(f"cronograma.{ano}.{taxa}", e))
+        if erros:
+            return _resposta_invalida((400, erros[:_MAX_ERROS_VALIDACAO]))
+        cronograma = normalizado
+
+        resultados = _simular_horizonte(dados, ano_inicio, ano_fim, cronograma)
+        return _resposta_json({
+            "companyId": dados.get("companyId"),
+            "anoInicio": ano_inicio,
+            "anoFim": ano_fim,
+            "resultados": resultados
+        })
+
+    except Exception as e:
+        _registrar_erro("chat_horizon")
+        logger.exception("Erro interno na função chat_horizon.")
+        return jsonify({"error": f"Erro interno do servidor: {str(e)}"}), 500
+
+@bp.route("/jobs", methods=["POST"])
+def jobs_submeter():
+    # corpo: NDJSON (uma empresa por linha, formato do /chat) ou CSV (?formato=csv ou Content-Type text/csv)
+    formato = request.args.get("formato") or ("csv" if request.mimetype == "text/csv" else "ndjson")
+    if formato not in ("ndjson", "csv"):
+        return jsonify({"error": "Parâmetro 'formato' deve ser 'ndjson' ou 'csv'."}), 400
+    gerenciador = _obter_jobs()
+    if gerenciador.ativos() >= CONFIG.jobs_max_ativos:
+        return jsonify({"error": f"Limite de {CONFIG.jobs_max_ativos} jobs em execução atingido; tente mais tarde."}), 429, {"Retry-After": "30"}
+    job_id = uuid.uuid4().hex
+    diretorio = gerenciador.diretorio(job_id)
+    os.makedirs(diretorio)
+    try:
+        blocos, total = _spool_job(diretorio, request.stream, formato, CONFIG.jobs_bloco_empresas)
+        if total == 0:
+            shutil.rmtree(diretorio, ignore_errors=True)
+            return jsonify({"error": "Entrada vazia: envie ao menos uma empresa."}), 400
+        _gravar_json_atomico(os.path.join(diretorio, "job.json"), {
+            "jobId": job_id, "formato": formato, "criadoEm": time.time(), "total": total, "blocos": blocos
+        })
+        _gravar_json_atomico(os.path.join(diretorio, "progresso.json"), {"status": "pendente", "total": total})
+    except ValueError as e:
+        shutil.rmtree(diretorio, ignore_errors=True)
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        shutil.rmtree(diretorio, ignore_errors=True)
+        _registrar_erro("jobs_submeter")
+        logger.exception("Erro interno na função jobs_submeter.")
         return jsonify({"error": f"Erro interno do servidor: {str(e)}"}), 500
+    gerenciador.iniciar(job_id)
+    return jsonify({"jobId": job_id, "status": "pendente", "total": total, "blocos": len(blocos)}), 202, {"Location": f"/jobs/{job_id}"}
+
+def _progresso_job(job_id):
+    if not job_id.isalnum():
+        return None
+    progresso = _ler_json(os.path.join(_obter_jobs().diretorio(job_id), "progresso.json"))
+    if progresso is not None:
+        progresso["jobId"] = job_id
+    return progresso
+
+@bp.route("/jobs/<job_id>", methods=["GET"])
+def jobs_progresso(job_id):
+    progresso = _progresso_job(job_id)
+    if progresso is None:
+        return jsonify({"error": "Job não encontrado."}), 404
+    return jsonify(progresso), 200
+
+@bp.route("/jobs/<job_id>/retomar", methods=["POST"])
+def jobs_retomar(job_id):
+    # reexecuta só os blocos sem .ok (ex.: depois de um job com status "falhou")
+    progresso = _progresso_job(job_id)
+    if progresso is None:
+        return jsonify({"error": "Job não encontrado."}), 404
+    if progresso["status"] == "concluido":
+        return jsonify(progresso), 200
+    _obter_jobs().iniciar(job_id)
+    return jsonify({"jobId": job_id, "status": progresso["status"]}), 202, {"Location": f"/jobs/{job_id}"}
+
+@bp.route("/jobs/<job_id>/resultados", methods=["GET"])
+def jobs_resultados(job_id):
+    # NDJSON na ordem da entrada; antes do fim só com ?parcial=1 (blocos já concluídos, em ordem)
+    progresso = _progresso_job(job_id)
+    if progresso is None:
+        return jsonify({"error": "Job não encontrado."}), 404
+    if progresso["status"] in ("pendente", "executando") and request.args.get("parcial") != "1":
+        return jsonify({"error": "Job ainda em execução; consulte /jobs/<id> ou use ?parcial=1.", "status": progresso["status"]}), 409
+    diretorio = _obter_jobs().diretorio(job_id)
+    arquivos = sorted(a for a in os.listdir(diretorio) if a.startswith("bloco-") and a.endswith(".ndjson"))
+
+    def gerar():
+        for nome in arquivos:
+            with open(os.path.join(diretorio, nome), "rb") as f:
+                while True:
+                    pedaco = f.read(1 << 20)
+                    if not pedaco:
+                        break
+                    yield pedaco
+
+    return current_app.response_class(gerar(), mimetype="application/x-ndjson",
+                                      headers={"X-Job-Status": progresso["status"]})
+
+# Fábrica da aplicação
+def _configurar(config):
+    # instala a configuração do processo: caches e clientes são recriados com os novos parâmetros
+    global CONFIG, _cache_resultados, _cache_previsao, _perfis, _historico, _cache_ia, _cliente_genai, _cliente_ia, _jobs
+    CONFIG = config
+    _cache_resultados = _CacheResultados(config.cache_max_entries, config.cache_ttl_seconds)
+    _cache_previsao = _CacheResultados(config.forecast_cache_max_entries, float("inf"))
+    _perfis = _CacheResultados(config.profile_max_guardados, 3600)
+    _historico = _HistoricoEmpresas(config.historico_db)
+    _cache_ia = _CacheResultados(config.ai_cache_max_entries, config.ai_cache_ttl_seconds)
+    with _cliente_genai_lock:
+        _cliente_genai = None
+    with _cliente_ia_lock:
+        _cliente_ia = None
+    with _jobs_lock:
+        _jobs = None
+
+_app_criada = False
+
+def create_app(config=None):
+    # config: Config (padrão: CONFIG, lido do ambiente na importação). Caches, métricas e cliente de IA
+    # são do processo: a configuração só pode mudar antes da primeira app; depois, outra diferente é recusada
+    # (trocar os globais faria a app anterior calcular com parâmetros que não são os dela).
+    global _app_criada
+    if config is not None and config != CONFIG:
+        if _app_criada:
+            raise ValueError("create_app: este processo já tem uma app com outra configuração; "
+                             "use um processo por configuração.")
+        _configurar(config)
+    config = CONFIG
+    _app_criada = True
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=config.log_level)
+    if not config.api_key:
+        logger.warning("CHAVE_API_GEMINI / chaveApiGemini não definida: /chat?mode=ai responderá com o cálculo do backend.")
+    flask_app = Flask(__name__)
+    flask_app.config["SIMULADOR"] = config
+    flask_app.register_blueprint(bp)
+    return flask_app
+
+def __getattr__(nome):
+    # "app:app" (gunicorn etc.) continua funcionando: a app padrão é criada no primeiro acesso
+    if nome == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
+
+def _cli_stream(argv):
+    # python app.py stream <arquivo|-> [-o saida]: mesmo NDJSON do /chat/stream, sem servidor
+    parser = argparse.ArgumentParser(prog="app.py stream", description="Simula um NDJSON de empresas (uma por linha) e escreve um resultado por linha.")
+    parser.add_argument("entrada", help="arquivo NDJSON ou - para a entrada padrão")
+    parser.add_argument("-o", "--saida", help="arquivo de resultados (padrão: saída padrão)")
+    args = parser.parse_args(argv)
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=CONFIG.log_level)
+
+    total = sucesso = 0
+    with contextlib.ExitStack() as pilha:
+        if args.entrada == "-":
+            linhas = sys.stdin.buffer
+        else:
+            # arquivo local: mmap, o kernel pagina a entrada sob demanda (sem cópia para o heap)
+            f = pilha.enter_context(open(args.entrada, "rb"))
+            linhas = io.BytesIO()
+            if os.fstat(f.fileno()).st_size:
+                mapa = pilha.enter_context(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+                linhas = _LeitorMmap(mapa)
+        saida = pilha.enter_context(open(args.saida, "wb")) if args.saida else sys.stdout.buffer
+        try:
+            for resultado in _simular_linhas(_linhas_ndjson(linhas)):
+                saida.write(_linha_resultado(resultado))
+                if saida is sys.stdout.buffer:
+                    saida.flush()
+                total += 1
+                sucesso += resultado["status"] == 200
+        except BrokenPipeError:
+            # leitor fechou a saída (ex.: "| head"): encerra sem traceback
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            return 1
+    print(f"{total} empresas: {sucesso} simuladas, {total - sucesso} com erro.", file=sys.stderr)
+    return 0
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["stream"]:
+        sys.exit(_cli_stream(sys.argv[2:]))
     # Em produção, remova debug=True
-    app.run(host="0.0.0.0", port=8000, debug=True)
+    create_app().run(host="0.0.0.0", port=8000, debug=True)
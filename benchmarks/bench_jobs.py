@@ -0,0 +1,95 @@
+"""Vazão do /jobs: empresas por segundo com 1, 2, 4... processos no pool e o ganho sobre 1 processo.
+
+Uso:
+    python benchmarks/bench_jobs.py [--empresas 5000] [--processos 1,2,4,8] [--bloco 500] [--json atual.json]
+
+Cada medida submete o mesmo lote (dados_sinteticos.py, modo determinístico) num diretório de jobs
+temporário e espera o status final; o tempo inclui o spool da entrada e a partida do pool (spawn).
+Cada tamanho de pool roda num processo Python novo (a configuração do app é do processo).
+O ganho só é linear até o número de núcleos da máquina (os.cpu_count()).
+"""
+import argparse
+import dataclasses
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import app
+import dados_sinteticos
+import resultados
+
+
+def rodar_job(cliente_http, corpo):
+    resposta = cliente_http.post("/jobs", data=corpo, content_type="application/x-ndjson")
+    if resposta.status_code != 202:
+        raise SystemExit(f"/jobs devolveu {resposta.status_code}: {resposta.get_data(as_text=True)}")
+    job_id = resposta.get_json()["jobId"]
+    while True:
+        progresso = cliente_http.get(f"/jobs/{job_id}").get_json()
+        if progresso["status"] not in ("pendente", "executando"):
+            return progresso
+        time.sleep(0.05)
+
+
+def medir(args):
+    # um tamanho de pool, neste processo: imprime {"duracao": s, "progresso": {...}}
+    empresas = [dict(e, useAiForecast=False) for e in dados_sinteticos.gerar_lote(args.seed, args.empresas)]
+    corpo = "\n".join(json.dumps(e) for e in empresas).encode("utf-8")
+    diretorio = tempfile.mkdtemp(prefix="bench-jobs-")
+    try:
+        config = dataclasses.replace(app.Config.do_ambiente(), jobs_dir=diretorio, jobs_processos=args.medir,
+                                     jobs_bloco_empresas=args.bloco, historico_db="")
+        cliente_http = app.create_app(config).test_client()
+        inicio = time.perf_counter()
+        progresso = rodar_job(cliente_http, corpo)
+        duracao = time.perf_counter() - inicio
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+    print(json.dumps({"duracao": duracao, "progresso": progresso}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--empresas", type=int, default=5000)
+    parser.add_argument("--processos", default="1,2,4,8", help="tamanhos do pool, separados por vírgula")
+    parser.add_argument("--bloco", type=int, default=500, help="empresas por bloco")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="grava os resultados neste arquivo")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior")
+    parser.add_argument("--tolerancia", type=float, default=0.15)
+    parser.add_argument("--medir", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.medir:
+        return medir(args)
+
+    metricas = {}
+    base = None
+    for processos in (int(p) for p in args.processos.split(",")):
+        saida = subprocess.run([sys.executable, os.path.abspath(__file__), "--medir", str(processos),
+                                "--empresas", str(args.empresas), "--bloco", str(args.bloco), "--seed", str(args.seed)],
+                               check=True, capture_output=True, text=True).stdout
+        medida = json.loads(saida.splitlines()[-1])
+        progresso, duracao = medida["progresso"], medida["duracao"]
+        if progresso["status"] != "concluido":
+            raise SystemExit(f"job terminou com status {progresso['status']}: {progresso}")
+        vazao = args.empresas / duracao
+        base = base or vazao
+        metricas[f"empresas_por_s.p{processos}"] = resultados.metrica(vazao, "emp/s", menor_melhor=False)
+        print(f"{processos:>3} processos  {duracao:8.2f} s  {vazao:10.1f} empresas/s  ganho {vazao / base:5.2f}x")
+
+    if args.json:
+        resultados.salvar(args.json, "jobs", args.seed, metricas, {
+            "empresas": args.empresas, "bloco": args.bloco, "nucleos": os.cpu_count()
+        })
+    if args.comparar and resultados.comparar(metricas, args.comparar, args.tolerancia):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Vazão do motor vetorial (numpy) contra o motor escalar no cálculo dos regimes.
+
+Uso:
+    python benchmarks/bench_motor_vetorial.py [--tamanhos 1000,100000,1000000] [--limite-escalar 100000]
+        [--json saida.json] [--comparar base.json] [--tolerancia 0.15]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np
+
+import app
+import resultados
+
+
+def gerar_matriz(n, seed):
+    rng = np.random.default_rng(seed)
+    faturamento = rng.integers(1_000_00, 50_000_000_00, size=n, dtype=np.int64)
+    folha = (faturamento * rng.uniform(0.05, 0.6, size=n)).astype(np.int64)
+    valor_adicionado = (faturamento * rng.uniform(0.3, 1.0, size=n)).astype(np.int64)
+    lucro = (faturamento * rng.uniform(-0.05, 0.3, size=n)).astype(np.int64)
+    return np.stack([faturamento, folha, valor_adicionado, lucro], axis=1)
+
+
+def medir(funcao, repeticoes):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tamanhos", default="1000,100000,1000000")
+    parser.add_argument("--limite-escalar", type=int, default=100000,
+                        help="maior N em que o motor escalar também é medido")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="grava os resultados neste arquivo")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior")
+    parser.add_argument("--tolerancia", type=float, default=0.15, help="piora relativa aceita no --comparar")
+    args = parser.parse_args()
+
+    aliquotas = app._parse_aliquotas({})
+    metricas = {}
+    for n in (int(t) for t in args.tamanhos.split(",")):
+        matriz = gerar_matriz(n, args.seed)
+        tempo_vetorial = medir(lambda: app._calcular_regimes_vetorial(matriz, aliquotas), args.repeticoes)
+        metricas[f"vetorial_{n}_ms"] = resultados.metrica(tempo_vetorial * 1e3, "ms")
+        linha = f"{n:>9} empresas | vetorial {tempo_vetorial * 1e3:9.2f} ms ({n / tempo_vetorial:,.0f}/s)"
+        if n <= args.limite_escalar:
+            agregados = [dict(zip(app.AGREGADOS_COLUNAS, map(int, row))) for row in matriz]
+            tempo_escalar = medir(lambda: [app._calcular_regimes(a, aliquotas) for a in agregados], 1)
+            metricas[f"escalar_{n}_ms"] = resultados.metrica(tempo_escalar * 1e3, "ms")
+            metricas[f"aceleracao_{n}"] = resultados.metrica(tempo_escalar / tempo_vetorial, "x", menor_melhor=False)
+            linha += (f" | escalar {tempo_escalar * 1e3:9.2f} ms ({n / tempo_escalar:,.0f}/s)"
+                      f" | {tempo_escalar / tempo_vetorial:.1f}x")
+        print(linha)
+
+    if args.json:
+        resultados.salvar(args.json, "motor_vetorial", args.seed, metricas,
+                          {"tamanhos": args.tamanhos, "repeticoes": args.repeticoes})
+    if args.comparar and resultados.comparar(metricas, args.comparar, args.tolerancia):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
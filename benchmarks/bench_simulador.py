@@ -0,0 +1,95 @@
+"""Micro-benchmarks do caminho do /chat: _complete_12_months, _distribute_monthly e o /chat completo.
+
+Uso:
+    python benchmarks/bench_simulador.py [--empresas 500] [--seed 42] [--json atual.json] [--comparar base.json]
+
+As entradas vêm de dados_sinteticos.py (mesma seed, mesmas empresas). O /chat roda pelo test client do
+Flask no modo determinístico, que não usa o Gemini (não precisa de chave).
+Com --comparar, o processo termina com código 1 se alguma métrica piorar além de --tolerancia.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import app
+import dados_sinteticos
+import resultados
+
+
+def medir(funcao, itens, repeticoes):
+    # melhor tempo por item (us) entre as repetições
+    melhor = float("inf")
+    for r in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao(r)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor / itens * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--empresas", type=int, default=500, help="empresas por perfil")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="grava os resultados neste arquivo")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior")
+    parser.add_argument("--tolerancia", type=float, default=0.10, help="piora relativa aceita no --comparar")
+    args = parser.parse_args()
+
+    cliente_http = app.create_app().test_client()
+    metricas = {}
+
+    def registrar(nome, us):
+        metricas[nome] = resultados.metrica(us, "us")
+        print(f"{nome:<40} {us:10.1f} us/item")
+
+    for perfil in dados_sinteticos.PERFIS:
+        empresas = dados_sinteticos.gerar_lote(args.seed, args.empresas, [perfil])
+        n = len(empresas)
+
+        # previsão local sem cache: companyId diferente a cada repetição força o ajuste
+        def completar(r, use_ai):
+            for e in empresas:
+                app._complete_12_months(e["targetYearMonthly"], e["historicalMonthly"], use_ai,
+                                        e["year"], f"bench:{r}:{e['companyId']}")
+        registrar(f"completar_meses.{perfil}", medir(lambda r: completar(r, False), n, args.repeticoes))
+        if perfil != "vazio":
+            registrar(f"completar_meses_previsao.{perfil}", medir(lambda r: completar(r, True), n, args.repeticoes))
+
+        # /chat sem cache (companyId novo a cada repetição) e com cache (mesma entrada de novo)
+        def chat(r, frio):
+            for e in empresas:
+                entrada = dict(e, companyId=f"bench:{r}:{e['companyId']}") if frio else e
+                resposta = cliente_http.post("/chat", json=entrada)
+                if resposta.status_code != 200:
+                    raise SystemExit(f"/chat devolveu {resposta.status_code}: {resposta.get_data(as_text=True)}")
+        registrar(f"chat_sem_cache.{perfil}", medir(lambda r: chat(r, True), n, args.repeticoes))
+        registrar(f"chat_com_cache.{perfil}", medir(lambda r: chat(r, False), n, args.repeticoes))
+
+    rng = random.Random(args.seed)
+    faturamentos = [[rng.randint(0, 10 ** 9) for _ in range(12)] for _ in range(1000)]
+    totais = [rng.randint(0, 10 ** 10) for _ in range(1000)]
+    pares = list(zip(totais, faturamentos))
+
+    def distribuir(_):
+        for total, fat in pares:
+            app._distribute_monthly(total, fat)
+    registrar("distribute_monthly", medir(distribuir, len(pares), args.repeticoes))
+
+    def ratear_regimes(_):
+        for total, fat in pares:
+            app._ratear((total, total // 2, total // 3), app._cotas_mensais(fat))
+    registrar("rateio_tres_regimes", medir(ratear_regimes, len(pares), args.repeticoes))
+
+    if args.json:
+        resultados.salvar(args.json, "simulador", args.seed, metricas, {"empresasPorPerfil": args.empresas})
+    if args.comparar and resultados.comparar(metricas, args.comparar, args.tolerancia):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
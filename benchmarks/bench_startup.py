@@ -0,0 +1,86 @@
+"""Tempo de partida de um worker: importar o app, criar a app e responder o primeiro /chat.
+
+Uso:
+    python benchmarks/bench_startup.py [--repeticoes 10] [--json atual.json] [--comparar base.json]
+
+Cada medição roda num processo Python novo (como um fork de worker ou um cold start), sem chave do
+Gemini. Como referência, também mede a importação do google.genai, que o app só faz no primeiro
+uso do modo IA.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import resultados
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# cada script imprime um JSON {etapa: segundos} medido dentro do processo novo
+_SCRIPT = """
+import json, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+flask_app = app.create_app()
+t2 = time.perf_counter()
+entrada = {"companyId": 1, "year": 2026, "historicalMonthly": [],
+           "targetYearMonthly": [{"ano": 2026, "mes": 1, "receitaBruta": "1000.00", "folhaSalarios": "100.00"}]}
+resposta = flask_app.test_client().post("/chat", json=entrada)
+t3 = time.perf_counter()
+assert resposta.status_code == 200, resposta.get_data(as_text=True)
+print(json.dumps({"import_app": t1 - t0, "create_app": t2 - t1, "primeiro_chat": t3 - t2, "total": t3 - t0}))
+"""
+
+_SCRIPT_GENAI = """
+import json, time
+t0 = time.perf_counter()
+from google import genai
+print(json.dumps({"import_genai": time.perf_counter() - t0}))
+"""
+
+
+def rodar(script):
+    env = {k: v for k, v in os.environ.items() if k not in ("CHAVE_API_GEMINI", "chaveApiGemini")}
+    saida = subprocess.run([sys.executable, "-c", script], cwd=RAIZ, env=env, capture_output=True, text=True, check=True)
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeticoes", type=int, default=10)
+    parser.add_argument("--sem-genai", action="store_true", help="não mede a importação do google.genai")
+    parser.add_argument("--json", help="grava os resultados neste arquivo")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior")
+    parser.add_argument("--tolerancia", type=float, default=0.15)
+    args = parser.parse_args()
+
+    amostras = {}
+    for _ in range(args.repeticoes):
+        for etapa, segundos in rodar(_SCRIPT).items():
+            amostras.setdefault(etapa, []).append(segundos)
+        if not args.sem_genai:
+            try:
+                for etapa, segundos in rodar(_SCRIPT_GENAI).items():
+                    amostras.setdefault(etapa, []).append(segundos)
+            except subprocess.CalledProcessError:
+                args.sem_genai = True  # SDK não instalado: nada a comparar
+
+    metricas = {}
+    for etapa, valores in amostras.items():
+        mediana = statistics.median(valores) * 1e3
+        metricas[f"{etapa}_ms"] = resultados.metrica(mediana, "ms")
+        print(f"{etapa:<14} mediana {mediana:8.1f} ms   mín {min(valores) * 1e3:8.1f} ms")
+
+    if args.json:
+        resultados.salvar(args.json, "startup", None, metricas, {"repeticoes": args.repeticoes})
+    if args.comparar and resultados.comparar(metricas, args.comparar, args.tolerancia):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
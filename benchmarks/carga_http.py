@@ -0,0 +1,155 @@
+"""Gerador de carga HTTP para o /chat: latência p50/p95/p99 e requisições por segundo.
+
+Uso:
+    python benchmarks/carga_http.py [--concorrencia 8] [--requisicoes 2000] [--distintos 0] [--json atual.json]
+    python benchmarks/carga_http.py --url http://127.0.0.1:5000 ...   # contra um servidor já no ar
+
+Sem --url o app sobe neste processo (servidor threaded do werkzeug numa porta livre) com o cliente do
+Gemini apontando para tools/gemini_stub.py, sem chave nem rede; --modo ai exercita o caminho do modelo
+(--atraso-ia simula a latência do stub). Cliente e servidor dividem o processo, então os números servem para
+comparar execuções na mesma máquina, não como capacidade absoluta.
+--distintos N repete N entradas (0 = todas diferentes, sem acerto de cache).
+"""
+import argparse
+import http.client
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, "tools"))
+
+import dados_sinteticos
+import resultados
+
+
+def subir_app_local(atraso_ia):
+    import dataclasses
+
+    from werkzeug.serving import make_server
+
+    import app
+    import gemini_stub
+
+    stub, url_stub = gemini_stub.iniciar(atraso=atraso_ia, seed=0)
+    config = dataclasses.replace(app.Config.do_ambiente(), api_key="stub", gemini_base_url=url_stub)
+    flask_app = app.create_app(config)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)  # sem uma linha de log por requisição
+    servidor = make_server("127.0.0.1", 0, flask_app, threaded=True)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{servidor.server_port}", (servidor, stub)
+
+
+def percentil(ordenados, p):
+    # nearest-rank
+    if not ordenados:
+        return 0.0
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+def disparar(url, corpos, caminho, concorrencia):
+    # cada thread consome índices de uma fila compartilhada; devolve [(latência_s, status)]
+    alvo = urlsplit(url)
+    proximo = iter(range(len(corpos)))
+    lock = threading.Lock()
+    medicoes = []
+
+    def trabalhador():
+        conexao = http.client.HTTPConnection(alvo.hostname, alvo.port, timeout=60)
+        locais = []
+        while True:
+            with lock:
+                i = next(proximo, None)
+            if i is None:
+                break
+            inicio = time.perf_counter()
+            try:
+                conexao.request("POST", caminho, body=corpos[i], headers={"Content-Type": "application/json"})
+                resposta = conexao.getresponse()
+                resposta.read()
+                status = resposta.status
+                if resposta.getheader("Connection", "").lower() == "close" or resposta.version == 10:
+                    conexao.close()
+            except (OSError, http.client.HTTPException):
+                conexao.close()
+                status = 0
+            locais.append((time.perf_counter() - inicio, status))
+        conexao.close()
+        with lock:
+            medicoes.extend(locais)
+
+    threads = [threading.Thread(target=trabalhador) for _ in range(concorrencia)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return medicoes, time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="servidor já no ar (padrão: sobe o app neste processo)")
+    parser.add_argument("--modo", choices=("deterministico", "ai"), default="deterministico")
+    parser.add_argument("--atraso-ia", type=float, default=0.05, help="latência do stub do Gemini (s)")
+    parser.add_argument("--concorrencia", type=int, default=8)
+    parser.add_argument("--requisicoes", type=int, default=2000)
+    parser.add_argument("--aquecimento", type=int, default=100, help="requisições descartadas antes da medição")
+    parser.add_argument("--distintos", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="grava os resultados neste arquivo")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior")
+    parser.add_argument("--tolerancia", type=float, default=0.15)
+    args = parser.parse_args()
+
+    url = args.url or subir_app_local(args.atraso_ia)[0]
+    caminho = "/chat?mode=ai" if args.modo == "ai" else "/chat"
+
+    total = args.aquecimento + args.requisicoes
+    base = dados_sinteticos.gerar_lote(args.seed, args.distintos or total)
+    corpos = []
+    for i in range(total):
+        empresa = base[i % len(base)]
+        if not args.distintos:
+            # companyId único: cada requisição é um miss no cache de resultados
+            empresa = dict(empresa, companyId=f"carga:{args.seed}:{i}")
+        corpos.append(json.dumps(empresa).encode("utf-8"))
+
+    disparar(url, corpos[:args.aquecimento], caminho, args.concorrencia)
+    medicoes, duracao = disparar(url, corpos[args.aquecimento:], caminho, args.concorrencia)
+
+    latencias = sorted(m[0] * 1e3 for m in medicoes)
+    por_status = {}
+    for _, status in medicoes:
+        por_status[str(status)] = por_status.get(str(status), 0) + 1
+    metricas = {
+        "p50_ms": resultados.metrica(percentil(latencias, 50), "ms"),
+        "p95_ms": resultados.metrica(percentil(latencias, 95), "ms"),
+        "p99_ms": resultados.metrica(percentil(latencias, 99), "ms"),
+        "max_ms": resultados.metrica(latencias[-1] if latencias else 0.0, "ms"),
+        "rps": resultados.metrica(len(medicoes) / duracao, "req/s", menor_melhor=False),
+    }
+    print(f"{len(medicoes)} requisições em {duracao:.2f}s, concorrência {args.concorrencia}, status {por_status}")
+    for nome, m in metricas.items():
+        print(f"  {nome:<8} {m['valor']:10.2f} {m['unidade']}")
+
+    if args.json:
+        resultados.salvar(args.json, "carga_http", args.seed, metricas, {
+            "modo": args.modo, "concorrencia": args.concorrencia, "requisicoes": len(medicoes),
+            "distintos": args.distintos, "status": por_status
+        })
+    falhas = len(medicoes) - por_status.get("200", 0)
+    if falhas:
+        print(f"{falhas} requisições sem status 200.")
+    if (args.comparar and resultados.comparar(metricas, args.comparar, args.tolerancia)) or falhas:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Gerador determinístico de entradas do /chat para benchmarks e testes de carga.
+
+A mesma seed gera sempre as mesmas empresas. Os perfis variam a quantidade de meses do ano-alvo e do
+histórico e se os anos vêm completos ou esparsos (meses faltando, valores nulos).
+"""
+import random
+
+ANO = 2026
+
+# nome -> (meses do ano-alvo, meses de histórico, esparso)
+PERFIS = {
+    "vazio": (0, 0, False),
+    "so_historico": (0, 36, False),
+    "esparso": (4, 18, True),
+    "parcial": (8, 12, False),
+    "completo": (12, 24, False),
+}
+
+
+def _valor(rng, base, esparso):
+    if esparso and rng.random() < 0.15:
+        return None
+    return f"{base * rng.uniform(0.8, 1.2):.2f}"
+
+
+def _mes(rng, ano, mes, escala, esparso):
+    entrada = {
+        "ano": ano,
+        "mes": mes,
+        "receitaBruta": _valor(rng, escala, esparso),
+        "folhaSalarios": _valor(rng, escala * 0.25, esparso),
+        "insumos": _valor(rng, escala * 0.35, esparso),
+    }
+    if rng.random() < 0.7:
+        entrada["lucroLiquidoContabil"] = _valor(rng, escala * 0.12, esparso)
+    return entrada
+
+
+def gerar_empresa(rng, company_id, perfil, ano=ANO):
+    meses_alvo, meses_historico, esparso = PERFIS[perfil]
+    escala = 10 ** rng.uniform(4, 6.5)  # faturamento mensal entre ~10 mil e ~3 milhões
+    meses = sorted(rng.sample(range(1, 13), meses_alvo))
+    historico = []
+    for k in range(meses_historico):
+        t = ano * 12 - meses_historico + k
+        if esparso and rng.random() < 0.3:
+            continue
+        historico.append(_mes(rng, t // 12, t % 12 + 1, escala, esparso))
+    dados = {
+        "companyId": company_id,
+        "year": ano,
+        "targetYearMonthly": [_mes(rng, ano, m, escala, esparso) for m in meses],
+        "historicalMonthly": historico,
+        "useAiForecast": rng.random() < 0.5,
+    }
+    if rng.random() < 0.2:
+        dados["cbsRate"] = rng.choice(["0.087", "0.1", "0.125"])
+    if rng.random() < 0.2:
+        dados["simplesShare"] = rng.choice(["0.5", "0.7"])
+    return dados
+
+
+def gerar_lote(seed, n, perfis=None):
+    # n empresas alternando entre os perfis pedidos (todos por padrão)
+    rng = random.Random(seed)
+    perfis = list(perfis or PERFIS)
+    return [gerar_empresa(rng, i, perfis[i % len(perfis)]) for i in range(n)]
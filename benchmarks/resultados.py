@@ -0,0 +1,51 @@
+"""Gravação e comparação de resultados dos benchmarks (JSON).
+
+Cada execução grava {"benchmark", "seed", "ambiente", "metricas": {nome: {"valor", "unidade", "menor_melhor"}}}.
+Comparando com uma execução anterior, métricas que pioraram além da tolerância são regressões.
+"""
+import json
+import platform
+import sys
+import time
+
+
+def metrica(valor, unidade, menor_melhor=True):
+    return {"valor": valor, "unidade": unidade, "menor_melhor": menor_melhor}
+
+
+def ambiente():
+    return {
+        "python": platform.python_version(),
+        "implementacao": platform.python_implementation(),
+        "plataforma": platform.platform(),
+        "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "argv": sys.argv[1:],
+    }
+
+
+def salvar(caminho, benchmark, seed, metricas, extra=None):
+    dados = {"benchmark": benchmark, "seed": seed, "ambiente": ambiente(), "metricas": metricas}
+    if extra:
+        dados.update(extra)
+    with open(caminho, "w", encoding="utf-8") as f:
+        json.dump(dados, f, indent=2, ensure_ascii=False)
+
+
+def comparar(metricas, caminho_base, tolerancia):
+    # imprime a variação de cada métrica em relação à base; retorna os nomes das regressões
+    with open(caminho_base, encoding="utf-8") as f:
+        base = json.load(f)["metricas"]
+    regressoes = []
+    print(f"\nComparação com {caminho_base} (tolerância {tolerancia:.0%}):")
+    for nome, atual in metricas.items():
+        anterior = base.get(nome)
+        if anterior is None or not anterior["valor"]:
+            print(f"  {nome:<40} sem base")
+            continue
+        variacao = atual["valor"] / anterior["valor"] - 1
+        piora = variacao if atual["menor_melhor"] else -variacao
+        marca = "REGRESSÃO" if piora > tolerancia else ""
+        if marca:
+            regressoes.append(nome)
+        print(f"  {nome:<40} {anterior['valor']:>12.2f} -> {atual['valor']:>12.2f} {atual['unidade']:<5} {variacao:+7.1%} {marca}")
+    return regressoes
@@ -0,0 +1,22 @@
+import dataclasses
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import app
+
+
+@pytest.fixture(scope="session")
+def config(tmp_path_factory):
+    # uma configuração para a sessão (create_app recusa outra diferente no mesmo processo): histórico num
+    # SQLite temporário e sem cache de resultados, então cada /chat é calculado de novo
+    historico = tmp_path_factory.mktemp("historico") / "historico.sqlite3"
+    return dataclasses.replace(app.Config.do_ambiente(), api_key=None, historico_db=str(historico), cache_max_entries=0)
+
+
+@pytest.fixture
+def cliente(config):
+    return app.create_app(config).test_client()
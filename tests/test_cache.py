@@ -0,0 +1,92 @@
+"""Cache de resultados do /chat (_CacheResultados) e ETag/If-None-Match."""
+import dataclasses
+from decimal import Decimal
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    # o conftest desliga o cache (cache_max_entries=0); aqui ele fica ligado só durante o teste
+    cache = app._CacheResultados(16, 60)
+    monkeypatch.setattr(app, "_cache_resultados", cache)
+    return cache
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    agora = [1000.0]
+    monkeypatch.setattr(app.time, "monotonic", lambda: agora[0])
+    return agora
+
+
+def _dados(company_id="cache", **extra):
+    return dict({"companyId": company_id, "year": 2026, "targetYearMonthly": [
+        {"ano": 2026, "mes": m, "receitaBruta": f"{1000 * m}.00", "folhaSalarios": "300.00"} for m in range(1, 13)]}, **extra)
+
+
+def test_lru_descarta_o_menos_usado():
+    cache = app._CacheResultados(2, 60)
+    cache.put("a", b"1")
+    cache.put("b", b"2")
+    assert cache.get("a") == b"1"  # "a" passa a ser o mais recente
+    cache.put("c", b"3")
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (b"1", b"3")
+    assert cache.stats()["entradas"] == 2
+
+
+def test_ttl_expira(relogio):
+    cache = app._CacheResultados(4, 10)
+    cache.put("a", b"1")
+    relogio[0] += 10
+    assert cache.get("a") == b"1"
+    relogio[0] += 0.5
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert (stats["entradas"], stats["hits"], stats["misses"]) == (0, 1, 1)
+
+
+def test_hit_miss_e_304(cliente, cache):
+    primeira = cliente.post("/chat", json=_dados())
+    segunda = cliente.post("/chat", json=_dados())
+    assert (primeira.headers["X-Cache"], segunda.headers["X-Cache"]) == ("MISS", "HIT")
+    assert segunda.get_data() == primeira.get_data()
+    assert segunda.headers["ETag"] == primeira.headers["ETag"]
+
+    nao_modificado = cliente.post("/chat", json=_dados(), headers={"If-None-Match": primeira.headers["ETag"]})
+    assert nao_modificado.status_code == 304 and nao_modificado.get_data() == b""
+    assert nao_modificado.headers["ETag"] == primeira.headers["ETag"]
+    outro = cliente.post("/chat", json=_dados(), headers={"If-None-Match": '"outro"'})
+    assert outro.status_code == 200 and outro.headers["X-Cache"] == "HIT"
+
+
+def test_default_muda_a_chave(cliente, cache, monkeypatch):
+    antes = cliente.post("/chat", json=_dados())
+    monkeypatch.setattr(app, "CONFIG", dataclasses.replace(app.CONFIG, default_cbs_rate=Decimal("0.13")))
+    depois = cliente.post("/chat", json=_dados())
+    assert depois.headers["X-Cache"] == "MISS"
+    assert depois.headers["ETag"] != antes.headers["ETag"]
+    assert depois.get_data() != antes.get_data()
+    # a chave usa as alíquotas efetivas: o antigo padrão mandado explicitamente volta ao mesmo ETag
+    explicito = cliente.post("/chat", json=_dados(cbsRate="0.12"))
+    assert explicito.headers["ETag"] == antes.headers["ETag"]
+    assert explicito.get_data() == antes.get_data()
+
+
+def test_nova_versao_do_historico_muda_a_chave(cliente, cache):
+    dados = {"companyId": "cache-historico", "year": 2027}
+    mes = {"ano": 2026, "mes": 1, "receitaBruta": "5000.00"}
+    assert cliente.post("/historico", json={"companyId": dados["companyId"], "historicalMonthly": [mes]}).status_code == 200
+    antes = cliente.post("/chat", json=dados)
+    assert cliente.post("/chat", json=dados).headers["X-Cache"] == "HIT"
+
+    # reenviar o mesmo mês não muda a versão; um mês novo muda
+    cliente.post("/historico", json={"companyId": dados["companyId"], "historicalMonthly": [mes]})
+    assert cliente.post("/chat", json=dados).headers["ETag"] == antes.headers["ETag"]
+    cliente.post("/historico", json={"companyId": dados["companyId"], "historicalMonthly": [dict(mes, mes=2)]})
+    depois = cliente.post("/chat", json=dados, headers={"If-None-Match": antes.headers["ETag"]})
+    assert depois.status_code == 200 and depois.headers["X-Cache"] == "MISS"
+    assert depois.headers["ETag"] != antes.headers["ETag"]
@@ -0,0 +1,23 @@
+"""create_app: a configuração é do processo; uma segunda, diferente, é recusada."""
+import dataclasses
+from decimal import Decimal
+
+import pytest
+
+import app
+
+
+def test_outra_configuracao_recusada(config):
+    primeira = app.create_app(config)
+    outra = dataclasses.replace(config, default_cbs_rate=Decimal("0.50"))
+    with pytest.raises(ValueError):
+        app.create_app(outra)
+    assert app.CONFIG == config
+    assert primeira.config["SIMULADOR"] is app.CONFIG
+
+
+def test_mesma_configuracao_compartilha(config):
+    a1 = app.create_app(config)
+    a2 = app.create_app(dataclasses.replace(config))
+    a3 = app.create_app()
+    assert a1.config["SIMULADOR"] == a2.config["SIMULADOR"] == a3.config["SIMULADOR"] == config
@@ -0,0 +1,109 @@
+"""/chat com o histórico armazenado (/historico) contra o mesmo histórico mandado no corpo."""
+import json
+import random
+import sqlite3
+
+import pytest
+
+import app
+
+
+def _valor(rng, base):
+    return None if rng.random() < 0.05 else f"{base * rng.uniform(0.7, 1.3):.2f}"
+
+
+def _empresa(rng, company_id):
+    # histórico em ordem cronológica: no corpo, o ano dos meses preenchidos vem do primeiro mês enviado
+    escala = 10 ** rng.uniform(3, 6.5)
+    crescimento = rng.uniform(-0.02, 0.03)
+    fim = 2025 * 12 + rng.randint(0, 11)
+    historico = []
+    for t in range(fim - rng.randint(1, 48) + 1, fim + 1):
+        if rng.random() < 0.15:
+            continue
+        base = escala * (1 + crescimento) ** (t - fim)
+        mes = {"ano": t // 12, "mes": t % 12 + 1, "receitaBruta": _valor(rng, base),
+               "folhaSalarios": _valor(rng, base * 0.25), "insumos": _valor(rng, base * 0.35)}
+        if rng.random() < 0.7:
+            mes["lucroLiquidoContabil"] = _valor(rng, base * rng.uniform(-0.1, 0.2))
+        historico.append(mes)
+    alvo = [{"ano": 2026, "mes": m, "receitaBruta": _valor(rng, escala)} for m in sorted(rng.sample(range(1, 13), rng.randint(0, 6)))]
+    return {"companyId": company_id, "year": rng.randint(2026, 2028), "targetYearMonthly": alvo, "historicalMonthly": historico}
+
+
+def _comparar(cliente, dados):
+    historico = dados.pop("historicalMonthly")
+    assert cliente.post("/historico", json={"companyId": dados["companyId"], "historicalMonthly": historico}).status_code == 200
+    armazenado = cliente.post("/chat", json=dados).get_json()
+    no_corpo = cliente.post("/chat", json=dict(dados, historicalMonthly=historico)).get_json()
+    return armazenado, no_corpo
+
+
+def test_preenchimento_pela_media_identico(cliente):
+    rng = random.Random(13)
+    for i in range(200):
+        armazenado, no_corpo = _comparar(cliente, dict(_empresa(rng, f"media{i}"), useAiForecast=False))
+        assert armazenado == no_corpo
+
+
+def test_previsao_local_identica(cliente):
+    pytest.importorskip("numpy")
+    rng = random.Random(14)
+    for i in range(300):
+        armazenado, no_corpo = _comparar(cliente, dict(_empresa(rng, f"previsao{i}"), useAiForecast=True))
+        assert armazenado == no_corpo
+
+
+def test_reingestao_de_meses_alterados(cliente):
+    # retirar a versão anterior de um mês desfaz a soma sem resíduo, inclusive a dos logs
+    rng = random.Random(15)
+    for i in range(20):
+        dados = _empresa(rng, f"reingestao{i}")
+        historico = dados["historicalMonthly"]
+        for use_ai in (False, True):
+            _comparar(cliente, dict(dados, useAiForecast=use_ai))
+            for j in rng.sample(range(len(historico)), min(3, len(historico))):
+                historico[j] = dict(historico[j], receitaBruta=f"{rng.uniform(1, 1e6):.2f}")
+            armazenado, no_corpo = _comparar(cliente, dict(dados, useAiForecast=use_ai, historicalMonthly=historico))
+            assert armazenado == no_corpo
+
+
+def test_agregados_no_formato_antigo_sao_refeitos(cliente):
+    # formato 1: sem "formato" e com as somas dos logs em float
+    dados = dict(_empresa(random.Random(16), "formato1"), useAiForecast=True)
+    esperado, _ = _comparar(cliente, dict(dados))
+    with sqlite3.connect(app.CONFIG.historico_db) as conexao:
+        chave = app._chave_empresa("formato1")
+        (texto,) = conexao.execute("SELECT agregados FROM historico_agregados WHERE company_id = ?", (chave,)).fetchone()
+        agregados = json.loads(texto)
+        del agregados["formato"]
+        for serie in agregados["series"].values():
+            serie["sl"], serie["stl"] = serie["sl"] / app._LOG_ESCALA, serie["stl"] / app._LOG_ESCALA
+            serie["mes_sl"] = [v / app._LOG_ESCALA for v in serie["mes_sl"]]
+        conexao.execute("UPDATE historico_agregados SET agregados = ?, versao = versao + 1 WHERE company_id = ?",
+                        (json.dumps(agregados), chave))
+    sem_historico = {k: v for k, v in dados.items() if k != "historicalMonthly"}
+    assert cliente.post("/chat", json=sem_historico).get_json() == esperado
+
+
+def test_company_id_inteiro_e_texto_separados(cliente):
+    mes = {"ano": 2025, "mes": 1, "receitaBruta": "100.00"}
+    assert cliente.post("/historico", json={"companyId": 777, "historicalMonthly": [mes]}).status_code == 200
+    assert cliente.post("/historico", json={"companyId": "777", "historicalMonthly": [mes, dict(mes, mes=2)]}).status_code == 200
+    assert cliente.get("/historico/777").get_json()["totalMeses"] == 1
+    assert cliente.get("/historico/777?tipo=texto").get_json()["totalMeses"] == 2
+    resposta = cliente.post("/historico", json={"companyId": 7.5, "historicalMonthly": [mes]})
+    assert resposta.status_code == 400 and resposta.get_json()["erros"][0]["campo"] == "companyId"
+
+
+def test_chaves_antigas_migradas(tmp_path):
+    caminho = str(tmp_path / "antigo.sqlite3")
+    with sqlite3.connect(caminho) as conexao:
+        conexao.executescript(app._HISTORICO_SCHEMA)
+        for antiga in ("123", "abc", "007"):
+            conexao.execute("INSERT INTO historico_agregados VALUES (?, 1, ?)", (antiga, json.dumps(app._agregados_historico_vazios())))
+            conexao.execute("INSERT INTO historico_mensal VALUES (?, 2025, 1, '{}', 0)", (antiga,))
+    historico = app._HistoricoEmpresas(caminho)
+    assert [historico.versao(c) for c in (123, "abc", "007", "123")] == [1, 1, 1, None]
+    with sqlite3.connect(caminho) as conexao:
+        assert sorted(c for (c,) in conexao.execute("SELECT company_id FROM historico_mensal")) == ['"007"', '"abc"', "123"]
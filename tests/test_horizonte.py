@@ -0,0 +1,56 @@
+"""/chat/horizon: ano dos meses de cada resultado e validação de anoInicio/anoFim e do cronograma."""
+import pytest
+
+_HISTORICO = [{"ano": 2025, "mes": m, "receitaBruta": "1000.00"} for m in range(1, 13)]
+
+
+@pytest.mark.parametrize("use_ai", [False, True])
+def test_primeiro_ano_sem_meses_usa_o_ano_do_horizonte(cliente, use_ai):
+    resposta = cliente.post("/chat/horizon", json={"companyId": 1, "year": 2027, "anoInicio": 2027, "anoFim": 2029,
+                                                   "useAiForecast": use_ai, "historicalMonthly": _HISTORICO}).get_json()
+    for ano, resultado in zip(range(2027, 2030), resposta["resultados"]):
+        assert resultado["year"] == ano
+        assert {b["ano"] for b in resultado["baseMensal"]} == {ano}
+
+
+@pytest.mark.parametrize("anos, campo", [
+    ({"anoInicio": True, "anoFim": 3}, "anoInicio"),
+    ({"anoFim": "x"}, "anoFim"),
+    ({"anoInicio": 0}, "anoInicio"),
+])
+def test_anos_invalidos(cliente, anos, campo):
+    resposta = cliente.post("/chat/horizon", json=dict({"companyId": 1, "year": 2027, "historicalMonthly": _HISTORICO}, **anos))
+    assert resposta.status_code == 400
+    assert resposta.get_json()["erros"][0]["campo"] == campo
+
+
+def test_anos_padrao(cliente):
+    resposta = cliente.post("/chat/horizon", json={"companyId": 1, "year": "2027", "anoFim": 2028.0,
+                                                   "historicalMonthly": _HISTORICO}).get_json()
+    assert (resposta["anoInicio"], resposta["anoFim"]) == (2027, 2028)
+
+
+@pytest.mark.parametrize("chave, mensagem", [
+    ("abc", "deve ser um inteiro"),
+    ("2027.5", "deve ser um inteiro"),
+    ("+2028", "deve ser um inteiro"),
+    ("2026", "deve estar entre anoInicio (2027) e anoFim (2029)"),
+    ("2030", "deve estar entre anoInicio (2027) e anoFim (2029)"),
+])
+def test_cronograma_com_ano_invalido(cliente, chave, mensagem):
+    resposta = cliente.post("/chat/horizon", json={"companyId": 1, "year": 2027, "anoFim": 2029, "historicalMonthly": _HISTORICO,
+                                                   "cronograma": {"2028": {"cbsRate": "0.1"}, chave: {"cbsRate": "0.2"}}})
+    assert resposta.status_code == 400
+    assert resposta.get_json()["erros"] == [{"campo": f"cronograma.{chave}", "error": f"cronograma.{chave} {mensagem}."}]
+
+
+def test_cronograma_ano_repetido_e_forma_canonica(cliente):
+    base = {"companyId": 1, "year": 2027, "anoFim": 2029, "historicalMonthly": _HISTORICO}
+    resposta = cliente.post("/chat/horizon", json=dict(base, cronograma={"2028": {}, "02028": {}}))
+    erros = resposta.get_json()["erros"]
+    assert resposta.status_code == 400 and len(erros) == 1 and erros[0]["error"].endswith("repete o ano 2028.")
+    # "02028" vale como 2028
+    canonico = cliente.post("/chat/horizon", json=dict(base, cronograma={"2028": {"cbsRate": "0.2"}})).get_json()
+    com_zero = cliente.post("/chat/horizon", json=dict(base, cronograma={"02028": {"cbsRate": "0.2"}})).get_json()
+    assert com_zero == canonico
+    assert canonico["resultados"][1]["regimes"] != canonico["resultados"][0]["regimes"]
@@ -0,0 +1,85 @@
+"""/chat?mode=ai contra o stub local da API (tools/gemini_stub.py): sucesso, falhas com fallback e cache do prompt."""
+import dataclasses
+import os
+import sys
+import time
+
+import pytest
+
+import app
+
+pytest.importorskip("google.genai")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+
+import gemini_stub
+
+_ENTRADA = {"companyId": "ia", "year": 2026, "targetYearMonthly": [{"ano": 2026, "mes": 1, "receitaBruta": "1000.00"}]}
+
+
+@pytest.fixture
+def stub(config, monkeypatch):
+    # cliente de IA novo, apontando para um stub próprio, com prazos curtos
+    servidor, base_url = gemini_stub.iniciar(seed=0)
+    monkeypatch.setattr(app, "CONFIG", dataclasses.replace(
+        config, api_key="stub", gemini_base_url=base_url, ai_timeout_seconds=0.5, ai_tentativas=2,
+        ai_backoff_seconds=0.01, ai_prazo_seconds=3))
+    monkeypatch.setattr(app, "_cliente_genai", None)
+    monkeypatch.setattr(app, "_cliente_ia", None)
+    monkeypatch.setattr(app, "_cache_ia", app._CacheResultados(16, 3600))
+    yield servidor.estado
+    servidor.shutdown()
+
+
+def _chat_ia(cliente, **campos):
+    return cliente.post("/chat?mode=ai", json=dict(_ENTRADA, **campos))
+
+
+def test_resposta_do_modelo_e_cache(cliente, stub):
+    resposta = _chat_ia(cliente)
+    assert (resposta.status_code, resposta.headers["X-Modo"], resposta.headers["X-Cache"]) == (200, "ia", "MISS")
+    assert resposta.get_json()["metodo"] == "stub:reforma_v2"
+    resposta = _chat_ia(cliente)
+    assert (resposta.headers["X-Modo"], resposta.headers["X-Cache"]) == ("ia", "HIT")
+    assert stub.chamadas["generateContent"] == 1
+
+
+def test_503_cai_no_calculo_do_backend(cliente, stub):
+    stub.falhas = 1.0
+    resposta = _chat_ia(cliente)
+    assert (resposta.status_code, resposta.headers["X-Modo"]) == (200, "fallback")
+    assert resposta.get_data() == cliente.post("/chat", json=_ENTRADA).get_data()
+    assert stub.chamadas["generateContent"] == 2  # AI_TENTATIVAS
+
+
+def test_timeout_cai_no_calculo_do_backend(cliente, stub):
+    stub.atraso = 1.0
+    inicio = time.monotonic()
+    resposta = _chat_ia(cliente)
+    assert resposta.headers["X-Modo"] == "fallback"
+    assert time.monotonic() - inicio < 2.5
+
+
+def test_resposta_fora_do_formato_nao_e_usada_nem_guardada(cliente, stub):
+    stub.resposta = lambda entrada: {"companyId": "ia", "year": 2026, "regimes": []}
+    assert _chat_ia(cliente).headers["X-Modo"] == "fallback"
+    stub.resposta = gemini_stub._resposta_modelo
+    resposta = _chat_ia(cliente)
+    assert (resposta.headers["X-Modo"], resposta.headers["X-Cache"]) == ("ia", "MISS")
+
+
+def test_cached_content_criado_uma_vez(cliente, stub):
+    for i in range(5):
+        assert _chat_ia(cliente, companyId=f"ia{i}").headers["X-Modo"] == "ia"
+    assert stub.chamadas["cachedContents"] == 1
+    assert stub.chamadas["comCachedContent"] == 5
+
+
+def test_criacao_do_cache_travada_nao_bloqueia(cliente, stub):
+    # cachedContents não responde: cada chamada espera no máximo AI_TIMEOUT_SECONDS e segue com o prompt inteiro
+    stub.atraso_cache = 5.0
+    inicio = time.monotonic()
+    assert _chat_ia(cliente).headers["X-Modo"] == "ia"
+    assert _chat_ia(cliente, companyId="ia2").headers["X-Modo"] == "ia"
+    assert time.monotonic() - inicio < 2.0
+    assert stub.chamadas["cachedContents"] == 1
+    assert stub.chamadas["comCachedContent"] == 0
@@ -0,0 +1,52 @@
+"""/jobs: um envio ao pool que falha devolve a vaga e o bloco é tentado de novo."""
+import concurrent.futures
+import dataclasses
+import json
+import os
+
+import app
+
+
+class _PoolQuebrado:
+    def __init__(self, falhas):
+        self.falhas = falhas
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def submit(self, *args):
+        if self.falhas:
+            self.falhas -= 1
+            raise concurrent.futures.BrokenExecutor("pool quebrado")
+        return self.pool.submit(*args)
+
+
+def _job(config, tmp_path, empresas, por_bloco):
+    diretorio = tmp_path / "job"
+    diretorio.mkdir()
+    with open(diretorio / "corpo.ndjson", "w+b") as corpo:
+        corpo.write(b"\n".join(json.dumps({"companyId": i, "year": 2026}).encode() for i in range(empresas)))
+        corpo.seek(0)
+        blocos, total = app._spool_job(str(diretorio), corpo, "ndjson", por_bloco)
+    app._gravar_json_atomico(os.path.join(diretorio, "job.json"), {"total": total, "blocos": blocos})
+    gerenciador = app._GerenciadorJobs(dataclasses.replace(config, jobs_dir=str(tmp_path), jobs_em_voo=1))
+    return gerenciador, str(diretorio)
+
+
+def test_envio_falho_devolve_a_vaga(config, tmp_path):
+    gerenciador, diretorio = _job(config, tmp_path, 6, 2)
+    pool = _PoolQuebrado(falhas=2)
+    gerenciador._executor = lambda quebrado=None: pool
+    gerenciador._executar_blocos("job", diretorio)
+    progresso = app._ler_json(os.path.join(diretorio, "progresso.json"))
+    assert (progresso["status"], progresso["blocosConcluidos"], progresso["sucesso"]) == ("concluido", 3, 6)
+    # a única vaga voltou: sem o release, o terceiro envio ficaria esperando para sempre
+    assert gerenciador._vagas.acquire(blocking=False)
+
+
+def test_envio_sempre_falho_marca_o_bloco(config, tmp_path):
+    gerenciador, diretorio = _job(config, tmp_path, 2, 2)
+    pool = _PoolQuebrado(falhas=config.jobs_tentativas)
+    gerenciador._executor = lambda quebrado=None: pool
+    gerenciador._executar_blocos("job", diretorio)
+    progresso = app._ler_json(os.path.join(diretorio, "progresso.json"))
+    assert (progresso["status"], progresso["blocosFalhos"]) == ("falhou", [0])
+    assert gerenciador._vagas.acquire(blocking=False)
@@ -0,0 +1,57 @@
+"""/chat/batch: cada item igual ao /chat, e erro (validação ou exceção) isolado no próprio item."""
+import random
+
+import pytest
+
+import app
+
+
+def test_item_invalido_com_erros_por_campo(cliente):
+    resposta = cliente.post("/chat/batch", json={"companies": [{"companyId": 123, "year": 2026}, {"companyId": 456}]})
+    corpo = resposta.get_json()
+    assert (corpo["total"], corpo["sucesso"], corpo["falhas"]) == (2, 1, 1)
+    assert corpo["resultados"][1] == {"index": 1, "status": 400, "companyId": 456, "error": "year é obrigatório.",
+                                      "erros": [{"campo": "year", "error": "year é obrigatório."}]}
+
+
+def _empresas(rng, n):
+    return [{"companyId": i, "year": 2026, "cbsRate": rng.choice(["0.12", "0.1", "0.135"]),
+             "targetYearMonthly": [{"ano": 2026, "mes": m, "receitaBruta": f"{rng.uniform(-1e4, 1e7):.2f}",
+                                    "folhaSalarios": f"{rng.uniform(0, 1e6):.2f}",
+                                    "lucroLiquidoContabil": rng.choice([None, f"{rng.uniform(-1e5, 1e6):.2f}"])}
+                                   for m in rng.sample(range(1, 13), rng.randint(0, 12))],
+             "historicalMonthly": [{"ano": 2025, "mes": m, "receitaBruta": f"{rng.uniform(0, 1e6):.2f}"}
+                                   for m in rng.sample(range(1, 13), rng.randint(0, 12))]}
+            for i in range(n)]
+
+
+@pytest.mark.parametrize("engine", ["escalar", "vetorial"])
+def test_item_igual_ao_chat_byte_a_byte(cliente, engine):
+    if engine == "vetorial":
+        pytest.importorskip("numpy")
+    empresas = _empresas(random.Random(11), 60)
+    corpo = cliente.post(f"/chat/batch?engine={engine}", json={"companies": empresas}).get_json()
+    assert corpo["falhas"] == 0
+    for empresa, item in zip(empresas, corpo["resultados"]):
+        assert app._json_bytes(item["resultado"]) == cliente.post("/chat", json=empresa).get_data()
+
+
+@pytest.mark.parametrize("funcao", ["_preparar", "_montar_resposta"])
+def test_excecao_num_item_nao_derruba_o_lote(cliente, monkeypatch, funcao):
+    empresas = _empresas(random.Random(12), 5)
+    original = getattr(app, funcao)
+
+    def quebra(dados, *args):
+        if dados["companyId"] == 2:
+            raise ValueError("falha simulada")
+        return original(dados, *args)
+
+    esperados = [cliente.post("/chat", json=e).get_data() for e in empresas]
+    monkeypatch.setattr(app, funcao, quebra)
+    corpo = cliente.post("/chat/batch", json={"companies": empresas}).get_json()
+    assert (corpo["total"], corpo["sucesso"], corpo["falhas"]) == (5, 4, 1)
+    assert corpo["resultados"][2] == {"index": 2, "companyId": 2, "status": 500,
+                                      "error": "Erro interno do servidor: falha simulada"}
+    for i in (0, 1, 3, 4):
+        assert corpo["resultados"][i]["status"] == 200
+        assert app._json_bytes(corpo["resultados"][i]["resultado"]) == esperados[i]
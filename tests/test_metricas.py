@@ -0,0 +1,90 @@
+"""/metrics (formato texto do Prometheus) e o profiler por amostragem (/metrics/profile)."""
+import dataclasses
+import json
+
+import pytest
+
+import app
+
+_CHAT = {"companyId": "metricas", "year": 2026, "targetYearMonthly": [
+    {"ano": 2026, "mes": m, "receitaBruta": "1000.00"} for m in range(1, 13)]}
+
+
+def _series(cliente):
+    resposta = cliente.get("/metrics")
+    assert resposta.status_code == 200
+    assert resposta.headers["Content-Type"] == "text/plain; version=0.0.4; charset=utf-8"
+    series, tipos = {}, {}
+    for linha in resposta.get_data(as_text=True).splitlines():
+        if linha.startswith("# TYPE "):
+            _, _, nome, tipo = linha.split(" ")
+            tipos[nome] = tipo
+        elif not linha.startswith("# "):
+            serie, valor = linha.rsplit(" ", 1)
+            series[serie] = float(valor)
+    return series, tipos
+
+
+@pytest.fixture
+def profiler(monkeypatch):
+    monkeypatch.setattr(app, "CONFIG", dataclasses.replace(app.CONFIG, profile_token="segredo", profile_intervalo_ms=0.5))
+    monkeypatch.setattr(app, "_perfis", app._CacheResultados(4, 3600))
+
+
+def test_formato_e_contadores(cliente):
+    requisicoes = 'simulador_requisicoes_total{rota="/chat",metodo="POST",status="200"}'
+    antes, _ = _series(cliente)
+    for _ in range(3):
+        assert cliente.post("/chat", json=_CHAT).status_code == 200
+    assert cliente.post("/chat", json={"year": "x"}).status_code == 400
+    depois, tipos = _series(cliente)
+
+    assert depois[requisicoes] - antes.get(requisicoes, 0) == 3
+    erros = 'simulador_requisicoes_total{rota="/chat",metodo="POST",status="400"}'
+    assert depois[erros] - antes.get(erros, 0) == 1
+    assert tipos["simulador_requisicoes_total"] == "counter"
+    assert tipos["simulador_requisicao_segundos"] == "histogram"
+
+    # histograma: buckets acumulados e crescentes, +Inf igual ao _count
+    rotulo = '{rota="/chat"'
+    buckets = [v for s, v in depois.items() if s.startswith("simulador_requisicao_segundos_bucket" + rotulo)]
+    assert buckets == sorted(buckets) and len(buckets) == len(app._BUCKETS_SEGUNDOS) + 1
+    assert buckets[-1] == depois['simulador_requisicao_segundos_count{rota="/chat"}'] >= 4
+    assert depois['simulador_requisicao_segundos_sum{rota="/chat"}'] > 0
+    assert depois['simulador_etapa_segundos_count{etapa="regimes"}'] >= 3
+
+
+def test_rotulos_escapados():
+    assert app._rotulos_texto((("rota", 'a"b\\c\nd'),)) == '{rota="a\\"b\\\\c\\nd"}'
+
+
+def test_profiler_desligado_por_padrao(cliente):
+    assert app.Config().profile_token is None
+    resposta = cliente.post("/chat", json=_CHAT, headers={"X-Profile": ""})
+    assert "X-Profile-Id" not in resposta.headers
+    assert cliente.get("/metrics/profile/qualquer", headers={"X-Profile": ""}).status_code == 403
+
+
+def test_profiler_exige_o_token(cliente, profiler):
+    for cabecalhos in ({}, {"X-Profile": "errado"}):
+        assert "X-Profile-Id" not in cliente.post("/chat", json=_CHAT, headers=cabecalhos).headers
+
+    resposta = cliente.post("/chat", json=_CHAT, headers={"X-Profile": "segredo"})
+    perfil_id = resposta.headers["X-Profile-Id"]
+    resposta.close()
+    assert cliente.get(f"/metrics/profile/{perfil_id}").status_code == 403
+    assert cliente.get(f"/metrics/profile/{perfil_id}", headers={"X-Profile": "errado"}).status_code == 403
+    assert cliente.get(f"/metrics/profile/{perfil_id}", headers={"X-Profile": "segredo"}).status_code == 200
+    assert cliente.get("/metrics/profile/inexistente", headers={"X-Profile": "segredo"}).status_code == 404
+
+
+def test_profiler_amostra_o_corpo_em_streaming(cliente, profiler):
+    # o cálculo do /chat/stream roda enquanto o corpo é enviado, depois do after_request
+    corpo = "\n".join(json.dumps(dict(_CHAT, companyId=i)) for i in range(2000))
+    resposta = cliente.post("/chat/stream", data=corpo,
+                            headers={"X-Profile": "segredo", "Content-Type": "application/x-ndjson"})
+    perfil_id = resposta.headers["X-Profile-Id"]
+    assert len(resposta.get_data().splitlines()) == 2000
+    resposta.close()
+    perfil = cliente.get(f"/metrics/profile/{perfil_id}", headers={"X-Profile": "segredo"}).get_data(as_text=True)
+    assert "_simular_linhas" in perfil
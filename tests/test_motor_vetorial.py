@@ -0,0 +1,76 @@
+"""Motor vetorial (numpy) contra o escalar: mesmos centavos em tudo, e o fallback quando passa de int64."""
+import random
+
+import pytest
+
+import app
+
+np = pytest.importorskip("numpy")
+
+
+def _taxa(rng):
+    den = 10 ** rng.randint(0, 4)
+    return rng.randint(0, 2 * den), den
+
+
+def _agregados(rng):
+    escala = 10 ** rng.randint(0, 12)
+    faturamento = rng.choice([0, rng.randint(-escala, escala), rng.randint(0, escala)])
+    return {
+        "faturamentoTotalAnual": faturamento,
+        "folhaTotalAnual": rng.randint(0, escala),
+        "valorAdicionado": rng.randint(-escala, escala),
+        "lucroTributavel": rng.randint(-escala, escala),
+    }
+
+
+def _escalar(agregados, aliquotas):
+    tributos = app._calcular_regimes(agregados, aliquotas)
+    totais = [t["total"] for t in tributos]
+    return tributos, totais.index(min(totais))
+
+
+def test_igual_ao_escalar_com_aliquotas_por_empresa():
+    rng = random.Random(3)
+    for _ in range(20):
+        agregados = [_agregados(rng) for _ in range(rng.randint(1, 300))]
+        aliquotas = [tuple(_taxa(rng) for _ in range(4)) for _ in agregados]
+        resultado = app._calcular_regimes_vetorial(app._matriz_agregados(agregados), aliquotas)
+        esperado = [_escalar(a, t) for a, t in zip(agregados, aliquotas)]
+        assert app._tributos_do_vetorial(resultado) == [t for t, _ in esperado]
+        assert resultado["recomendado"].tolist() == [r for _, r in esperado]
+
+
+def test_igual_ao_escalar_na_grade():
+    # uma empresa, alíquotas em arrays (como no /chat/sweep, que usa só o total e o recomendado)
+    rng = random.Random(4)
+    for _ in range(50):
+        agregados = _agregados(rng)
+        pontos = [tuple(_taxa(rng) for _ in range(4)) for _ in range(64)]
+        taxas = tuple((np.array([p[j][0] for p in pontos]), np.array([p[j][1] for p in pontos])) for j in range(4))
+        resultado = app._calcular_regimes_vetorial(app._matriz_agregados([agregados]), taxas)
+        esperado = [_escalar(agregados, p) for p in pontos]
+        assert resultado["total"].tolist() == [[t["total"] for t in tributos] for tributos, _ in esperado]
+        assert resultado["aliquota"].tolist() == [[t["aliquota"] for t in tributos] for tributos, _ in esperado]
+        assert resultado["recomendado"].tolist() == [r for _, r in esperado]
+
+
+def test_fora_de_int64_recusado():
+    agregados = {"faturamentoTotalAnual": 10 ** 17, "folhaTotalAnual": 0, "valorAdicionado": 10 ** 17, "lucroTributavel": 0}
+    with pytest.raises(OverflowError):
+        app._calcular_regimes_vetorial(app._matriz_agregados([agregados]), app._parse_aliquotas({}))
+
+
+def test_lote_vetorial_igual_ao_escalar_inclusive_com_overflow(cliente):
+    rng = random.Random(5)
+    empresas = [{"companyId": i, "year": 2026, "cbsRate": f"0.{rng.randint(0, 999):03d}",
+                 "targetYearMonthly": [{"ano": 2026, "mes": m, "receitaBruta": f"{rng.uniform(-1e6, 1e8):.2f}",
+                                        "folhaSalarios": f"{rng.uniform(0, 1e7):.2f}",
+                                        "lucroLiquidoContabil": f"{rng.uniform(-1e6, 1e7):.2f}"}
+                                       for m in rng.sample(range(1, 13), rng.randint(1, 12))]}
+                for i in range(200)]
+    for lote in (empresas, empresas + [{"companyId": "enorme", "year": 2026,
+                                        "targetYearMonthly": [{"ano": 2026, "mes": 1, "receitaBruta": "1e15"}]}]):
+        escalar = cliente.post("/chat/batch", json={"companies": lote}).get_data()
+        vetorial = cliente.post("/chat/batch?engine=vetorial", json={"companies": lote}).get_data()
+        assert vetorial == escalar
@@ -0,0 +1,287 @@
+"""O núcleo em centavos inteiros contra as fórmulas Decimal originais.
+
+As funções *_referencia abaixo são o caminho Decimal do /chat antes do núcleo em centavos (contexto de 28
+dígitos + quantize HALF_UP), mantidas aqui como especificação. Entradas aleatórias com seed fixa: uma
+falha mostra a entrada que divergiu. A única mudança de formato fica em _fmt: centavos inteiros não têm
+zero negativo, então um valor que arredonda para zero sai "0.00" (o caminho Decimal escrevia "-0.00").
+O rateio mensal (impostoTotalMensal) não segue mais o ajuste no último mês: a referência dele é o maior resto
+exato (Fraction) sobre a receita dos 12 meses da base, e a resposta inteira é comparada.
+"""
+import random
+from decimal import ROUND_HALF_UP, Context, Decimal, localcontext
+from fractions import Fraction
+
+import app
+
+_CENTAVO = Decimal(".01")
+_CONTEXTO = Context(prec=28)
+
+
+def _dec(x):
+    if x is None:
+        return Decimal("0.00")
+    try:
+        return Decimal(str(x))
+    except Exception:
+        return Decimal("0.00")
+
+
+def _q(d):
+    return d.quantize(_CENTAVO, rounding=ROUND_HALF_UP)
+
+
+def _fmt_decimal(d):
+    # formatação do caminho Decimal original
+    return f"{_q(d):.2f}"
+
+
+def _fmt(d):
+    # a regra do núcleo em centavos: "-0.00" vira "0.00"; os valores não mudam
+    texto = _fmt_decimal(d)
+    return "0.00" if texto == "-0.00" else texto
+
+
+def _media_referencia(lst, key):
+    vals = []
+    for it in lst:
+        try:
+            vals.append(Decimal(str(it.get(key, "0") or "0")))
+        except Exception:
+            pass
+    return (sum(vals) / len(vals)) if vals else Decimal("0.00")
+
+
+def _mes_referencia(e, ano, m):
+    return {
+        "ano": ano,
+        "mes": m,
+        "receitaBruta": _fmt(_dec(e.get("receitaBruta"))),
+        "folhaSalarios": _fmt(_dec(e.get("folhaSalarios"))),
+        "insumos": _fmt(_dec(e.get("insumos"))),
+        "lucroLiquidoContabil": _fmt(_dec(e.get("lucroLiquidoContabil"))) if e.get("lucroLiquidoContabil") is not None else None,
+    }
+
+
+def _completar_referencia(target, historical):
+    year = target[0]["ano"] if target else (historical[0]["ano"] if historical else None)
+    by_month = {int(m["mes"]): m for m in target}
+    if len(by_month) == 12:
+        return [_mes_referencia(by_month[m], by_month[m].get("ano", year), m) for m in range(1, 13)]
+    fonte = target if target else historical
+    receita, folha, insumos, lucro = (_media_referencia(fonte, k) for k in app.FORECAST_SERIES)
+    meses = []
+    for m in range(1, 13):
+        if m in by_month:
+            meses.append(_mes_referencia(by_month[m], by_month[m].get("ano", year), m))
+        else:
+            meses.append({"ano": year, "mes": m, "receitaBruta": _fmt(receita), "folhaSalarios": _fmt(folha),
+                          "insumos": _fmt(insumos), "lucroLiquidoContabil": _fmt(lucro) if lucro != Decimal("0.00") else None})
+    return meses
+
+
+def _rateio_referencia(total, base):
+    # maior resto sobre |total| em centavos, pesos = receita de cada mês (iguais se a soma for zero);
+    # empate no resto vai para o mês mais cedo e o sinal do total volta no fim
+    centavos = int(total * 100)
+    receitas = [int(Decimal(b["receitaBruta"]) * 100) for b in base]
+    soma = sum(receitas)
+    pesos, soma = (receitas, soma) if soma else ([1] * 12, 12)
+    exatas = [Fraction(abs(centavos) * w, soma) for w in pesos]
+    partes = [e.numerator // e.denominator for e in exatas]
+    for i in sorted(range(12), key=lambda i: (partes[i] - exatas[i], i))[:abs(centavos) - sum(partes)]:
+        partes[i] += 1
+    return [{"mes": m, "valor": _fmt(Decimal(-p if centavos < 0 else p).scaleb(-2))} for m, p in enumerate(partes, start=1)]
+
+
+def _chat_referencia(dados):
+    # corpo do /chat original (modo determinístico, sem previsão), com o rateio mensal pelo maior resto
+    cbs_rate = _dec(dados.get("cbsRate", Decimal("0.12")))
+    ibs_rate = _dec(dados.get("ibsRate", Decimal("0.14")))
+    cpp_rate = _dec(dados.get("cppRate", Decimal("0.20")))
+    share = _dec(dados.get("simplesShare", Decimal("0.70")))
+    base = _completar_referencia(dados.get("targetYearMonthly", []), dados.get("historicalMonthly", []))
+
+    fat = sum(Decimal(b["receitaBruta"]) for b in base)
+    folha = sum(Decimal(b["folhaSalarios"]) for b in base)
+    insumos = sum(Decimal(b["insumos"] or "0.00") for b in base)
+    va = _q(fat * Decimal("0.70")) if insumos == Decimal("0.00") else _q(fat - insumos)
+    lucros = [Decimal(b["lucroLiquidoContabil"]) for b in base if b["lucroLiquidoContabil"] is not None]
+    lucro = sum(lucros, Decimal("0.00")) if lucros else _q(fat * Decimal("0.10"))
+
+    cbs, ibs, cpp = _q(va * cbs_rate), _q(va * ibs_rate), _q(folha * cpp_rate)
+    irpj_real, csll_real = _q(lucro * Decimal("0.15")), _q(lucro * Decimal("0.09"))
+    base_presumida = _q(fat * Decimal("0.32"))
+    irpj_pres, csll_pres = _q(base_presumida * Decimal("0.15")), _q(base_presumida * Decimal("0.09"))
+    base_simples = _q(lucro * Decimal("1.00"))
+    irpj_s, csll_s = _q(base_simples * Decimal("0.15")), _q(base_simples * Decimal("0.09"))
+    cbs_s, ibs_s, cpp_s = _q(cbs * share), _q(ibs * share), _q(cpp * share)
+
+    detalhes = [
+        (cbs_s, ibs_s, irpj_s, csll_s, cpp_s),
+        (cbs, ibs, irpj_pres, csll_pres, cpp),
+        (cbs, ibs, irpj_real, csll_real, cpp),
+    ]
+    observacoes = (
+        f"Simples simplificado: {int(share * 100)}% do CBS/IBS e CPP considerados dentro do DAS (hipótese didática).",
+        "Regime presumido com CBS/IBS integrais e base presumida de 32% para serviços.",
+        "Regime real com CBS/IBS integrais. Lucro tributável = soma dos lucros contábeis mensais ou 10% do faturamento se não informado.",
+    )
+    regimes = []
+    for nome, d, obs in zip(app.REGIMES_NOMES, detalhes, observacoes):
+        total = _q(sum(d))
+        regimes.append({
+            "nome": nome,
+            "impostoTotalAnual": _fmt(total),
+            "aliquotaEfetiva": _fmt((total / fat) if fat > 0 else Decimal("0.00")),
+            "detalhesTributos": dict(zip(("CBS", "IBS", "IRPJ", "CSLL", "CPP"), map(_fmt, d)), IS="0.00"),
+            "impostoTotalMensal": _rateio_referencia(total, base),
+            "observacoes": obs,
+        })
+    return {
+        "companyId": dados.get("companyId"),
+        "year": dados.get("year"),
+        "metodo": app.METODO,
+        "faturamentoTotalAnual": _fmt(fat),
+        "folhaTotalAnual": _fmt(folha),
+        "valorAdicionado": _fmt(va),
+        "baseMensal": base,
+        "regimes": regimes,
+        "recomendado": min(regimes, key=lambda r: Decimal(r["impostoTotalAnual"]))["nome"],
+    }
+
+
+# Geradores
+
+def _valor(rng):
+    tipo = rng.random()
+    if tipo < 0.45:
+        casas = rng.randint(0, 6)
+        n = rng.randint(-10 ** rng.randint(1, 13), 10 ** rng.randint(1, 13))
+        s = str(abs(n)).rjust(casas + 1, "0")
+        s = f"{s[:-casas]}.{s[-casas:]}" if casas else s
+        return ("-" if n < 0 else rng.choice(["", "", "+"])) + s
+    if tipo < 0.55:
+        return rng.randint(-10 ** 9, 10 ** 9)
+    if tipo < 0.65:
+        return rng.uniform(-1e7, 1e7)
+    if tipo < 0.75:
+        return f"{rng.randint(-99999, 99999)}{rng.choice('eE')}{rng.randint(-6, 6)}"
+    if tipo < 0.85:
+        return f"{rng.choice(['-', ''])}0.00{rng.randint(0, 9)}"  # arredonda para zero
+    return None
+
+
+def _taxa(rng):
+    return rng.choice([
+        None, 0, 1, rng.random(), f"{rng.random():.{rng.randint(1, 8)}f}", f"-{rng.random():.3f}",
+        f"{rng.randint(1, 999)}e-3", "0.12", "0.125", "0.7",
+    ])
+
+
+def _mes(rng, ano, mes):
+    entrada = {"ano": ano, "mes": mes}
+    for serie in app.FORECAST_SERIES:
+        if rng.random() < 0.85:
+            entrada[serie] = _valor(rng)
+    return entrada
+
+
+def _empresa(rng, i):
+    ano = 2026
+    meses_alvo = rng.choice([0, 1, rng.randint(2, 11), 12, 12])
+    dados = {
+        "companyId": i,
+        "year": ano,
+        "targetYearMonthly": [_mes(rng, ano, rng.randint(1, 12) if rng.random() < 0.1 else m)
+                              for m in rng.sample(range(1, 13), meses_alvo)],
+        "historicalMonthly": [_mes(rng, ano - 1 - k // 12, k % 12 + 1) for k in range(rng.choice([0, 3, 12]))],
+    }
+    for nome in app._TAXAS_ENTRADA:
+        if rng.random() < 0.5:
+            dados[nome] = _taxa(rng)
+    return dados
+
+
+# Propriedades
+
+def test_racional_igual_ao_decimal():
+    rng = random.Random(2)
+    for _ in range(20000):
+        x = _valor(rng)
+        if x is None:
+            continue
+        esperado = Decimal(str(x))
+        n, k = app._racional(x)
+        assert Decimal(f"{n}E{-k}") == esperado, x
+        assert k == max(0, -esperado.as_tuple().exponent), x
+    assert app._racional("abc") is None
+    assert app._racional((123, 2)) == (123, 2)
+
+
+def test_mul_taxa_igual_ao_quantize():
+    rng = random.Random(3)
+    with localcontext(_CONTEXTO):
+        for _ in range(20000):
+            centavos = rng.randint(-10 ** rng.randint(1, 18), 10 ** rng.randint(1, 18))
+            taxa = str(_dec(_taxa(rng)))
+            esperado = _q(Decimal(centavos).scaleb(-2) * Decimal(taxa))
+            assert app._mul_taxa(centavos, app._taxa(taxa)) == int(esperado * 100), (centavos, taxa)
+
+
+def test_div_sig_igual_a_divisao_decimal():
+    rng = random.Random(4)
+    with localcontext(_CONTEXTO):
+        for _ in range(20000):
+            n = rng.randint(-10 ** rng.randint(1, 40), 10 ** rng.randint(1, 40))
+            d = rng.choice([-1, 1]) * rng.randint(1, 10 ** rng.randint(1, 30))
+            c, e = app._div_sig(n, d)
+            esperado = Decimal(n) / Decimal(d)
+            assert Decimal(c).scaleb(e) == esperado, (n, d)
+            if esperado.adjusted() < 26:  # acima disso o quantize do caminho Decimal estoura a precisão
+                assert app._centavos_de(c, e) == int(_q(esperado) * 100), (n, d)
+
+
+def test_media_centavos_igual_a_media_decimal():
+    rng = random.Random(5)
+    with localcontext(_CONTEXTO):
+        for _ in range(5000):
+            lst = [{"v": _valor(rng)} if rng.random() < 0.9 else {} for _ in range(rng.randint(0, 15))]
+            if rng.random() < 0.1:
+                lst.append({"v": "abc"})
+            if rng.random() < 0.1:
+                # somas parciais além de 28 dígitos que se cancelam: passa pelo caminho Decimal
+                grande = rng.randint(1, 9) * 10 ** 27
+                lst += [{"v": grande}, {"v": grande}, {"v": -grande}, {"v": -grande}]
+            esperado = _media_referencia(lst, "v")
+            centavos, nao_nula = app._media_centavos(lst, "v")
+            assert app._fmt_centavos(centavos) == _fmt(esperado), lst
+            assert nao_nula == (esperado != Decimal("0.00")), lst
+
+
+def test_chat_igual_ao_caminho_decimal(cliente):
+    rng = random.Random(6)
+    for i in range(1500):
+        dados = _empresa(rng, i)
+        resposta = cliente.post("/chat", json=dados)
+        assert resposta.status_code == 200, (dados, resposta.get_json())
+        obtido = resposta.get_json()
+        with localcontext(_CONTEXTO):
+            esperado = _chat_referencia(dados)
+        assert obtido == esperado, dados
+        for regime in obtido["regimes"]:
+            assert sum(Decimal(m["valor"]) for m in regime["impostoTotalMensal"]) == Decimal(regime["impostoTotalAnual"])
+
+
+def test_zero_negativo_sai_sem_sinal(cliente):
+    # única diferença intencional em relação ao caminho Decimal, em todo campo que arredonda para zero
+    for valor in ("-0.004", "-0", "-0.0", -0.0):
+        assert (_fmt_decimal(_dec(valor)), _fmt(_dec(valor))) == ("-0.00", "0.00")
+        assert app._fmt_centavos(app._centavos(valor)) == "0.00"
+    dados = {"companyId": 1, "year": 2026, "cbsRate": "0", "targetYearMonthly": [
+        {"ano": 2026, "mes": m, "receitaBruta": "-0.004", "insumos": "0.01", "lucroLiquidoContabil": "-0.001"}
+        for m in range(1, 13)]}
+    obtido = cliente.post("/chat", json=dados).get_json()
+    assert obtido["baseMensal"][0]["receitaBruta"] == obtido["regimes"][2]["detalhesTributos"]["CBS"] == "0.00"
+    with localcontext(_CONTEXTO):
+        assert _fmt_decimal(-_q(Decimal("0.12")) * 0) == "-0.00"
+        assert obtido == _chat_referencia(dados)
@@ -0,0 +1,64 @@
+"""Previsão local (useAiForecast): teto do crescimento e tendência amortecida depois do histórico."""
+import dataclasses
+import random
+from decimal import Decimal
+
+import pytest
+
+import app
+
+pytest.importorskip("numpy")
+
+
+def _receitas(resposta):
+    return [Decimal(b["receitaBruta"]) for b in resposta["baseMensal"]]
+
+
+def test_crescimento_forte_nao_explode(cliente):
+    # 6 meses com +20% ao mês terminando em jun/2026 em R$ 29.859; projeção para 2027
+    historico = [{"ano": 2026, "mes": m, "receitaBruta": f"{29859 / 1.2 ** (6 - m):.2f}"} for m in range(1, 7)]
+    resposta = cliente.post("/chat", json={"companyId": "cresce", "year": 2027, "useAiForecast": True,
+                                           "historicalMonthly": historico}).get_json()
+    teto = Decimal(29859) * Decimal(str((1 + app.CONFIG.forecast_max_crescimento) ** 10))
+    assert max(_receitas(resposta)) < teto
+
+
+def test_historico_ruidoso_nao_explode(cliente):
+    rng = random.Random(1)
+    for i in range(50):
+        historico = [{"ano": 2025, "mes": m, "receitaBruta": f"{50000 * rng.uniform(0.5, 1.5):.2f}"} for m in range(8, 13)]
+        resposta = cliente.post("/chat", json={"companyId": f"ruido{i}", "year": 2028, "useAiForecast": True,
+                                               "historicalMonthly": historico}).get_json()
+        assert max(_receitas(resposta)) < 2 * 75000, historico
+
+
+def test_tendencia_amortecida():
+    passos = app._passos_amortecidos([-3, 0, 1, 2, 12, 120]).tolist()
+    phi = app.CONFIG.forecast_amortecimento
+    assert passos[:4] == pytest.approx([-3, 0, phi, phi + phi ** 2])
+    assert passos[4] < passos[5] < phi / (1 - phi)
+
+
+def test_horizonte_desacelera(cliente):
+    historico = [{"ano": 2025, "mes": m, "receitaBruta": f"{10000 * 1.04 ** m:.2f}"} for m in range(1, 13)]
+    resposta = cliente.post("/chat/horizon", json={"companyId": "hz", "year": 2026, "anoInicio": 2026, "anoFim": 2030,
+                                                   "useAiForecast": True, "historicalMonthly": historico}).get_json()
+    totais = [Decimal(r["faturamentoTotalAnual"]) for r in resposta["resultados"]]
+    crescimentos = [b / a for a, b in zip(totais, totais[1:])]
+    assert all(c >= 1 for c in crescimentos)
+    assert crescimentos == sorted(crescimentos, reverse=True)
+
+
+def test_config_da_previsao_muda_o_etag(cliente, monkeypatch):
+    dados = {"companyId": "etag", "year": 2027, "useAiForecast": True,
+             "historicalMonthly": [{"ano": 2026, "mes": m, "receitaBruta": f"{1000 * 1.03 ** m:.2f}"} for m in range(1, 13)]}
+    sem_previsao = dict(dados, useAiForecast=False)
+    chave_sem_previsao = app._chave_resultado(sem_previsao, app._parse_aliquotas(sem_previsao))
+    etag = cliente.post("/chat", json=dados).headers["ETag"]
+    assert cliente.post("/chat", json=dados, headers={"If-None-Match": etag}).status_code == 304
+
+    monkeypatch.setattr(app, "CONFIG", dataclasses.replace(app.CONFIG, forecast_amortecimento=0.5))
+    resposta = cliente.post("/chat", json=dados, headers={"If-None-Match": etag})
+    assert resposta.status_code == 200 and resposta.headers["ETag"] != etag
+    # sem previsão local os FORECAST_* não entram na chave
+    assert app._chave_resultado(sem_previsao, app._parse_aliquotas(sem_previsao)) == chave_sem_previsao
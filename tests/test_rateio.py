@@ -0,0 +1,74 @@
+"""Rateio mensal pelo maior resto (_cotas_mensais / _ratear / _distribute_monthly)."""
+import random
+from fractions import Fraction
+
+import app
+
+
+def _referencia(total, faturamentos):
+    # partes exatas (Fraction) e o maior resto sobre o valor absoluto; o sinal volta no fim
+    soma = sum(faturamentos)
+    pesos = [1] * len(faturamentos) if soma == 0 else faturamentos
+    soma = soma or len(faturamentos)
+    exatas = [Fraction(abs(total) * w, soma) for w in pesos]
+    partes = [e.numerator // e.denominator for e in exatas]
+    ordem = sorted(range(len(exatas)), key=lambda i: (-(exatas[i] - partes[i]), i))
+    for i in ordem[:abs(total) - sum(partes)]:
+        partes[i] += 1
+    return [(m, -p if total < 0 else p) for m, p in enumerate(partes, start=1)]
+
+
+def _faturamentos(rng):
+    tipo = rng.random()
+    if tipo < 0.2:
+        return [0] * 12
+    if tipo < 0.4:
+        return [-rng.randint(0, 10 ** 8) for _ in range(12)]
+    if tipo < 0.6:
+        return [rng.randint(-10 ** 8, 10 ** 8) for _ in range(12)]
+    return [rng.randint(0, 10 ** rng.randint(1, 10)) for _ in range(12)]
+
+
+def test_igual_a_referencia_exata():
+    rng = random.Random(9)
+    for _ in range(5000):
+        faturamentos = _faturamentos(rng)
+        total = rng.randint(-10 ** rng.randint(1, 12), 10 ** rng.randint(1, 12))
+        mensal = app._distribute_monthly(total, faturamentos)
+        assert mensal == _referencia(total, faturamentos), (total, faturamentos)
+        assert sum(v for _, v in mensal) == total
+
+
+def test_total_negativo_e_espelho_do_positivo():
+    rng = random.Random(10)
+    for _ in range(2000):
+        faturamentos = _faturamentos(rng)
+        total = rng.randint(0, 10 ** 9)
+        positivo = app._distribute_monthly(total, faturamentos)
+        negativo = app._distribute_monthly(-total, faturamentos)
+        assert negativo == [(m, -v) for m, v in positivo]
+
+
+def test_faturamento_zero_divide_igual_centavo_extra_nos_primeiros_meses():
+    assert [v for _, v in app._distribute_monthly(100, [0] * 12)] == [9] * 4 + [8] * 8
+    assert [v for _, v in app._distribute_monthly(-100, [0] * 12)] == [-9] * 4 + [-8] * 8
+    assert [v for _, v in app._distribute_monthly(0, [0] * 12)] == [0] * 12
+
+
+def test_faturamento_negativo_usa_pesos_com_sinal_invertido():
+    faturamentos = [100, 200, 300, 400, 0, 0, 0, 0, 0, 0, 0, 1]
+    for total in (1000, -1000, 7, -7):
+        assert app._distribute_monthly(total, [-f for f in faturamentos]) == app._distribute_monthly(total, faturamentos)
+    assert app._cotas_mensais([-1, -3]) == ([1, 3], 4)
+
+
+def test_chat_com_imposto_negativo(cliente):
+    # prejuízo grande: IRPJ/CSLL do Simples e do Real negativos, com o faturamento anual zero
+    dados = {"companyId": 1, "year": 2026, "targetYearMonthly": [
+        {"ano": 2026, "mes": m, "receitaBruta": "0", "lucroLiquidoContabil": "-1000.01"} for m in range(1, 13)]}
+    resposta = cliente.post("/chat", json=dados).get_json()
+    for regime in resposta["regimes"]:
+        total = round(float(regime["impostoTotalAnual"]) * 100)
+        valores = [round(float(m["valor"]) * 100) for m in regime["impostoTotalMensal"]]
+        assert valores == [v for _, v in _referencia(total, [0] * 12)]
+        assert valores == sorted(valores), "centavo extra (em módulo) nos primeiros meses"
@@ -0,0 +1,65 @@
+"""Leitura de NDJSON com teto por linha: /chat/stream, CLI (mmap) e spool do /jobs."""
+import io
+import json
+import mmap
+import os
+import random
+
+import pytest
+
+import app
+
+
+class _Leitura(io.BytesIO):
+    # registra o maior pedaço devolvido por readline
+    maior = 0
+
+    def readline(self, limite=-1):
+        linha = super().readline(limite)
+        self.maior = max(self.maior, len(linha))
+        return linha
+
+
+def _empresa(i):
+    return json.dumps({"companyId": i, "year": 2026, "targetYearMonthly": [{"ano": 2026, "mes": 1, "receitaBruta": "100.00"}]}).encode()
+
+
+def test_linha_grande_sai_cortada_sem_ler_inteira():
+    corpo = _Leitura(b"  ab  \n\n" + b"x" * (5 << 20) + b"\ncd\n" + b"y" * 11 + b"\n" + b"z" * 11)
+    assert list(app._linhas_ndjson(corpo, 10)) == [b"ab", b"x" * 11, b"cd", b"y" * 11, b"z" * 11]
+    assert corpo.maior <= app._STREAM_DESCARTE
+
+
+def test_leitor_mmap_igual_ao_arquivo(tmp_path):
+    rng = random.Random(15)
+    for _ in range(200):
+        conteudo = b"".join(rng.choice([b"\n", b" ", b"a", b"bb"]) * rng.randint(0, 30) for _ in range(rng.randint(1, 20)))
+        caminho = tmp_path / "entrada.ndjson"
+        caminho.write_bytes(conteudo)
+        limite = rng.randint(1, 40)
+        with open(caminho, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+            assert list(app._linhas_ndjson(app._LeitorMmap(mapa), limite)) == list(app._linhas_ndjson(io.BytesIO(conteudo), limite))
+
+
+def test_stream_responde_413_e_segue(cliente):
+    corpo = b"\n".join([_empresa(0), b" " + b"x" * (app.CONFIG.max_corpo_bytes + 5), _empresa(2)])
+    resposta = cliente.post("/chat/stream", data=corpo, content_type="application/x-ndjson")
+    linhas = [json.loads(linha) for linha in resposta.get_data().splitlines()]
+    assert [(r["index"], r["status"]) for r in linhas] == [(0, 200), (1, 413), (2, 200)]
+
+
+def test_spool_do_job_grava_so_o_comeco(tmp_path):
+    limite = app.CONFIG.max_corpo_bytes
+    corpo = io.BytesIO(b"\n".join([_empresa(0), b"x" * (limite * 3), _empresa(2)]))
+    blocos, total = app._spool_job(str(tmp_path), corpo, "ndjson", 10)
+    assert total == 3
+    assert os.path.getsize(tmp_path / "entrada.ndjson") < limite + 1000
+    app._processar_bloco_job(str(tmp_path), 0, blocos[0])
+    resultados = [json.loads(linha) for linha in (tmp_path / "bloco-000000.ndjson").read_bytes().splitlines()]
+    assert [r["status"] for r in resultados] == [200, 413, 200]
+
+
+def test_spool_csv_recusa_linha_grande(tmp_path):
+    corpo = io.BytesIO(b"companyId,year\n1," + b"9" * (app.CONFIG.max_corpo_bytes + 1) + b"\n")
+    with pytest.raises(ValueError, match="CSV linha 2"):
+        app._spool_job(str(tmp_path), corpo, "csv", 10)
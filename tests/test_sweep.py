@@ -0,0 +1,29 @@
+"""Validação da grade do /chat/sweep: cada valor passa pelo mesmo validador das alíquotas."""
+import pytest
+
+_ENTRADA = {"companyId": 1, "year": 2026, "targetYearMonthly": [{"ano": 2026, "mes": 1, "receitaBruta": "1000.00"}]}
+
+
+@pytest.mark.parametrize("grade, campo", [
+    ({"cbsRate": ["1e200000"]}, "grade.cbsRate[0]"),
+    ({"cbsRate": ["0.1", "x"]}, "grade.cbsRate[1]"),
+    ({"ibsRate": [True]}, "grade.ibsRate[0]"),
+    ({"cbsRate": {"inicio": "1e200000", "fim": "1", "passo": "0.1"}}, "grade.cbsRate.inicio"),
+    ({"cbsRate": {"inicio": "0.1", "fim": "0.2"}}, "grade.cbsRate.passo"),
+    ({"cbsRate": {"inicio": "0.2", "fim": "0.1", "passo": "0.1"}}, "grade.cbsRate"),
+    ({"cbsRate": {"inicio": "0", "fim": "1e90", "passo": "1e-90"}}, "grade.cbsRate"),
+    ({"cppRate": []}, "grade.cppRate"),
+])
+def test_grade_invalida_erro_por_campo(cliente, grade, campo):
+    resposta = cliente.post("/chat/sweep", json=dict(_ENTRADA, grade=grade))
+    assert resposta.status_code == 400
+    assert resposta.get_json()["erros"][0]["campo"] == campo
+
+
+def test_grade_valida(cliente):
+    grade = {"cbsRate": ["0.1", 0.2, "1e-2"], "ibsRate": {"inicio": "0.1", "fim": "0.12", "passo": "0.01"}}
+    resposta = cliente.post("/chat/sweep", json=dict(_ENTRADA, grade=grade))
+    assert resposta.status_code == 200
+    linhas = resposta.get_json()["linhas"]
+    assert len(linhas) == 9
+    assert [linha[0] for linha in linhas[::3]] == ["0.1", "0.2", "0.01"]
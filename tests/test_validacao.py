@@ -0,0 +1,44 @@
+"""Validador único da entrada: inteiros (year, ano, mes) só com dígitos ASCII e sinal opcional."""
+import pytest
+
+import app
+
+_MESES = [{"ano": 2026, "mes": m, "receitaBruta": "1000.00"} for m in range(1, 13)]
+
+
+@pytest.mark.parametrize("valor, esperado", [(7, 7), (7.0, 7), ("7", 7), ("007", 7), ("-7", -7)])
+def test_inteiro_aceito(valor, esperado):
+    assert app._inteiro(-10, 10)(valor) == esperado
+
+
+@pytest.mark.parametrize("valor", ["1_2", " 12 ", "+12", "12\n", "١٢", "", "-", "1.0", "0x1", 1.5, True, None, [1]])
+def test_inteiro_recusado(valor):
+    with pytest.raises(ValueError, match="deve ser um inteiro"):
+        app._inteiro(-100, 100)(valor)
+
+
+def test_inteiro_fora_da_faixa():
+    with pytest.raises(ValueError, match="deve estar entre 1 e 12"):
+        app._inteiro(1, 12)("13")
+
+
+@pytest.mark.parametrize("year", ["2_026", " 2026", "+2026", "2026 "])
+def test_year_recusado_no_chat(cliente, year):
+    resposta = cliente.post("/chat", json={"companyId": 1, "year": year, "targetYearMonthly": _MESES})
+    assert resposta.status_code == 400
+    assert resposta.get_json()["erros"] == [{"campo": "year", "error": "year deve ser um inteiro."}]
+
+
+@pytest.mark.parametrize("campo, valor", [("ano", "2_026"), ("mes", " 3"), ("mes", "+3")])
+def test_mes_recusado_no_chat(cliente, campo, valor):
+    meses = [dict(_MESES[0], **{campo: valor})] + _MESES[1:]
+    resposta = cliente.post("/chat", json={"companyId": 1, "year": 2026, "targetYearMonthly": meses})
+    assert resposta.status_code == 400
+    assert resposta.get_json()["erros"][0]["campo"] == f"targetYearMonthly[0].{campo}"
+
+
+def test_string_de_digitos_aceita_no_chat(cliente):
+    meses = [dict(m, ano="2026", mes=str(m["mes"])) for m in _MESES]
+    resposta = cliente.post("/chat", json={"companyId": 1, "year": "2026", "targetYearMonthly": meses})
+    assert resposta.status_code == 200
+    assert resposta.get_data() == cliente.post("/chat", json={"companyId": 1, "year": "2026", "targetYearMonthly": _MESES}).get_data()
@@ -0,0 +1,164 @@
+"""Servidor local que imita a API do Gemini usada pelo app (generateContent e cachedContents).
+
+Serve para testar /chat?mode=ai sem chave nem rede:
+
+    python tools/gemini_stub.py --porta 8089 --atraso 0.2 --falhas 0.1
+    GEMINI_BASE_URL=http://127.0.0.1:8089 CHAVE_API_GEMINI=stub python app.py
+
+A resposta do modelo é um JSON no formato exigido pelo prompt (valores zerados), montado a partir da
+entrada recebida. --atraso simula a latência do modelo, --atraso-cache a da criação do cachedContent e
+--falhas a fração de chamadas que devolvem 503 (para exercitar retry e fallback). Nos testes,
+estado.resposta pode ser trocada para devolver outro JSON.
+"""
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class EstadoStub:
+    def __init__(self, atraso=0.0, falhas=0.0, seed=None, atraso_cache=0.0):
+        self.atraso = atraso
+        self.atraso_cache = atraso_cache
+        self.falhas = falhas
+        self.resposta = _resposta_modelo
+        self.random = random.Random(seed)
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.chamadas = {"generateContent": 0, "cachedContents": 0, "comCachedContent": 0}
+        self.caches = {}
+
+    def contar(self, tipo):
+        with self.lock:
+            self.chamadas[tipo] += 1
+            return self.random.random() < self.falhas
+
+
+def _texto_entrada(corpo):
+    for conteudo in corpo.get("contents") or []:
+        for parte in conteudo.get("parts") or []:
+            if "text" in parte:
+                return parte["text"]
+    return "{}"
+
+
+REGIMES = ("Simples Nacional - Pós-Reforma", "Lucro Presumido - Pós-Reforma", "Lucro Real - Pós-Reforma")
+
+
+def _resposta_modelo(entrada):
+    try:
+        dados = json.loads(entrada)
+    except ValueError:
+        dados = {}
+    zero = "0.00"
+    return {
+        "companyId": dados.get("companyId"),
+        "year": dados.get("year"),
+        "metodo": "stub:reforma_v2",
+        "faturamentoTotalAnual": zero,
+        "folhaTotalAnual": zero,
+        "valorAdicionado": zero,
+        "baseMensal": [{"ano": dados.get("year"), "mes": m, "receitaBruta": zero} for m in range(1, 13)],
+        "regimes": [{
+            "nome": nome,
+            "impostoTotalAnual": zero,
+            "aliquotaEfetiva": zero,
+            "detalhesTributos": {t: zero for t in ("CBS", "IBS", "IRPJ", "CSLL", "CPP", "IS")},
+            "impostoTotalMensal": [{"mes": m, "valor": zero} for m in range(1, 13)],
+            "observacoes": "",
+        } for nome in REGIMES],
+        "recomendado": REGIMES[0]
+    }
+
+
+def criar_handler(estado):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, status, corpo):
+            dados = json.dumps(corpo).encode("utf-8")
+            try:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(dados)))
+                self.end_headers()
+                self.wfile.write(dados)
+            except (BrokenPipeError, ConnectionResetError):
+                # o app desistiu da chamada (timeout); nada a responder
+                pass
+
+        def do_POST(self):
+            tamanho = int(self.headers.get("Content-Length") or 0)
+            corpo = json.loads(self.rfile.read(tamanho) or b"{}")
+            caminho = self.path.split("?", 1)[0]
+
+            if caminho.endswith("/cachedContents"):
+                falhar = estado.contar("cachedContents")
+                if estado.atraso_cache:
+                    time.sleep(estado.atraso_cache)
+                if falhar:
+                    return self._json(503, {"error": {"code": 503, "message": "stub: falha simulada", "status": "UNAVAILABLE"}})
+                nome = f"cachedContents/stub-{next(estado.ids)}"
+                estado.caches[nome] = corpo
+                return self._json(200, {"name": nome, "model": corpo.get("model"), "displayName": corpo.get("displayName", "")})
+
+            if caminho.endswith(":generateContent"):
+                falhar = estado.contar("generateContent")
+                if corpo.get("cachedContent") in estado.caches:
+                    estado.contar("comCachedContent")
+                if estado.atraso:
+                    time.sleep(estado.atraso)
+                if falhar:
+                    return self._json(503, {"error": {"code": 503, "message": "stub: falha simulada", "status": "UNAVAILABLE"}})
+                texto = json.dumps(estado.resposta(_texto_entrada(corpo)), ensure_ascii=False)
+                return self._json(200, {
+                    "candidates": [{"content": {"role": "model", "parts": [{"text": texto}]}, "finishReason": "STOP"}],
+                    "usageMetadata": {"promptTokenCount": 0, "candidatesTokenCount": 0, "totalTokenCount": 0}
+                })
+
+            self._json(404, {"error": {"code": 404, "message": f"stub: rota desconhecida {caminho}", "status": "NOT_FOUND"}})
+
+        def do_GET(self):
+            if self.path.split("?", 1)[0] == "/stats":
+                with estado.lock:
+                    return self._json(200, dict(estado.chamadas))
+            self._json(404, {"error": {"code": 404, "message": "stub: rota desconhecida", "status": "NOT_FOUND"}})
+
+    return Handler
+
+
+def iniciar(host="127.0.0.1", porta=0, atraso=0.0, falhas=0.0, seed=None, atraso_cache=0.0):
+    """Sobe o stub numa thread de fundo; retorna (servidor, base_url)."""
+    estado = EstadoStub(atraso, falhas, seed, atraso_cache)
+    servidor = ThreadingHTTPServer((host, porta), criar_handler(estado))
+    servidor.daemon_threads = True
+    servidor.estado = estado
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://{host}:{servidor.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8089)
+    parser.add_argument("--atraso", type=float, default=0.0, help="latência simulada por chamada (s)")
+    parser.add_argument("--atraso-cache", type=float, default=0.0, help="latência simulada na criação do cachedContent (s)")
+    parser.add_argument("--falhas", type=float, default=0.0, help="fração de chamadas que devolvem 503")
+    args = parser.parse_args()
+    servidor, base_url = iniciar(args.host, args.porta, args.atraso, args.falhas, atraso_cache=args.atraso_cache)
+    print(f"Stub do Gemini em {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()